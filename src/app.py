@@ -2,22 +2,42 @@
 Main Streamlit application for Rice Disease Prediction
 """
 import streamlit as st
-import pandas as pd
 import time
 import logging
-from PIL import Image
+import atexit
+import threading
 from typing import Optional
 
-# Import custom modules
-from models.resnet_model import RiceDiseasePredictor
+# Import custom modules. Modules that load torch (models.registry, models.resnet_model,
+# models.worker_pool, utils.device_utils) are imported where they are used, so pages render
+# while the model loads in the background; pandas is only imported by the pages with tables.
+from models.postprocessing import PredictionResult, postprocess, load_temperature
+from models.batching import MicroBatcher
 from services.treatment_service import TreatmentService
-from utils.device_utils import get_device
-from utils.image_utils import preprocess_image, validate_image, display_image_info
+from services.prediction_cache import PredictionCache
+from services.inference_client import InferenceClient
+from services.upload_archive import UploadArchive
+from utils.metrics import get_metrics
+from utils.assets import AssetCache
+from utils.image_utils import open_image, decode_image, validate_image, display_image_info, enhance_image
 from config.settings import (
     CLASS_NAMES, 
+    RUNTIME_CONFIG,
+    BATCH_CONFIG,
+    CACHE_CONFIG,
+    ARCHIVE_CONFIG,
+    SERVER_CONFIG,
+    WORKER_CONFIG,
+    PREDICTION_CONFIG,
+    TREATMENT_CONFIG,
     STREAMLIT_CONFIG, 
     IMAGE_CONFIG,
-    LOGGING_CONFIG
+    LOGGING_CONFIG,
+    ASSET_CONFIG,
+    PATHS,
+    ensure_directories,
+    model_options,
+    worker_pool_options
 )
 
 # Configure logging
@@ -27,20 +47,96 @@ logger = logging.getLogger(__name__)
 # Configure Streamlit page
 st.set_page_config(**STREAMLIT_CONFIG)
 
+@st.cache_resource
+def get_treatment_service() -> TreatmentService:
+    """Get the treatment service shared by every session"""
+    return TreatmentService(**TREATMENT_CONFIG)
+
+@st.cache_resource
+def get_asset_cache() -> AssetCache:
+    """Get the page images shared by every session, read or resized once per process"""
+    return AssetCache(PATHS['static_images'], ASSET_CONFIG['build_dir'])
+
+def show_image(name: str, width: int, caption: Optional[str] = None):
+    """Show a static/images file at its display-size variant instead of the full-size original"""
+    assets = get_asset_cache()
+    if ASSET_CONFIG['public_url']:
+        # Served by nginx with long-lived cache headers; nothing goes over the websocket
+        html = assets.picture_html(name, width, ASSET_CONFIG['public_url'], alt=caption or '')
+        if html is not None:
+            st.markdown(html, unsafe_allow_html=True)
+            if caption:
+                st.caption(caption)
+            return
+    # JPEG bytes at display width pass through st.image without being decoded and re-encoded
+    st.image(assets.get(name, width).data, caption=caption, width=width, output_format='JPEG')
+
+@st.cache_resource
+def get_batcher(_predictor) -> MicroBatcher:
+    """Get the micro-batcher that merges predictions from concurrent sessions"""
+    return MicroBatcher(
+        _predictor,
+        max_batch_size=BATCH_CONFIG['max_batch_size'],
+        max_wait_ms=BATCH_CONFIG['max_wait_ms'],
+        method='predict_logits',
+        on_batch=get_metrics().record_batch,
+        on_timings=get_metrics().record_timings,
+        # Keep every worker process busy instead of waiting for one batch at a time
+        max_in_flight=max(1, WORKER_CONFIG['num_workers'])
+    ).start()
+
+@st.cache_resource
+def get_worker_pool():
+    """Get the process pool that runs inference outside the Streamlit script runner"""
+    from models.worker_pool import InferenceWorkerPool
+    pool = InferenceWorkerPool(**worker_pool_options())
+    pool.warm_up()
+    return pool
+
+@st.cache_resource
+def get_temperature() -> float:
+    """Get the softmax temperature fitted offline, or 1.0 if none has been fitted"""
+    return load_temperature(PREDICTION_CONFIG['temperature_path'])
+
+@st.cache_resource
+def get_prediction_cache() -> PredictionCache:
+    """Get the prediction cache shared by every session"""
+    return PredictionCache(**CACHE_CONFIG)
+
+@st.cache_resource
+def get_upload_archive() -> UploadArchive:
+    """Get the background writer that archives uploads and their predictions"""
+    archive = UploadArchive(
+        ARCHIVE_CONFIG['root'],
+        max_queue=ARCHIVE_CONFIG['max_queue'],
+        roll_up_seconds=ARCHIVE_CONFIG['roll_up_seconds'],
+        on_event=lambda result: get_metrics().inc('rice_archive_uploads_total', result=result)
+    ).start()
+    atexit.register(archive.close)
+    return archive
+
 class RiceDiseaseApp:
     """Main application class for Rice Disease Prediction"""
     
     def __init__(self):
-        self.device = get_device()
         self.predictor = None
-        self.treatment_service = TreatmentService()
-        self._load_model()
+        self.client = None
+        self.treatment_service = get_treatment_service()
+        if SERVER_CONFIG['url']:
+            # Thin-client mode: the inference service owns the model
+            self.client = InferenceClient(SERVER_CONFIG['url'])
     
     def _load_model(self):
-        """Load the prediction model"""
+        """Get the prediction model from the process-wide registry, once the background warm-up is done"""
         try:
-            self.predictor = RiceDiseasePredictor(device=self.device)
-            logger.info("Model loaded successfully")
+            with st.spinner("Loading the prediction model..."):
+                start_warm_up().join()
+                if WORKER_CONFIG['num_workers'] > 0:
+                    self.predictor = get_worker_pool()
+                else:
+                    from models.registry import get_registry
+                    from utils.device_utils import get_device
+                    self.predictor = get_registry().get_predictor(**get_model_options(get_device()))
         except Exception as e:
             logger.error(f"Error loading model: {e}")
             st.error("Error loading the prediction model. Please check the model file.")
@@ -52,8 +148,7 @@ class RiceDiseaseApp:
         
         # Display main image
         try:
-            image_path = 'static/images/4.png'
-            st.image(image_path, width=850)
+            show_image('4.png', width=850)
         except FileNotFoundError:
             st.info("Main image not found. Please ensure images are in the static/images directory.")
         
@@ -77,8 +172,7 @@ class RiceDiseaseApp:
         
         # Display prediction process image
         try:
-            img_path = 'static/images/predict.png'
-            st.image(img_path, caption="Prediction Process for Rice Disease", width=800)
+            show_image('predict.png', width=800, caption="Prediction Process for Rice Disease")
         except FileNotFoundError:
             st.info("Prediction process image not found.")
         
@@ -93,8 +187,7 @@ class RiceDiseaseApp:
         
         # Display disease types image
         try:
-            img_path = 'static/images/Types-of-rice-leaf-disease-RLD.png'
-            st.image(img_path, width=800)
+            show_image('Types-of-rice-leaf-disease-RLD.png', width=800)
         except FileNotFoundError:
             st.info("Disease types image not found.")
         
@@ -114,8 +207,7 @@ class RiceDiseaseApp:
         
         # Display about image
         try:
-            img_path = 'static/images/3.png'
-            st.image(img_path, width=800)
+            show_image('3.png', width=800)
         except FileNotFoundError:
             st.info("About image not found.")
         
@@ -143,6 +235,7 @@ class RiceDiseaseApp:
             data.append({"ফসলের নাম (Crops)": 'Rice', "রোগ/অবস্থা (Condition)": cls})
         
         # Convert to DataFrame
+        import pandas as pd
         df = pd.DataFrame(data)
         
         st.markdown(
@@ -171,16 +264,57 @@ class RiceDiseaseApp:
         
         # Display architecture image
         try:
-            img = Image.open('static/images/Rice-leaf-disease-identification-by-ResNet34.png')
-            st.image(img, caption="CNN + Custom ResNet Architecture for Rice Disease Prediction", width=800)
+            show_image('Rice-leaf-disease-identification-by-ResNet34.png', width=800,
+                       caption="CNN + Custom ResNet Architecture for Rice Disease Prediction")
         except FileNotFoundError:
             st.info("Architecture image not found.")
     
+    def _predict(self, image, image_bytes: bytes, enhance: bool = False) -> PredictionResult:
+        """Get the prediction for an upload, served from the prediction cache when possible"""
+        metrics = get_metrics()
+        if self.client is not None:
+            with metrics.stage('inference'):
+                return PredictionResult.from_dict(self.client.predict(image_bytes))
+        
+        cache = get_prediction_cache()
+        # Enhanced and raw predictions of the same upload are cached separately
+        digest = cache.fingerprint(self.predictor, decode_size=IMAGE_CONFIG['decode_size'], enhance=enhance)
+        key = cache.make_key(image_bytes, digest)
+        cached = cache.get(key)
+        metrics.inc('rice_cache_requests_total', result='miss' if cached is None else 'hit')
+        if cached is not None:
+            logits = cached.logits
+        else:
+            if enhance:
+                with metrics.stage('enhance'):
+                    image = enhance_image(image)
+            with metrics.stage('inference'):
+                if BATCH_CONFIG['enabled']:
+                    logits = get_batcher(self.predictor).predict(image)
+                else:
+                    timings = {}
+                    logits = self.predictor.predict_logits([image], timings=timings)[0]
+                    metrics.record_timings(timings)
+                    metrics.record_batch(1, timings.get('forward', 0.0))
+            cache.put(key, int(logits.argmax()), logits.tolist())
+        
+        with metrics.stage('postprocess'):
+            return postprocess(
+                logits,
+                CLASS_NAMES,
+                temperature=get_temperature(),
+                top_k=PREDICTION_CONFIG['top_k'],
+                uncertainty_threshold=PREDICTION_CONFIG['uncertainty_threshold']
+            )
+    
     def render_prediction_page(self):
         """Render the disease recognition page"""
         st.markdown('<h2 style="color:#FFA500;"> Rice Disease Recognition</h2>', 
                    unsafe_allow_html=True)
         
+        if self.client is None:
+            self._load_model()
+        
         # File uploader
         test_image = st.file_uploader(
             "Upload an image", 
@@ -189,12 +323,16 @@ class RiceDiseaseApp:
         )
         
         if test_image is not None:
+            metrics = get_metrics()
             try:
-                # Load and process image
-                image = Image.open(test_image).convert("RGB")
+                with metrics.stage('upload_read'):
+                    image_bytes = test_image.getvalue()
                 
-                # Validate image
-                if not validate_image(image):
+                # Read only the header, so oversized images are rejected before decoding
+                with metrics.stage('validate'):
+                    image = open_image(test_image)
+                    valid = validate_image(image)
+                if not valid:
                     st.error("Image is too small or too large. Please upload a valid image.")
                     return
                 
@@ -202,40 +340,64 @@ class RiceDiseaseApp:
                 with st.expander("Image Information"):
                     display_image_info(image)
                 
+                # Decode at reduced resolution
+                with metrics.stage('decode'):
+                    image = decode_image(image, IMAGE_CONFIG['decode_size'])
+                
                 # Display uploaded image
                 st.image(image, caption="Uploaded image", width=400)
                 
-                # Preprocess image
-                processed_image = preprocess_image(image)
+                # The inference service applies its own enhancement setting
+                enhance = IMAGE_CONFIG['enhance']
+                if self.client is None:
+                    enhance = st.checkbox("Enhance contrast (for dull or hazy photos)", value=enhance)
                 
                 # Prediction button
                 if st.button("Predict", type="primary"):
-                    if self.predictor is None:
+                    if self.predictor is None and self.client is None:
                         st.error("Model not loaded. Please check the model file.")
                         return
                     
                     st.snow()
                     st.write("Our Disease Prediction Result : ")
                     
-                    start_time = time.time()
+                    start_time = time.perf_counter()
                     
                     try:
-                        # Make prediction
-                        result = self.predictor.predict(processed_image)
+                        # Make prediction, reusing the result for a previously seen upload
+                        result = self._predict(image, image_bytes, enhance=enhance)
                         
-                        # Display result
-                        st.success(f"Predicted Class is --->  {CLASS_NAMES[result]}")
+                        if result.uncertain:
+                            # Skip the treatment lookup rather than recommend one for a guess
+                            st.warning(f"The model is not confident about this image ({result.confidence:.0%}). "
+                                       "Please retake the photo with the leaf in focus and filling the frame.")
+                        else:
+                            # Display result
+                            st.success(f"Predicted Class is --->  {result.class_name} ({result.confidence:.0%})")
                         
-                        # Display treatment recommendation
-                        self.treatment_service.display_treatment(CLASS_NAMES[result])
+                        with st.expander("Top predictions"):
+                            for name, probability in result.top_k:
+                                st.write(f"**{name}:** {probability:.1%}")
                         
-                        end_time = time.time()
-                        prediction_time = end_time - start_time
+                        if not result.uncertain:
+                            # Display treatment recommendation
+                            with metrics.stage('treatment'):
+                                self.treatment_service.display_treatment(result.class_name)
+                        
+                        prediction_time = time.perf_counter() - start_time
+                        metrics.observe('rice_stage_seconds', prediction_time, stage='total')
                         logger.info(f"Prediction Response Time: {prediction_time:.4f} sec")
                         
                         # Display performance metrics
                         st.info(f"Prediction completed in {prediction_time:.2f} seconds")
                         
+                        # Queued for a background thread; the inference service archives its own uploads
+                        if ARCHIVE_CONFIG['enabled'] and self.client is None:
+                            get_upload_archive().submit(
+                                image_bytes, result.to_dict(), timings={'total_ms': prediction_time * 1000},
+                                source='app', model=self.predictor.checkpoint_digest, enhance=enhance
+                            )
+                        
                     except Exception as e:
                         logger.error(f"Prediction error: {e}")
                         st.error(f"Error during prediction: {e}")
@@ -259,9 +421,60 @@ class RiceDiseaseApp:
             self.render_about_page()
         elif app_mode == "Disease Recognition":
             self.render_prediction_page()
+        
+        self.render_latency_summary()
+    
+    def render_latency_summary(self):
+        """Show per-stage latency percentiles for this server process in the sidebar"""
+        summary = get_metrics().summary('rice_stage_seconds', 'stage')
+        if not summary:
+            return
+        import pandas as pd
+        with st.sidebar.expander("Latency (ms)"):
+            st.dataframe(pd.DataFrame([
+                {
+                    'stage': stage,
+                    'count': stats['count'],
+                    **{q: round(stats[q] * 1000, 1) for q in ('p50', 'p95', 'p99')}
+                }
+                for stage, stats in summary.items()
+            ]).set_index('stage'))
+            escalation_rate = get_metrics().escalation_rate()
+            if escalation_rate is not None:
+                st.caption(f"Healthy-leaf gate escalated {escalation_rate:.0%} of images to the full model")
+
+def get_model_options(device) -> dict:
+    """Get the registry arguments for the configured model, with gate decisions recorded in the metrics"""
+    return model_options(device, on_gate=get_metrics().record_gate)
+
+def warm_up():
+    """Apply the CPU runtime profile, then load and warm the model once per process"""
+    if SERVER_CONFIG['url']:
+        # Thin clients never load torch
+        return
+    from models.registry import get_registry
+    from utils.device_utils import get_device, configure_runtime, autotune_threads
+    configure_runtime(**RUNTIME_CONFIG)
+    if WORKER_CONFIG['num_workers'] > 0:
+        return
+    try:
+        predictor = get_registry().warm_up(**get_model_options(get_device()))
+        if RUNTIME_CONFIG['num_threads'] == 'auto':
+            autotune_threads(predictor.warm_up)
+    except Exception as e:
+        logger.error(f"Error warming up model: {e}")
+
+@st.cache_resource
+def start_warm_up() -> threading.Thread:
+    """Import torch and warm the model in a background thread, once per process, so pages render meanwhile"""
+    thread = threading.Thread(target=warm_up, name="model-warm-up", daemon=True)
+    thread.start()
+    return thread
 
 def main():
     """Main function to run the application"""
+    ensure_directories()
+    start_warm_up()
     app = RiceDiseaseApp()
     app.run()
 
@@ -0,0 +1,169 @@
+"""
+Reproducible benchmarks for the inference pipeline
+
+Run with: python src/cli.py benchmark --help
+"""
+import os
+import sys
+import time
+import platform
+import logging
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+from PIL import Image
+
+from models.resnet_model import RiceDiseasePredictor
+from models.data import find_images
+from utils.image_utils import preprocess_image
+
+logger = logging.getLogger(__name__)
+
+# Metrics where a lower value is better; every other compared metric is a throughput
+LOWER_IS_BETTER = ('_ms', '_mb')
+
+
+def latency_stats(samples: Sequence[float]) -> Dict[str, float]:
+    """Summarize per-run durations in seconds as millisecond statistics"""
+    ms = np.asarray(samples) * 1000
+    return {
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'runs': len(ms)
+    }
+
+
+def time_runs(fn, runs: int = 20, warmup: int = 3) -> List[float]:
+    """Call ``fn`` ``warmup`` times untimed, then return the duration of each of ``runs`` calls"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB, or None where ``resource`` is unavailable"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def synthetic_images(count: int, size=(1024, 768), seed: int = 0) -> List[Image.Image]:
+    """Deterministic smooth images at a typical phone-photo resolution"""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        coarse = rng.integers(0, 255, (size[1] // 32, size[0] // 32, 3), dtype=np.uint8)
+        images.append(Image.fromarray(coarse).resize(size, Image.Resampling.BILINEAR))
+    return images
+
+
+def sample_images(directory: str, count: int) -> List[Image.Image]:
+    """Load up to ``count`` images from a folder, decoded into memory so timing excludes disk reads"""
+    images = []
+    for path in find_images(directory)[:count]:
+        with Image.open(path) as image:
+            images.append(image.convert('RGB'))
+    return images
+
+
+def environment() -> Dict:
+    return {
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'default_threads': torch.get_num_threads()
+    }
+
+
+def run_benchmarks(model_path: str, images: List[Image.Image], batch_sizes: Sequence[int] = (1, 8, 32, 64),
+                   thread_counts: Optional[Sequence[int]] = None, backends: Sequence[str] = ('eager',),
+                   runs: int = 20, warmup: int = 3) -> Dict:
+    """Benchmark preprocessing, single-image prediction and batched inference.
+
+    Every combination of backend, intra-op thread count and batch size is
+    timed; batches are built by cycling through ``images``. Backends that are
+    unavailable here (and would silently fall back to eager) are skipped.
+    """
+    thread_counts = list(thread_counts or sorted({1, torch.get_num_threads()}))
+    default_threads = torch.get_num_threads()
+    report = {'environment': environment(), 'images': len(images), 'runs': runs}
+
+    start = time.perf_counter()
+    predictor = RiceDiseasePredictor(model_path=model_path, device='cpu')
+    report['load_ms'] = (time.perf_counter() - start) * 1000
+
+    report['preprocess_image'] = latency_stats(time_runs(lambda: preprocess_image(images[0]), runs, warmup))
+    report['preprocess_batch'] = latency_stats(time_runs(lambda: predictor.transform.batch(images[:1]), runs, warmup))
+    report['predict'] = latency_stats(time_runs(lambda: predictor.predict(images[0]), runs, warmup))
+
+    report['batch'] = {}
+    try:
+        for backend in backends:
+            if backend == 'eager':
+                candidate = predictor
+            else:
+                candidate = RiceDiseasePredictor(model_path=model_path, device='cpu', backend=backend)
+                if candidate.backend != backend:
+                    logger.warning(f"Skipping unavailable backend '{backend}'")
+                    continue
+            for threads in thread_counts:
+                torch.set_num_threads(threads)
+                for batch_size in batch_sizes:
+                    batch = [images[i % len(images)] for i in range(batch_size)]
+                    stats = latency_stats(time_runs(lambda: candidate.predict_logits(batch), runs, warmup))
+                    stats['images_per_second'] = batch_size / (stats['mean_ms'] / 1000)
+                    report['batch'][f"{backend}/threads={threads}/batch={batch_size}"] = stats
+                    logger.info(f"{backend} threads={threads} batch={batch_size}: "
+                                f"p50 {stats['p50_ms']:.1f} ms, {stats['images_per_second']:.1f} img/s")
+    finally:
+        torch.set_num_threads(default_threads)
+
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
+
+
+def flatten(report: Dict) -> Dict[str, float]:
+    """Comparable metrics from a report, keyed like ``batch/eager/threads=4/batch=8/p50_ms``"""
+    metrics = {'load_ms': report['load_ms']}
+    if report.get('peak_rss_mb') is not None:
+        metrics['peak_rss_mb'] = report['peak_rss_mb']
+    for section in ('preprocess_image', 'preprocess_batch', 'predict'):
+        for name in ('p50_ms', 'p95_ms'):
+            metrics[f"{section}/{name}"] = report[section][name]
+    for key, stats in report['batch'].items():
+        for name in ('p50_ms', 'p95_ms', 'images_per_second'):
+            metrics[f"batch/{key}/{name}"] = stats[name]
+    return metrics
+
+
+def compare(report: Dict, baseline: Dict, threshold: float = 0.10) -> List[Dict]:
+    """List metrics that regressed by more than ``threshold`` (a fraction) against a baseline report.
+
+    Latencies and memory regress when they grow, throughputs when they drop.
+    Metrics missing from either report are ignored.
+    """
+    current, previous = flatten(report), flatten(baseline)
+    regressions = []
+    for name in sorted(current.keys() & previous.keys()):
+        value, reference = current[name], previous[name]
+        if not reference:
+            continue
+        change = (value - reference) / reference
+        worse = change > threshold if name.endswith(LOWER_IS_BETTER) else change < -threshold
+        if worse:
+            regressions.append({'metric': name, 'baseline': reference, 'current': value, 'change': change})
+    return regressions
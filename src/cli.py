@@ -0,0 +1,513 @@
+"""
+Command line tools for the rice disease prediction model
+"""
+import json
+import time
+import logging
+import click
+import torch
+from torch.utils.data import DataLoader
+
+from models.resnet_model import CNN_NeuralNet, ARCHITECTURES, create_model
+from models.data import ImageFileDataset, SurveyImageDataset, find_images, find_labelled_images
+from config.settings import (CLASS_NAMES, MODEL_CONFIG, IMAGE_CONFIG, PREDICTION_CONFIG, BENCHMARK_CONFIG,
+                             ASSET_CONFIG, ARCHIVE_CONFIG, PATHS, LOGGING_CONFIG)
+
+logging.basicConfig(**LOGGING_CONFIG)
+logger = logging.getLogger(__name__)
+
+
+def load_fp32_model(model_path, architecture='resnet9'):
+    """Load an fp32 checkpoint (CNN_NeuralNet by default) on CPU"""
+    model = create_model(architecture, MODEL_CONFIG['in_channels'], MODEL_CONFIG['num_classes'])
+    model.load_state_dict(torch.load(model_path, weights_only=True, map_location='cpu'))
+    return model.eval()
+
+
+def image_loader(directory, batch_size, limit=None, labelled=False, num_workers=0, shuffle=False):
+    """Build a DataLoader over the images in a directory"""
+    if labelled:
+        samples = find_labelled_images(directory, CLASS_NAMES)
+        paths, labels = [p for p, _ in samples], [label for _, label in samples]
+    else:
+        paths, labels = find_images(directory), None
+    if limit:
+        paths = paths[:limit]
+        labels = labels[:limit] if labels is not None else None
+    if not paths:
+        raise click.ClickException(f"No images found in {directory}")
+    return DataLoader(ImageFileDataset(paths, labels), batch_size=batch_size, num_workers=num_workers,
+                      shuffle=shuffle)
+
+
+def measure_latency(model, batch_size=1, runs=20, warmup=3):
+    """Mean forward-pass latency in milliseconds on a random batch"""
+    dummy = torch.randn(batch_size, 3, *MODEL_CONFIG['input_size'])
+    with torch.no_grad():
+        for _ in range(warmup):
+            model(dummy)
+        start = time.perf_counter()
+        for _ in range(runs):
+            model(dummy)
+    return (time.perf_counter() - start) / runs * 1000
+
+
+@click.group()
+def cli():
+    """Rice disease model tools"""
+
+
+@cli.command()
+@click.option('--model-path', default=MODEL_CONFIG['model_path'], show_default=True, help='fp32 checkpoint')
+@click.option('--calibration-dir', required=True, type=click.Path(exists=True, file_okay=False),
+              help='Folder of representative leaf images used to calibrate activation ranges')
+@click.option('--eval-dir', type=click.Path(exists=True, file_okay=False),
+              help='Folder with one sub-folder per class name, used to report the accuracy delta')
+@click.option('--output', default=MODEL_CONFIG['quantized_model_path'], show_default=True, help='int8 checkpoint')
+@click.option('--num-calibration', default=128, show_default=True, help='Number of calibration images')
+@click.option('--batch-size', default=16, show_default=True)
+def quantize(model_path, calibration_dir, eval_dir, output, num_calibration, batch_size):
+    """Export a static int8 quantized checkpoint and report its accuracy delta against fp32"""
+    from models.quantization import quantize_static, save_quantized_model, load_quantized_model
+    from models.quantization import compare_models, model_size_bytes
+
+    fp32_model = load_fp32_model(model_path)
+    calibration = image_loader(calibration_dir, batch_size, limit=num_calibration)
+    int8_model = quantize_static(fp32_model.state_dict(), calibration)
+    save_quantized_model(int8_model, output)
+
+    # Evaluate the model as it will be served, i.e. reloaded from disk
+    int8_model = load_quantized_model(output)
+    if eval_dir:
+        evaluation = image_loader(eval_dir, batch_size, labelled=True)
+    else:
+        evaluation = calibration
+    report = compare_models(fp32_model, int8_model, evaluation)
+    report.update({
+        'fp32_size_bytes': model_size_bytes(fp32_model),
+        'int8_size_bytes': model_size_bytes(int8_model),
+        'fp32_latency_ms': measure_latency(fp32_model),
+        'int8_latency_ms': measure_latency(int8_model),
+        'output': output
+    })
+    click.echo(json.dumps(report, indent=2))
+
+
+@cli.command()
+@click.option('--model-path', default=MODEL_CONFIG['model_path'], show_default=True, help='fp32 checkpoint')
+@click.option('--format', 'formats', type=click.Choice(['torchscript', 'onnx']), multiple=True,
+              default=['torchscript', 'onnx'], show_default=True)
+@click.option('--torchscript-path', default=MODEL_CONFIG['torchscript_path'], show_default=True)
+@click.option('--onnx-path', default=MODEL_CONFIG['onnx_path'], show_default=True)
+@click.option('--architecture', default='resnet9', show_default=True, type=click.Choice(list(ARCHITECTURES)))
+def export(model_path, formats, torchscript_path, onnx_path, architecture):
+    """Export the BatchNorm-folded model as TorchScript and/or ONNX artifacts"""
+    from models.resnet_model import RiceDiseasePredictor
+    from models.backends import export_torchscript, export_onnx
+
+    model = RiceDiseasePredictor(model_path=model_path, device='cpu', architecture=architecture).model
+    if 'torchscript' in formats:
+        export_torchscript(model, torchscript_path)
+    if 'onnx' in formats:
+        export_onnx(model, onnx_path, input_size=MODEL_CONFIG['input_size'])
+
+
+@cli.command()
+@click.option('--model-path', default=MODEL_CONFIG['model_path'], show_default=True)
+@click.option('--eval-dir', required=True, type=click.Path(exists=True, file_okay=False),
+              help='Held-out folder with one sub-folder per class name')
+@click.option('--output', default=PREDICTION_CONFIG['temperature_path'], show_default=True)
+@click.option('--batch-size', default=32, show_default=True)
+def calibrate(model_path, eval_dir, output, batch_size):
+    """Fit the softmax temperature used for confidence scores on held-out images"""
+    import torch.nn.functional as F
+    from models.postprocessing import fit_temperature, save_temperature
+
+    model = load_fp32_model(model_path)
+    logits, labels = [], []
+    with torch.no_grad():
+        for images, batch_labels in image_loader(eval_dir, batch_size, labelled=True):
+            logits.append(model(images))
+            labels.append(batch_labels)
+    logits, labels = torch.cat(logits), torch.cat(labels)
+
+    temperature = fit_temperature(logits, labels)
+    save_temperature(temperature, output)
+    report = {
+        'samples': len(labels),
+        'temperature': temperature,
+        'nll_before': F.cross_entropy(logits, labels).item(),
+        'nll_after': F.cross_entropy(logits / temperature, labels).item(),
+        'output': output
+    }
+    click.echo(json.dumps(report, indent=2))
+
+
+def student_report(teacher, student, evaluation):
+    """Accuracy and agreement of a student against its teacher, plus size, compute and latency of both"""
+    from models.quantization import compare_models
+    from models.distillation import count_macs
+
+    report = compare_models(teacher, student, evaluation) if evaluation is not None else {}
+    for name, model in (('teacher', teacher), ('student', student)):
+        report[f'{name}_parameters'] = sum(p.numel() for p in model.parameters())
+        report[f'{name}_gmacs'] = count_macs(model, MODEL_CONFIG['input_size']) / 1e9
+        report[f'{name}_latency_ms'] = measure_latency(model)
+        report[f'{name}_batch32_latency_ms'] = measure_latency(model, batch_size=32, runs=5)
+    report['compute_reduction'] = report['teacher_gmacs'] / report['student_gmacs']
+    report['speedup'] = report['teacher_latency_ms'] / report['student_latency_ms']
+    return report
+
+
+@cli.command()
+@click.option('--teacher-path', default=MODEL_CONFIG['model_path'], show_default=True, help='fp32 checkpoint')
+@click.option('--train-dir', required=True, type=click.Path(exists=True, file_okay=False),
+              help='Training folder with one sub-folder per class name')
+@click.option('--eval-dir', type=click.Path(exists=True, file_okay=False),
+              help='Held-out folder with one sub-folder per class name, for validation and the report')
+@click.option('--output', default=MODEL_CONFIG['student_model_path'], show_default=True, help='Student checkpoint')
+@click.option('--architecture', default='lite', show_default=True, type=click.Choice(list(ARCHITECTURES)),
+              help='Student architecture')
+@click.option('--prune-init/--random-init', default=True, show_default=True,
+              help="Start the student from the teacher's highest-norm filters")
+@click.option('--epochs', default=10, show_default=True)
+@click.option('--batch-size', default=32, show_default=True)
+@click.option('--lr', default=1e-3, show_default=True, help='Peak learning rate of the one-cycle schedule')
+@click.option('--temperature', default=4.0, show_default=True, help='Softening temperature for teacher outputs')
+@click.option('--alpha', default=0.7, show_default=True, help='Weight of the distillation loss against labels')
+@click.option('--num-workers', default=2, show_default=True, help='Decode processes')
+def distill(teacher_path, train_dir, eval_dir, output, architecture, prune_init, epochs, batch_size, lr,
+            temperature, alpha, num_workers):
+    """Train a slimmer student from the teacher and report its accuracy and latency against it"""
+    from models.distillation import prune_into, distill as run_distillation
+
+    teacher = load_fp32_model(teacher_path)
+    student = create_model(architecture, MODEL_CONFIG['in_channels'], MODEL_CONFIG['num_classes'])
+    if prune_init:
+        prune_into(teacher, student)
+    train = image_loader(train_dir, batch_size, labelled=True, num_workers=num_workers, shuffle=True)
+    evaluation = image_loader(eval_dir, batch_size, labelled=True, num_workers=num_workers) if eval_dir else None
+    history = run_distillation(student, teacher, train, evaluation, epochs=epochs, lr=lr,
+                               temperature=temperature, alpha=alpha)
+    torch.save(student.state_dict(), output)
+
+    # Evaluate the student as it will be served, i.e. reloaded from disk
+    report = student_report(teacher, load_fp32_model(output, architecture), evaluation)
+    report.update({'history': history, 'output': output})
+    click.echo(json.dumps(report, indent=2))
+
+
+@cli.command('train-gate')
+@click.option('--teacher-path', default=MODEL_CONFIG['model_path'], show_default=True, help='fp32 checkpoint')
+@click.option('--train-dir', required=True, type=click.Path(exists=True, file_okay=False),
+              help='Training folder with one sub-folder per class name')
+@click.option('--eval-dir', type=click.Path(exists=True, file_okay=False),
+              help='Held-out folder with one sub-folder per class name, for validation and the report')
+@click.option('--output', default=MODEL_CONFIG['gate_path'], show_default=True, help='Gate checkpoint')
+@click.option('--epochs', default=10, show_default=True)
+@click.option('--batch-size', default=32, show_default=True)
+@click.option('--lr', default=1e-3, show_default=True, help='Peak learning rate of the one-cycle schedule')
+@click.option('--temperature', default=2.0, show_default=True, help='Softening temperature for teacher outputs')
+@click.option('--alpha', default=0.5, show_default=True, help='Weight of the distillation loss against labels')
+@click.option('--num-workers', default=2, show_default=True, help='Decode processes')
+def train_gate(teacher_path, train_dir, eval_dir, output, epochs, batch_size, lr, temperature, alpha, num_workers):
+    """Train the healthy-leaf gate for cascaded inference and report escalation rates per threshold"""
+    from models.resnet_model import CNN_GateNet
+    from models.distillation import (prune_into, distill as run_distillation, count_macs, gate_report,
+                                     HealthyVsRest, HealthyLabels)
+
+    healthy_index = CLASS_NAMES.index('Healthy Rice Leaf')
+    teacher = load_fp32_model(teacher_path)
+    gate = prune_into(teacher, CNN_GateNet())
+    train = HealthyLabels(image_loader(train_dir, batch_size, labelled=True, num_workers=num_workers, shuffle=True),
+                          healthy_index)
+    evaluation = None
+    if eval_dir:
+        evaluation = HealthyLabels(image_loader(eval_dir, batch_size, labelled=True, num_workers=num_workers),
+                                   healthy_index)
+    history = run_distillation(gate, HealthyVsRest(teacher, healthy_index), train, evaluation, epochs=epochs, lr=lr,
+                               temperature=temperature, alpha=alpha)
+    torch.save(gate.state_dict(), output)
+
+    gate = CNN_GateNet()
+    gate.load_state_dict(torch.load(output, weights_only=True, map_location='cpu'))
+    report = gate_report(gate, evaluation or train)
+    gate_gmacs, teacher_gmacs = count_macs(gate) / 1e9, count_macs(teacher) / 1e9
+    for key, rates in report.items():
+        if key.startswith('threshold='):
+            # Expected compute per image: the gate always runs, the full model only on escalation
+            rates['gmacs_per_image'] = gate_gmacs + rates['escalation_rate'] * teacher_gmacs
+    report.update({
+        'gate_gmacs': gate_gmacs,
+        'teacher_gmacs': teacher_gmacs,
+        'gate_latency_ms': measure_latency(gate),
+        'teacher_latency_ms': measure_latency(teacher),
+        'history': history,
+        'output': output
+    })
+    click.echo(json.dumps(report, indent=2))
+
+
+@cli.command('compare-models')
+@click.option('--teacher-path', default=MODEL_CONFIG['model_path'], show_default=True)
+@click.option('--student-path', default=MODEL_CONFIG['student_model_path'], show_default=True)
+@click.option('--architecture', default='lite', show_default=True, type=click.Choice(list(ARCHITECTURES)),
+              help='Student architecture')
+@click.option('--eval-dir', type=click.Path(exists=True, file_okay=False),
+              help='Folder with one sub-folder per class name (latency and compute only if omitted)')
+@click.option('--batch-size', default=32, show_default=True)
+def compare_models_command(teacher_path, student_path, architecture, eval_dir, batch_size):
+    """Report a student checkpoint's accuracy, compute and latency against the teacher"""
+    evaluation = image_loader(eval_dir, batch_size, labelled=True) if eval_dir else None
+    report = student_report(load_fp32_model(teacher_path), load_fp32_model(student_path, architecture), evaluation)
+    click.echo(json.dumps(report, indent=2))
+
+
+@cli.command('convert-checkpoint')
+@click.option('--model-path', default=MODEL_CONFIG['model_path'], show_default=True, help='Checkpoint to convert')
+@click.option('--output', help='Converted checkpoint (defaults to overwriting --model-path)')
+@click.option('--fold-bn', is_flag=True,
+              help='Save with BatchNorm folded into the convolutions, so the predictor needs no fold at start-up')
+def convert_checkpoint(model_path, output, fold_bn):
+    """Re-save a checkpoint as a plain, contiguous fp32 state dict that can be memory-mapped.
+
+    Folding at start-up gives every folded convolution new, private weights;
+    with --fold-bn all weights stay in the mapped file and are shared between
+    processes.
+    """
+    checkpoint = torch.load(model_path, weights_only=False, map_location='cpu')
+    # Accept whole pickled models as well as state dicts
+    state_dict = checkpoint.state_dict() if isinstance(checkpoint, torch.nn.Module) else checkpoint
+    state_dict = {
+        name: tensor.detach().float().contiguous() if tensor.is_floating_point() else tensor.detach().contiguous()
+        for name, tensor in state_dict.items()
+    }
+    # Validate against the architecture before writing anything
+    model = CNN_NeuralNet(MODEL_CONFIG['in_channels'], MODEL_CONFIG['num_classes'])
+    model.load_state_dict(state_dict)
+    if fold_bn:
+        from models.optimization import optimize_for_inference
+        folded = optimize_for_inference(model)
+        if folded is model:
+            raise click.ClickException("Folding BatchNorm changed the model's outputs; convert without --fold-bn")
+        state_dict = {name: tensor.contiguous() for name, tensor in folded.state_dict().items()}
+    output = output or model_path
+    torch.save(state_dict, output, _use_new_zipfile_serialization=True)
+    click.echo(f"Saved mmap-able checkpoint to {output}")
+
+
+@cli.command('load-time')
+@click.option('--model-path', default=MODEL_CONFIG['model_path'], show_default=True)
+@click.option('--runs', default=5, show_default=True, help='Repetitions per configuration')
+def load_time(model_path, runs):
+    """Measure checkpoint load and predictor start-up time with and without mmap"""
+    import statistics
+    from models.resnet_model import RiceDiseasePredictor, load_state_dict
+
+    def timed(fn):
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - start) * 1000)
+        return {'median_ms': statistics.median(samples), 'min_ms': min(samples)}
+
+    report = {
+        'torch_load': timed(lambda: load_state_dict(model_path, mmap=False)),
+        'torch_load_mmap': timed(lambda: load_state_dict(model_path, mmap=True)),
+        'predictor': timed(lambda: RiceDiseasePredictor(model_path, device='cpu', mmap=False)),
+        'predictor_mmap': timed(lambda: RiceDiseasePredictor(model_path, device='cpu', mmap=True)),
+        'predictor_mmap_no_fold': timed(lambda: RiceDiseasePredictor(model_path, device='cpu', fold_bn=False)),
+    }
+    click.echo(json.dumps(report, indent=2))
+
+
+@cli.command()
+@click.argument('inputs', nargs=-1, type=click.Path(exists=True, file_okay=False))
+@click.option('--manifest', type=click.Path(exists=True, dir_okay=False),
+              help='Text file with one image path per line, or a CSV with a "path" column')
+@click.option('--output', required=True, help='Result file (.csv, .jsonl) or folder (.parquet)')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl', 'parquet']),
+              help='Output format (inferred from --output by default)')
+@click.option('--model-path', default=MODEL_CONFIG['model_path'], show_default=True)
+@click.option('--architecture', default='resnet9', show_default=True, type=click.Choice(list(ARCHITECTURES)))
+@click.option('--backend', default='eager', show_default=True,
+              type=click.Choice(['eager', 'torchscript', 'compile', 'onnxruntime']))
+@click.option('--preprocessing', default=IMAGE_CONFIG['preprocessing'], show_default=True,
+              type=click.Choice(['pil', 'opencv']), help='Resize backend')
+@click.option('--enhance/--no-enhance', default=IMAGE_CONFIG['enhance'], show_default=True,
+              help='CLAHE contrast enhancement before prediction')
+@click.option('--batch-size', default=64, show_default=True)
+@click.option('--num-workers', default=4, show_default=True, help='Decode processes')
+@click.option('--prefetch', default=4, show_default=True, help='Batches prefetched per decode process')
+@click.option('--checkpoint-every', default=1024, show_default=True, help='Images between resume checkpoints')
+@click.option('--restart', is_flag=True, help='Ignore an existing checkpoint and overwrite --output')
+def predict(inputs, manifest, output, fmt, model_path, architecture, backend, preprocessing, enhance, batch_size,
+            num_workers, prefetch, checkpoint_every, restart):
+    """Predict every image under INPUTS folders and/or in a manifest, streaming results to disk.
+
+    Interrupted runs resume from the last checkpoint when re-run with the same arguments.
+    """
+    from models.resnet_model import RiceDiseasePredictor
+    from models.postprocessing import postprocess, load_temperature
+    from services.bulk_prediction import BulkPredictionJob, read_manifest, result_row
+
+    paths = [path for directory in inputs for path in find_images(directory)]
+    if manifest:
+        paths.extend(read_manifest(manifest))
+    if not paths:
+        raise click.ClickException("No images to predict; pass folders and/or --manifest")
+
+    try:
+        job = BulkPredictionJob(paths, output, fmt=fmt, checkpoint_every=checkpoint_every, restart=restart)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if job.done:
+        click.echo(f"All {len(paths)} images already predicted in {output}")
+        return
+
+    # The ONNX graph is looked up beside the checkpoint, as written by the export command
+    predictor = RiceDiseasePredictor(model_path=model_path, device='cpu', backend=backend,
+                                     preprocessing=preprocessing, architecture=architecture)
+    temperature = load_temperature(PREDICTION_CONFIG['temperature_path'])
+    image_transform = None
+    if enhance:
+        from utils.image_utils import enhance_image
+        image_transform = enhance_image
+    dataset = SurveyImageDataset(paths, predictor.transform, start=job.offset, image_transform=image_transform)
+    # Decode processes hand back uint8 pixels; normalization happens once per batch here
+    loader = DataLoader(dataset, batch_size=batch_size, num_workers=num_workers,
+                        prefetch_factor=prefetch if num_workers else None,
+                        persistent_workers=num_workers > 0)
+
+    def predict_rows(pixels, indices, ok):
+        rows = [result_row(paths[i]) for i in indices]
+        ok = ok.bool()
+        if ok.any():
+            logits = predictor.predict_pixels(pixels[ok])
+            positions = ok.nonzero().flatten().tolist()
+            for position, row_logits in zip(positions, logits):
+                result = postprocess(row_logits, CLASS_NAMES, temperature=temperature,
+                                     top_k=PREDICTION_CONFIG['top_k'],
+                                     uncertainty_threshold=PREDICTION_CONFIG['uncertainty_threshold'])
+                rows[position] = result_row(paths[indices[position]], result)
+        return rows
+
+    start = time.perf_counter()
+    with click.progressbar(length=len(paths), label='Predicting') as bar:
+        bar.update(job.offset)
+        processed = job.run(loader, predict_rows, progress=bar.update)
+    elapsed = time.perf_counter() - start
+    click.echo(json.dumps({
+        'processed': processed,
+        'total': len(paths),
+        'images_per_second': processed / elapsed if elapsed else None,
+        'output': output
+    }, indent=2))
+
+
+@cli.command()
+@click.option('--model-path', default=MODEL_CONFIG['model_path'], show_default=True)
+@click.option('--images', 'images_dir', type=click.Path(exists=True, file_okay=False),
+              help='Folder of sample images (synthetic images are used if omitted)')
+@click.option('--num-images', default=16, show_default=True)
+@click.option('--batch-size', 'batch_sizes', type=int, multiple=True, default=BENCHMARK_CONFIG['batch_sizes'],
+              show_default=True)
+@click.option('--threads', 'thread_counts', type=int, multiple=True,
+              help='Intra-op thread counts to try (default: 1 and the current default)')
+@click.option('--backend', 'backends', multiple=True, default=['eager', 'torchscript', 'onnxruntime'],
+              show_default=True, type=click.Choice(['eager', 'torchscript', 'compile', 'onnxruntime']))
+@click.option('--runs', default=20, show_default=True)
+@click.option('--warmup', default=3, show_default=True)
+@click.option('--output', help='Write the JSON report here as well as to stdout')
+@click.option('--baseline', default=BENCHMARK_CONFIG['baseline_path'], show_default=True)
+@click.option('--threshold', default=BENCHMARK_CONFIG['regression_threshold'], show_default=True,
+              help='Allowed fractional regression against the baseline')
+@click.option('--save-baseline', is_flag=True, help='Store this run as the new baseline')
+def benchmark(model_path, images_dir, num_images, batch_sizes, thread_counts, backends, runs, warmup, output,
+              baseline, threshold, save_baseline):
+    """Benchmark the inference pipeline and compare it against a stored baseline.
+
+    Exits with an error if any latency, memory or throughput metric regressed by more than --threshold.
+    """
+    import os
+    from benchmark import run_benchmarks, synthetic_images, sample_images, compare
+
+    images = sample_images(images_dir, num_images) if images_dir else synthetic_images(num_images)
+    if not images:
+        raise click.ClickException(f"No images found in {images_dir}")
+    report = run_benchmarks(model_path, images, batch_sizes=batch_sizes, thread_counts=thread_counts,
+                            backends=backends, runs=runs, warmup=warmup)
+
+    if os.path.exists(baseline) and not save_baseline:
+        with open(baseline, 'r', encoding='utf-8') as f:
+            report['regressions'] = compare(report, json.load(f), threshold)
+    text = json.dumps(report, indent=2)
+    click.echo(text)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    if save_baseline:
+        with open(baseline, 'w', encoding='utf-8') as f:
+            f.write(text)
+        click.echo(f"Saved baseline to {baseline}", err=True)
+    elif report.get('regressions'):
+        raise click.ClickException(f"{len(report['regressions'])} metric(s) regressed by more than {threshold:.0%}")
+
+
+@cli.command('import-time')
+@click.option('--module', 'modules', multiple=True, default=['app', 'server', 'cli'], show_default=True,
+              help='Entry-point modules to profile')
+@click.option('--top', default=15, show_default=True, help='Packages and modules to list per entry point')
+@click.option('--budget', default=BENCHMARK_CONFIG['import_budget_seconds'], show_default=True,
+              help='Seconds allowed for a cold import of the Streamlit app')
+def import_time(modules, top, budget):
+    """Profile cold-start imports of the entry points and check the app's import budget"""
+    from utils.import_profile import profile_imports, cold_import
+
+    report = {module: profile_imports(module, top) for module in modules}
+    report['app_cold_import'] = cold_import('app')
+    click.echo(json.dumps(report, indent=2))
+    app = report['app_cold_import']
+    if app['seconds'] > budget:
+        raise click.ClickException(f"Cold import of app took {app['seconds']:.2f}s (budget {budget:.2f}s)")
+    if {'torch', 'cv2'} & set(app['heavy_modules']):
+        raise click.ClickException(f"Importing app loads {', '.join(app['heavy_modules'])}; import them lazily")
+
+
+@cli.command('build-assets')
+@click.option('--source-dir', default=PATHS['static_images'], show_default=True,
+              type=click.Path(exists=True, file_okay=False), help='Full-size page images')
+@click.option('--output-dir', default=ASSET_CONFIG['build_dir'], show_default=True)
+@click.option('--width', 'widths', multiple=True, type=int, default=ASSET_CONFIG['widths'], show_default=True,
+              help='Display widths to build (capped at each image\'s own width)')
+@click.option('--format', 'formats', multiple=True, type=click.Choice(['webp', 'jpeg']),
+              default=ASSET_CONFIG['formats'], show_default=True)
+def build_assets_command(source_dir, output_dir, widths, formats):
+    """Pre-generate display-size WebP/JPEG variants of the page images"""
+    from utils.assets import build_assets
+
+    manifest = build_assets(source_dir, output_dir, widths, formats)
+    report = {}
+    for name, entry in manifest.items():
+        report[name] = {'source_bytes': entry['bytes']}
+        for width, variants in entry['variants'].items():
+            for fmt, variant in variants.items():
+                report[name][f"{fmt}/{width}w_bytes"] = variant['bytes']
+    click.echo(json.dumps(report, indent=2))
+
+
+@cli.command('archive-roll-up')
+@click.option('--root', default=ARCHIVE_CONFIG['root'], show_default=True, type=click.Path(file_okay=False))
+@click.option('--include-current', is_flag=True,
+              help="Also roll up this hour's journals; only safe while the app and API are stopped")
+def archive_roll_up(root, include_current):
+    """Roll archived upload records and their images into a tar batch for bulk export"""
+    from services.upload_archive import UploadArchive
+
+    batch = UploadArchive(root).roll_up(include_current=include_current)
+    click.echo(batch or "Nothing to roll up")
+
+
+if __name__ == '__main__':
+    cli()
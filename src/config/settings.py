@@ -10,10 +10,94 @@ BASE_DIR = Path(__file__).parent.parent.parent
 # Model configuration
 MODEL_CONFIG = {
     'model_path': os.path.join(BASE_DIR, 'model', 'resnet_Model.pth'),
+    # Distilled CNN_LiteNet student written by the distill CLI command
+    'student_model_path': os.path.join(BASE_DIR, 'model', 'lite_Model.pth'),
+    # Served architecture: 'resnet9' (CNN_NeuralNet) or 'lite' (CNN_LiteNet, ~10x fewer MACs; not with int8)
+    'architecture': os.environ.get('RICE_ARCHITECTURE', 'resnet9'),
+    'quantized_model_path': os.path.join(BASE_DIR, 'model', 'resnet_Model_int8.pth'),
+    'precision': os.environ.get('RICE_PRECISION', 'fp32'),  # 'fp32', 'bf16' or 'int8' (CPU only)
+    # bf16 is only used if it picks the same class as fp32 on at least this fraction of the agreement check
+    'bf16_min_agreement': float(os.environ.get('RICE_BF16_MIN_AGREEMENT', '0.99')),
+    # Sample images for that check; real leaf photos are best, the page images beat random noise
+    'bf16_agreement_dir': os.environ.get('RICE_BF16_AGREEMENT_DIR', os.path.join(BASE_DIR, 'static', 'images')),
+    'backend': os.environ.get('RICE_BACKEND', 'eager'),  # 'eager', 'torchscript', 'compile' or 'onnxruntime'
+    'onnx_path': os.path.join(BASE_DIR, 'model', 'resnet_Model.onnx'),
+    'torchscript_path': os.path.join(BASE_DIR, 'model', 'resnet_Model.ts'),
+    # NHWC layout for the model and its inputs; often faster with oneDNN on recent x86 CPUs
+    'channels_last': os.environ.get('RICE_CHANNELS_LAST', '0') == '1',
+    # torch.inference_mode instead of no_grad for forward passes
+    'inference_mode': os.environ.get('RICE_INFERENCE_MODE', '1') == '1',
+    # Cascade: a tiny healthy-leaf gate answers confidently healthy images before the full model runs
+    'gate_enabled': os.environ.get('RICE_GATE', '0') == '1',
+    'gate_path': os.path.join(BASE_DIR, 'model', 'gate_Model.pth'),
+    # Healthy probability at or above which the gate's answer is final
+    'gate_threshold': float(os.environ.get('RICE_GATE_THRESHOLD', '0.95')),
     'input_size': (224, 224),
     'num_classes': 9,
     'in_channels': 3
 }
+# Checkpoint loaded by the app and the inference service, with its exported ONNX graph beside it
+MODEL_CONFIG['serving_model_path'] = (MODEL_CONFIG['student_model_path'] if MODEL_CONFIG['architecture'] == 'lite'
+                                      else MODEL_CONFIG['model_path'])
+MODEL_CONFIG['serving_onnx_path'] = os.path.splitext(MODEL_CONFIG['serving_model_path'])[0] + '.onnx'
+
+# CPU runtime profile applied once per serving process (see utils.device_utils.configure_runtime)
+RUNTIME_CONFIG = {
+    # Intra-op threads: 0 = one per available CPU, 'auto' = benchmark candidates at start-up
+    'num_threads': os.environ.get('RICE_NUM_THREADS', '0'),
+    'interop_threads': int(os.environ.get('RICE_INTEROP_THREADS', 0)),  # 0 = torch default
+    'cpu_affinity': os.environ.get('RICE_CPU_AFFINITY', ''),  # e.g. '0-3' to pin to four cores
+    'flush_denormal': os.environ.get('RICE_FLUSH_DENORMAL', '1') == '1'
+}
+
+# Dynamic micro-batching of concurrent prediction requests
+BATCH_CONFIG = {
+    'enabled': os.environ.get('RICE_BATCHING', '1') == '1',
+    'max_batch_size': int(os.environ.get('RICE_MAX_BATCH_SIZE', 16)),
+    'max_wait_ms': float(os.environ.get('RICE_MAX_WAIT_MS', 5))
+}
+
+# Multi-process inference pool; 0 workers runs inference in the serving process
+WORKER_CONFIG = {
+    'num_workers': int(os.environ.get('RICE_WORKERS', 0)),
+    'threads_per_worker': int(os.environ.get('RICE_WORKER_THREADS', 1))
+}
+
+# Standalone HTTP inference service (src/server.py)
+SERVER_CONFIG = {
+    'host': os.environ.get('RICE_API_HOST', '0.0.0.0'),
+    'port': int(os.environ.get('RICE_API_PORT', 8000)),
+    'workers': int(os.environ.get('RICE_API_WORKERS', 4)),
+    'max_body_size': 64 * 1024 * 1024,  # Room for base64-encoded batches
+    'max_batch_images': 64,
+    # When set, the Streamlit app sends predictions to this service instead of loading the model
+    'url': os.environ.get('RICE_INFERENCE_URL', '')
+}
+
+# Turning logits into results shown to the user
+PREDICTION_CONFIG = {
+    'top_k': 3,
+    # Below this top-class probability the user is asked to retake the photo
+    'uncertainty_threshold': float(os.environ.get('RICE_UNCERTAINTY_THRESHOLD', 0.5)),
+    # Softmax temperature fitted offline by `python src/cli.py calibrate`
+    'temperature_path': os.path.join(BASE_DIR, 'model', 'temperature.json')
+}
+
+# Performance benchmarks (`python src/cli.py benchmark`)
+BENCHMARK_CONFIG = {
+    'baseline_path': os.path.join(BASE_DIR, 'model', 'benchmark_baseline.json'),
+    'batch_sizes': (1, 8, 32, 64),
+    'regression_threshold': 0.10,  # Fractional slowdown that fails the comparison
+    # Seconds allowed for a cold import of the Streamlit entry point, which must not load torch or cv2
+    'import_budget_seconds': float(os.environ.get('RICE_IMPORT_BUDGET_SECONDS', '2.5'))
+}
+
+# Treatment recommendations shown for each predicted disease
+TREATMENT_CONFIG = {
+    'data_path': os.path.join(BASE_DIR, 'src', 'config', 'treatments.json'),
+    'language': os.environ.get('RICE_TREATMENT_LANGUAGE', 'bn'),
+    'reload_interval': 2.0  # Seconds between checks for edits to the data file
+}
 
 # Class names for rice diseases
 CLASS_NAMES = [
@@ -33,6 +117,11 @@ IMAGE_CONFIG = {
     'max_file_size': 10 * 1024 * 1024,  # 10MB
     'allowed_formats': ['jpg', 'jpeg', 'png', 'bmp', 'tiff'],
     'target_size': (224, 224),
+    'decode_size': (448, 448),  # Minimum size kept by reduced-resolution JPEG decoding
+    # Resize backend for model input: 'pil' (matches training) or 'opencv' (faster on large photos)
+    'preprocessing': os.environ.get('RICE_PREPROCESSING', 'pil'),
+    # CLAHE contrast enhancement before prediction, for low-contrast field photos
+    'enhance': os.environ.get('RICE_ENHANCE', '0') == '1',
     'normalize_mean': [0.5, 0.5, 0.5],
     'normalize_std': [0.5, 0.5, 0.5]
 }
@@ -55,11 +144,85 @@ LOGGING_CONFIG = {
 # File paths
 PATHS = {
     'static_images': os.path.join(BASE_DIR, 'static', 'images'),
-    'uploads': os.path.join(BASE_DIR, 'static', 'uploads'),
+    # Upload archive and disk prediction cache; point at a persistent volume in containers
+    'uploads': os.environ.get('RICE_UPLOADS_DIR', os.path.join(BASE_DIR, 'static', 'uploads')),
     'model_dir': os.path.join(BASE_DIR, 'model'),
     'docs': os.path.join(BASE_DIR, 'docs')
 }
 
-# Create directories if they don't exist
-for path in PATHS.values():
-    os.makedirs(path, exist_ok=True)
+# Prediction cache keyed by upload content and checkpoint digest
+CACHE_CONFIG = {
+    'max_entries': int(os.environ.get('RICE_CACHE_MAX_ENTRIES', 1024)),
+    'ttl_seconds': float(os.environ.get('RICE_CACHE_TTL_SECONDS', 24 * 3600)),
+    'max_disk_entries': int(os.environ.get('RICE_CACHE_MAX_DISK_ENTRIES', 10000)),
+    'disk_dir': (os.path.join(PATHS['uploads'], 'prediction_cache')
+                 if os.environ.get('RICE_CACHE_DISK', '0') == '1' else None)
+}
+
+# Archive of every upload and its prediction, for retraining and audit; written off the request path
+ARCHIVE_CONFIG = {
+    'enabled': os.environ.get('RICE_ARCHIVE', '1') == '1',
+    'root': os.path.join(PATHS['uploads'], 'archive'),
+    # Uploads waiting to be written; beyond this they are dropped rather than slowing requests down
+    'max_queue': int(os.environ.get('RICE_ARCHIVE_QUEUE', 256)),
+    # How often closed hourly journals are rolled into tar batches
+    'roll_up_seconds': float(os.environ.get('RICE_ARCHIVE_ROLL_UP_SECONDS', 3600))
+}
+
+# Display-size variants of static/images built by `python src/cli.py build-assets`
+ASSET_CONFIG = {
+    'build_dir': os.path.join(BASE_DIR, 'static', 'build'),
+    'widths': [800, 850],
+    'formats': ['webp', 'jpeg'],
+    # URL where a web server (nginx) serves build_dir, e.g. /static/build; empty streams images through Streamlit
+    'public_url': os.environ.get('RICE_ASSET_URL', '').rstrip('/')
+}
+
+
+def model_options(device='cpu', on_gate=None) -> dict:
+    """Predictor arguments for the configured checkpoint, precision, backend and gate.
+
+    Shared by the app and the inference service so both serve the same
+    model. ``on_gate`` is passed to the gate, if enabled. Imports torch, so
+    call it where the model is loaded rather than at import time.
+    """
+    from models.resnet_model import PRECISIONS
+    precision = MODEL_CONFIG['precision']
+    if precision == 'int8':
+        # Quantized kernels are CPU-only
+        options = {'model_path': MODEL_CONFIG['quantized_model_path'], 'device': 'cpu', 'dtype': PRECISIONS['int8'],
+                   'preprocessing': IMAGE_CONFIG['preprocessing'], 'flush_denormal': RUNTIME_CONFIG['flush_denormal']}
+    else:
+        options = {
+            'model_path': MODEL_CONFIG['serving_model_path'],
+            'device': device,
+            'dtype': PRECISIONS[precision],
+            'backend': MODEL_CONFIG['backend'],
+            'onnx_path': MODEL_CONFIG['serving_onnx_path'],
+            'preprocessing': IMAGE_CONFIG['preprocessing'],
+            'channels_last': MODEL_CONFIG['channels_last'],
+            'inference_mode': MODEL_CONFIG['inference_mode'],
+            'architecture': MODEL_CONFIG['architecture'],
+            'min_agreement': MODEL_CONFIG['bf16_min_agreement'],
+            'agreement_inputs': MODEL_CONFIG['bf16_agreement_dir'],
+            'flush_denormal': RUNTIME_CONFIG['flush_denormal']
+        }
+    if MODEL_CONFIG['gate_enabled']:
+        options.update(gate_path=MODEL_CONFIG['gate_path'], gate_threshold=MODEL_CONFIG['gate_threshold'],
+                       healthy_index=CLASS_NAMES.index('Healthy Rice Leaf'), on_gate=on_gate)
+    return options
+
+
+def worker_pool_options() -> dict:
+    """InferenceWorkerPool arguments; the pool rejects settings its workers can't run (int8, backends, gate)"""
+    options = model_options()
+    for name in ('device', 'onnx_path', 'gate_threshold', 'healthy_index', 'on_gate'):
+        options.pop(name, None)
+    return dict(options, num_workers=WORKER_CONFIG['num_workers'],
+                threads_per_worker=WORKER_CONFIG['threads_per_worker'])
+
+
+def ensure_directories():
+    """Create the runtime directories in PATHS; called by the entry points rather than on import"""
+    for path in PATHS.values():
+        os.makedirs(path, exist_ok=True)
@@ -0,0 +1,85 @@
+"""
+Selectable inference backends and model export
+"""
+import os
+import logging
+import torch
+
+from .optimization import outputs_match
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('eager', 'torchscript', 'compile', 'onnxruntime')
+
+
+def export_torchscript(model, path):
+    """Script, freeze and save an eval-mode model as a TorchScript artifact"""
+    scripted = torch.jit.freeze(torch.jit.script(model.eval()))
+    torch.jit.save(scripted, path)
+    logger.info(f"TorchScript model saved to {path}")
+    return path
+
+
+def export_onnx(model, path, input_size=(224, 224), opset_version=17):
+    """Export an eval-mode model to ONNX with a dynamic batch dimension"""
+    param = next(model.parameters())
+    dummy = torch.zeros(1, 3, *input_size, device=param.device, dtype=param.dtype)
+    torch.onnx.export(
+        model.eval(), dummy, path,
+        input_names=['input'], output_names=['logits'],
+        dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+        opset_version=opset_version,
+        dynamo=False
+    )
+    logger.info(f"ONNX model saved to {path}")
+    return path
+
+
+class OnnxRuntimeBackend:
+    """Run an exported ONNX model with onnxruntime on CPU, taking and returning torch tensors"""
+
+    def __init__(self, path, num_threads=None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        output = self.session.run(None, {self.input_name: batch.detach().cpu().float().numpy()})[0]
+        return torch.from_numpy(output)
+
+
+def _build(name, model, onnx_path):
+    if name == 'torchscript':
+        return torch.jit.freeze(torch.jit.script(model))
+    if name == 'compile':
+        return torch.compile(model)
+    if name == 'onnxruntime':
+        if not onnx_path or not os.path.exists(onnx_path):
+            raise FileNotFoundError(f"ONNX model not found at {onnx_path}; run the export command first")
+        return OnnxRuntimeBackend(onnx_path)
+    raise ValueError(f"Unknown backend '{name}', expected one of {BACKENDS}")
+
+
+def create_backend(name, model, onnx_path=None, atol=1e-3, rtol=1e-3):
+    """Wrap an eval-mode model in the requested backend.
+
+    Returns ``(runner, name)`` where ``runner`` maps an input batch to logits.
+    Any backend that fails to build, fails to run or disagrees with eager
+    outputs beyond tolerance falls back to the eager model, and the returned
+    name says which backend is actually in use.
+    """
+    if name == 'eager':
+        return model, 'eager'
+    try:
+        runner = _build(name, model, onnx_path)
+        # Also triggers compilation for torch.compile, so failures surface here rather than on a request
+        if not outputs_match(model, runner, input_shape=(2, 3, 224, 224), atol=atol, rtol=rtol):
+            raise RuntimeError("outputs differ from eager beyond tolerance")
+        logger.info(f"Using {name} inference backend")
+        return runner, name
+    except Exception as e:
+        logger.warning(f"Could not use {name} backend, falling back to eager: {e}")
+        return model, 'eager'
@@ -0,0 +1,173 @@
+"""
+Dynamic micro-batching for concurrent prediction requests
+"""
+import time
+import queue
+import threading
+import logging
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """Merge predictions from concurrent callers into batched forward passes.
+
+    Callers submit single images and get a Future back. A background thread
+    waits for the first pending request, keeps collecting until either
+    ``max_batch_size`` requests are queued or ``max_wait_ms`` has elapsed, and
+    runs them through ``predictor.predict_batch`` in one go. Pass
+    ``method='predict_logits'`` to get each caller its row of logits instead
+    of a class index. ``on_batch``, if given, is called with the size and
+    duration in seconds of every batch run, e.g. to record metrics, and
+    ``on_timings`` with the per-stage seconds the predictor reports through
+    its ``timings`` argument (``predict_logits`` and ``submit`` take one).
+
+    With ``max_in_flight`` above 1 the predictor must offer
+    ``submit(images)`` returning a Future of logits, as
+    ``InferenceWorkerPool`` does: up to that many batches are dispatched
+    without waiting for each other, so every worker process stays busy,
+    and requests arriving meanwhile gather into the next batch.
+    """
+
+    def __init__(self, predictor, max_batch_size=16, max_wait_ms=5.0, method='predict_batch', on_batch=None,
+                 max_in_flight=1, on_timings=None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if max_in_flight > 1 and (method != 'predict_logits' or not hasattr(predictor, 'submit')):
+            raise ValueError("max_in_flight > 1 needs method='predict_logits' and a predictor with submit()")
+        self.predictor = predictor
+        # Returns results directly, or a Future of them when batches are dispatched concurrently
+        self._predict = predictor.submit if max_in_flight > 1 else getattr(predictor, method)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.on_batch = on_batch
+        self.on_timings = on_timings
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the background batching thread"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+        return self
+
+    def close(self):
+        """Stop the batching thread after draining pending requests"""
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(_STOP)
+                self._thread.join()
+                self._thread = None
+
+    def submit(self, image):
+        """Queue an image for prediction and return a Future with its result"""
+        if self._thread is None:
+            self.start()
+        future = Future()
+        self._queue.put((image, future))
+        return future
+
+    def predict(self, image, timeout=None):
+        """Predict a single image through the batcher, blocking until the result is ready"""
+        return self.submit(image).result(timeout=timeout)
+
+    def _collect(self, first):
+        """Gather up to max_batch_size requests, waiting at most max_wait after the first"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Re-queue so the run loop stops after this batch
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            # Waiting for a free slot before collecting lets requests pile up into a bigger batch
+            self._slots.acquire()
+            batch = self._collect(item)
+
+            # Skip requests whose callers already gave up
+            batch = [(image, future) for image, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                self._slots.release()
+                continue
+
+            if self.max_in_flight > 1:
+                self._dispatch(batch)
+                continue
+            timings = {} if self.on_timings is not None else None
+            try:
+                start = time.perf_counter()
+                results = self._call([image for image, _ in batch], timings)
+                elapsed = time.perf_counter() - start
+            except Exception as e:
+                logger.error(f"Error during batched prediction: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                self._slots.release()
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            if self.on_batch is not None:
+                self.on_batch(len(batch), elapsed)
+            if timings is not None:
+                self.on_timings(timings)
+
+    def _call(self, images, timings):
+        return self._predict(images) if timings is None else self._predict(images, timings=timings)
+
+    def _dispatch(self, batch):
+        """Hand a batch to the predictor without waiting; results are routed back when its Future completes"""
+        start = time.perf_counter()
+        timings = {} if self.on_timings is not None else None
+
+        def done(pending):
+            self._slots.release()
+            error = pending.exception()
+            if error is not None:
+                logger.error(f"Error during batched prediction: {error}")
+                for _, future in batch:
+                    future.set_exception(error)
+                return
+            for (_, future), result in zip(batch, pending.result()):
+                future.set_result(result)
+            elapsed = time.perf_counter() - start
+            if self.on_batch is not None:
+                self.on_batch(len(batch), elapsed)
+            if timings is not None:
+                # Queueing in the pool plus the worker's forward pass
+                timings['worker'] = elapsed - timings.get('preprocess', 0.0)
+                self.on_timings(timings)
+
+        try:
+            pending = self._call([image for image, _ in batch], timings)
+        except Exception as e:
+            self._slots.release()
+            logger.error(f"Error during batched prediction: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        pending.add_done_callback(done)
@@ -0,0 +1,100 @@
+"""
+Image file datasets for offline tools (calibration, evaluation, bulk prediction)
+"""
+import os
+import logging
+import torch
+from PIL import Image
+from torch.utils.data import Dataset
+
+from .preprocessing import ImagePreprocessor
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+
+def find_images(root):
+    """List image files under a directory recursively, in a stable order"""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(dirpath, name))
+    return paths
+
+
+def find_labelled_images(root, class_names):
+    """List (path, label) pairs from a folder with one sub-folder per class name"""
+    samples = []
+    for entry in sorted(os.listdir(root)):
+        class_dir = os.path.join(root, entry)
+        if not os.path.isdir(class_dir):
+            continue
+        if entry not in class_names:
+            logger.warning(f"Skipping folder '{entry}': not a known class name")
+            continue
+        label = class_names.index(entry)
+        samples.extend((path, label) for path in find_images(class_dir))
+    return samples
+
+
+class ImageFileDataset(Dataset):
+    """Dataset that decodes and preprocesses image files for CNN_NeuralNet.
+
+    Items are ``(tensor, label)`` pairs; ``label`` is -1 when no labels were
+    given. Files that cannot be decoded raise, so wrap the loader accordingly
+    if the input may contain corrupt files.
+    """
+
+    def __init__(self, paths, labels=None, preprocessor=None):
+        self.paths = list(paths)
+        self.labels = list(labels) if labels is not None else None
+        self.preprocessor = preprocessor or ImagePreprocessor()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        with Image.open(self.paths[index]) as image:
+            tensor = self.preprocessor(image)
+        label = self.labels[index] if self.labels is not None else -1
+        return tensor, torch.tensor(label)
+
+
+class SurveyImageDataset(Dataset):
+    """Dataset for bulk prediction that tolerates unreadable files.
+
+    Items are ``(pixels, index, ok)`` where ``pixels`` is a uint8 (3, H, W)
+    tensor, a quarter of the size of normalized floats when passed back from
+    DataLoader workers; normalize them with ``ImagePreprocessor.normalize``.
+    Files that fail to decode yield zeros with ``ok=False`` instead of
+    aborting the whole run. ``image_transform``, if given, is applied to each
+    decoded PIL image before preprocessing (e.g. contrast enhancement); it
+    must be picklable to run in DataLoader workers.
+    """
+
+    def __init__(self, paths, preprocessor=None, start=0, image_transform=None):
+        self.paths = list(paths)
+        self.start = start
+        self.preprocessor = preprocessor or ImagePreprocessor()
+        self.image_transform = image_transform
+
+    def __len__(self):
+        return len(self.paths) - self.start
+
+    def __getitem__(self, index):
+        index += self.start
+        try:
+            with Image.open(self.paths[index]) as image:
+                if self.image_transform is not None:
+                    image = self.image_transform(image)
+                pixels = self.preprocessor.batch([image], normalize=False)[0].clone()
+            ok = True
+        except Exception as e:
+            logger.warning(f"Could not read {self.paths[index]}: {e}")
+            width, height = self.preprocessor.size
+            pixels = torch.zeros((3, height, width), dtype=torch.uint8)
+            ok = False
+        return pixels, index, ok
@@ -0,0 +1,178 @@
+"""
+Structured pruning and knowledge distillation of CNN_NeuralNet into lighter students and a healthy-leaf gate
+"""
+import logging
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+# ConvBlocks shared by CNN_NeuralNet and CNN_LiteNet, in forward order
+CONV_BLOCKS = ('conv1', 'conv2', 'res1.0', 'res1.1', 'conv3', 'conv4', 'res2.0', 'res2.1')
+
+# The last block of each residual branch must keep the channels of the block whose output it is added to
+RESIDUAL_OUTPUTS = {'res1.1': 'conv2', 'res2.1': 'conv4'}
+
+
+def _keep(tensor, index, dim):
+    return tensor.detach().index_select(dim, index).clone()
+
+
+@torch.no_grad()
+def prune_into(teacher, student):
+    """Initialize a narrower student from the teacher's strongest filters (structured L1-norm pruning).
+
+    For each ConvBlock the output channels whose filters have the largest L1
+    norm are kept, restricted to the input channels kept by the block before;
+    convolution, BatchNorm and classifier weights are copied for those
+    channels. Residual branches reuse the channels of the tensor they are
+    added to. The student must have the same block names with no more
+    channels per block. Returns the student.
+    """
+    teacher.eval()
+    kept = {}
+    inputs = torch.arange(next(teacher.parameters()).shape[1])
+    for name in CONV_BLOCKS:
+        t_conv, t_bn = teacher.get_submodule(name)[:2]
+        s_conv, s_bn = student.get_submodule(name)[:2]
+        weight = t_conv.weight.index_select(1, inputs)
+        if name in RESIDUAL_OUTPUTS:
+            outputs = kept[RESIDUAL_OUTPUTS[name]]
+        else:
+            scores = weight.abs().sum(dim=(1, 2, 3))
+            outputs = scores.topk(s_conv.out_channels).indices.sort().values
+        s_conv.weight.copy_(_keep(weight, outputs, 0))
+        s_conv.bias.copy_(_keep(t_conv.bias, outputs, 0))
+        for attr in ('weight', 'bias', 'running_mean', 'running_var'):
+            getattr(s_bn, attr).copy_(_keep(getattr(t_bn, attr), outputs, 0))
+        kept[name] = inputs = outputs
+    t_linear, s_linear = teacher.classifier[-1], student.classifier[-1]
+    # A student with different outputs (e.g. the healthy-leaf gate) keeps its own classifier
+    if s_linear.out_features == t_linear.out_features:
+        s_linear.weight.copy_(_keep(t_linear.weight, inputs, 1))
+        s_linear.bias.copy_(t_linear.bias)
+    logger.info(f"Initialized student from the teacher's top filters ({len(CONV_BLOCKS)} blocks pruned)")
+    return student
+
+
+def evaluate(model, loader, device='cpu'):
+    """Mean validation loss and accuracy over a loader of (images, labels) batches"""
+    model.eval()
+    with torch.no_grad():
+        outputs = [model.validation_step((images.to(device), labels.to(device))) for images, labels in loader]
+    return model.validation_epoch_end(outputs)
+
+
+def distill(student, teacher, train_loader, val_loader=None, epochs=10, lr=1e-3, weight_decay=1e-4,
+            temperature=4.0, alpha=0.7, device='cpu'):
+    """Train a student to match the teacher's softened outputs as well as the labels.
+
+    Uses ``ImageClassificationBase.distillation_step`` per batch and the
+    usual ``validation_step``/``epoch_end`` helpers per epoch. Returns one
+    result dict per epoch.
+    """
+    teacher = teacher.to(device).eval()
+    student = student.to(device)
+    optimizer = torch.optim.Adam(student.parameters(), lr=lr, weight_decay=weight_decay)
+    scheduler = torch.optim.lr_scheduler.OneCycleLR(optimizer, lr, epochs=epochs, steps_per_epoch=len(train_loader))
+    history = []
+    for epoch in range(epochs):
+        student.train()
+        train_losses = []
+        for images, labels in train_loader:
+            images, labels = images.to(device), labels.to(device)
+            with torch.no_grad():
+                teacher_logits = teacher(images)
+            loss = student.distillation_step((images, labels), teacher_logits, temperature, alpha)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            scheduler.step()
+            train_losses.append(loss.detach())
+        if val_loader is not None:
+            result = evaluate(student, val_loader, device)
+        else:
+            result = {'val_loss': float('nan'), 'val_acc': float('nan')}
+        result['train_loss'] = torch.stack(train_losses).mean().item()
+        student.epoch_end(epoch, result)
+        history.append(result)
+    return history
+
+
+def count_macs(model, input_size=(224, 224)):
+    """Multiply-accumulates of Conv2d and Linear layers for one image"""
+    macs = []
+
+    def hook(module, inputs, output):
+        if isinstance(module, nn.Conv2d):
+            per_output = module.in_channels // module.groups * module.kernel_size[0] * module.kernel_size[1]
+            macs.append(output.numel() * per_output)
+        else:
+            macs.append(output.numel() * module.in_features)
+
+    handles = [m.register_forward_hook(hook) for m in model.modules() if isinstance(m, (nn.Conv2d, nn.Linear))]
+    try:
+        param = next(model.parameters())
+        with torch.no_grad():
+            model.eval()(torch.zeros(1, 3, *input_size, device=param.device, dtype=param.dtype))
+    finally:
+        for handle in handles:
+            handle.remove()
+    return sum(macs)
+
+
+class HealthyVsRest(nn.Module):
+    """Collapse a classifier's logits to (diseased, healthy) logits with the same probabilities"""
+
+    def __init__(self, model, healthy_index):
+        super().__init__()
+        self.model = model
+        self.healthy_index = healthy_index
+
+    def forward(self, x):
+        logits = self.model(x)
+        healthy = logits[:, self.healthy_index]
+        rest = torch.cat([logits[:, :self.healthy_index], logits[:, self.healthy_index + 1:]], dim=1)
+        return torch.stack([rest.logsumexp(dim=1), healthy], dim=1)
+
+
+class HealthyLabels:
+    """Wrap a loader of (images, labels) batches, turning class labels into 1 = healthy, 0 = diseased"""
+
+    def __init__(self, loader, healthy_index):
+        self.loader = loader
+        self.healthy_index = healthy_index
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        for images, labels in self.loader:
+            yield images, (labels == self.healthy_index).long()
+
+
+def gate_report(gate, loader, thresholds=(0.8, 0.9, 0.95, 0.99)):
+    """Escalation and miss rates of a healthy-leaf gate at each confidence threshold.
+
+    ``loader`` yields (images, binary labels) batches as from HealthyLabels.
+    ``exit_rate`` is the share of images answered by the gate alone and
+    ``missed_disease_rate`` the share of diseased leaves among them wrongly
+    called healthy, i.e. the accuracy cost of the cascade.
+    """
+    gate.eval()
+    healthy, labels = [], []
+    with torch.no_grad():
+        for images, batch_labels in loader:
+            healthy.append(torch.softmax(gate(images), dim=1)[:, 1])
+            labels.append(batch_labels)
+    healthy, labels = torch.cat(healthy), torch.cat(labels).bool()
+    report = {'samples': len(labels), 'healthy_share': labels.float().mean().item() if len(labels) else None}
+    for threshold in thresholds:
+        exits = healthy >= threshold
+        diseased = int((~labels).sum())
+        report[f'threshold={threshold:g}'] = {
+            'exit_rate': exits.float().mean().item() if len(labels) else None,
+            'escalation_rate': (~exits).float().mean().item() if len(labels) else None,
+            'missed_disease_rate': int((exits & ~labels).sum()) / diseased if diseased else 0.0
+        }
+    return report
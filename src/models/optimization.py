@@ -0,0 +1,129 @@
+"""
+Inference-time graph optimizations for CNN_NeuralNet
+"""
+import copy
+import logging
+import itertools
+import threading
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+logger = logging.getLogger(__name__)
+
+_thread_flags = threading.local()
+
+
+def flush_denormal_in_thread():
+    """Flush denormal floats to zero in the calling thread, once per thread.
+
+    ``torch.set_flush_denormal`` only sets the FTZ/DAZ flags of the thread
+    that calls it, so it has to run in each thread that does forward passes
+    (micro-batcher, executor and Streamlit script threads), not just where
+    the runtime profile was applied. Returns whether it is supported.
+    """
+    if not hasattr(_thread_flags, 'flush_denormal'):
+        _thread_flags.flush_denormal = torch.set_flush_denormal(True)
+    return _thread_flags.flush_denormal
+
+
+def fold_batchnorm(model):
+    """Fold every Conv2d -> BatchNorm2d pair into a single Conv2d, in place.
+
+    At inference BatchNorm is a fixed per-channel affine transform, so it can be
+    baked into the preceding convolution's weights and bias. The BatchNorm is
+    replaced with ``nn.Identity`` to keep module indices stable. The following
+    ReLU is left as is: eager PyTorch has no fused float conv+relu kernel, and
+    the in-place ReLU already avoids an extra allocation.
+    """
+    model.eval()
+    folded = 0
+    for module, i in _conv_bn_pairs(model):
+        module[i] = fuse_conv_bn_eval(module[i], module[i + 1])
+        module[i + 1] = nn.Identity()
+        folded += 1
+    logger.info(f"Folded {folded} BatchNorm layers into convolutions")
+    return model
+
+
+def folded_layout(model):
+    """Give a model the module layout ``fold_batchnorm`` produces, without computing any weights, in place.
+
+    Used to build the skeleton a pre-folded checkpoint is loaded into: every
+    folded convolution gets an (uninitialized) bias and its BatchNorm becomes
+    ``nn.Identity``. Running the fold itself on the meta device would pull in
+    torch's meta decompositions, tens of MB per process for nothing.
+    """
+    for module, i in _conv_bn_pairs(model):
+        conv = module[i]
+        if conv.bias is None:
+            conv.bias = nn.Parameter(torch.empty(conv.out_channels, device=conv.weight.device))
+        module[i + 1] = nn.Identity()
+    return model
+
+
+def _conv_bn_pairs(model):
+    """(Sequential, index) of every Conv2d directly followed by a BatchNorm2d"""
+    pairs = []
+    for module in model.modules():
+        if isinstance(module, nn.Sequential):
+            pairs.extend((module, i) for i in range(len(module) - 1)
+                         if isinstance(module[i], nn.Conv2d) and isinstance(module[i + 1], nn.BatchNorm2d))
+    return pairs
+
+
+def is_folded(state_dict):
+    """Whether a state dict was saved with BatchNorm already folded (``convert-checkpoint --fold-bn``)"""
+    return not any(name.endswith('.running_mean') for name in state_dict)
+
+
+def outputs_match(reference, candidate, input_shape=(2, 3, 224, 224), atol=1e-3, rtol=1e-3, seed=0):
+    """Check that two models produce the same outputs on a random input within tolerance"""
+    generator = torch.Generator().manual_seed(seed)
+    param = next(reference.parameters())
+    dummy = torch.randn(input_shape, generator=generator).to(param.device, param.dtype)
+    with torch.no_grad():
+        expected = reference(dummy)
+        actual = candidate(dummy)
+    return torch.allclose(expected, actual, atol=atol, rtol=rtol)
+
+
+def optimize_for_inference(model, atol=1e-3, rtol=1e-3, input_shape=(1, 3, 64, 64)):
+    """Return a BatchNorm-folded copy of an eval-mode model, or the model itself if folding changes its outputs.
+
+    The copy shares every tensor with ``model`` instead of duplicating it, so
+    memory-mapped weights of layers that aren't folded stay mapped. Folded
+    convolutions always get new weights; load a checkpoint written by
+    ``convert-checkpoint --fold-bn`` to keep those mapped as well.
+    """
+    model.eval()
+    shared = {id(tensor): tensor for tensor in itertools.chain(model.parameters(), model.buffers())}
+    folded = fold_batchnorm(copy.deepcopy(model, shared))
+    # A small input exercises every folded layer while keeping the check cheap at start-up
+    if not outputs_match(model, folded, input_shape=input_shape, atol=atol, rtol=rtol):
+        logger.warning("BatchNorm folding changed model outputs beyond tolerance; using the unfused model")
+        return model
+    return folded
+
+
+def bf16_supported(device):
+    """Check whether a device runs bfloat16 natively, rather than emulating it slower than fp32"""
+    device = torch.device(device)
+    if device.type == 'cuda':
+        return torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+    if device.type != 'cpu':
+        return False
+    try:
+        # oneDNN's own check; true on CPUs with AVX512-BF16/AMX (or AVX512 cores it can use efficiently)
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def top1_agreement(reference, candidate):
+    """Fraction of samples on which two lists of logit batches pick the same class"""
+    agree = total = 0
+    for expected, actual in zip(reference, candidate):
+        agree += int((expected.argmax(dim=1) == actual.argmax(dim=1)).sum())
+        total += len(expected)
+    return agree / total if total else 1.0
@@ -0,0 +1,105 @@
+"""
+Turning logits into calibrated, structured prediction results
+"""
+import json
+import math
+import os
+import logging
+from dataclasses import dataclass, asdict, fields
+from typing import List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PredictionResult:
+    """Everything derived from one image's logits"""
+    class_index: int
+    class_name: Optional[str]
+    confidence: float
+    probabilities: List[float]
+    top_k: List[Tuple[str, float]]
+    entropy: float
+    uncertain: bool
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a result from ``to_dict`` output (e.g. a JSON response), ignoring extra keys"""
+        data = {f.name: data[f.name] for f in fields(cls)}
+        data['top_k'] = [tuple(item) for item in data['top_k']]
+        return cls(**data)
+
+
+def postprocess(logits, class_names: Optional[Sequence[str]] = None, temperature: float = 1.0, top_k: int = 3,
+                uncertainty_threshold: Optional[float] = None) -> PredictionResult:
+    """Build a PredictionResult from one row of logits.
+
+    Probabilities are ``softmax(logits / temperature)``. The result is marked
+    ``uncertain`` when the top probability is below ``uncertainty_threshold``.
+    Entropy is in nats; its maximum is ``log(num_classes)``.
+    """
+    # torch is imported on first use, so thin clients can rebuild results without loading it
+    import torch
+    import torch.nn.functional as F
+    logits = torch.as_tensor(logits, dtype=torch.float32)
+    probabilities = F.softmax(logits / temperature, dim=0)
+    entropy = -(probabilities * torch.log(probabilities.clamp_min(1e-12))).sum().item()
+    values, indices = probabilities.topk(min(top_k, len(probabilities)))
+    names = list(class_names) if class_names is not None else [str(i) for i in range(len(probabilities))]
+
+    class_index = int(indices[0])
+    confidence = float(values[0])
+    return PredictionResult(
+        class_index=class_index,
+        class_name=names[class_index],
+        confidence=confidence,
+        probabilities=probabilities.tolist(),
+        top_k=[(names[int(i)], float(v)) for v, i in zip(values, indices)],
+        entropy=entropy,
+        uncertain=uncertainty_threshold is not None and confidence < uncertainty_threshold
+    )
+
+
+def fit_temperature(logits, labels, max_iter: int = 100) -> float:
+    """Fit a softmax temperature on held-out logits by minimizing negative log-likelihood"""
+    import torch
+    import torch.nn.functional as F
+    logits = torch.as_tensor(logits, dtype=torch.float32)
+    labels = torch.as_tensor(labels, dtype=torch.long)
+    # Optimize log(T) so the temperature stays positive
+    log_t = torch.zeros(1, requires_grad=True)
+    optimizer = torch.optim.LBFGS([log_t], lr=0.1, max_iter=max_iter)
+
+    def closure():
+        optimizer.zero_grad()
+        loss = F.cross_entropy(logits / log_t.exp(), labels)
+        loss.backward()
+        return loss
+
+    optimizer.step(closure)
+    return float(log_t.exp())
+
+
+def save_temperature(temperature: float, path: str):
+    """Save a fitted temperature as JSON"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'temperature': temperature}, f)
+
+
+def load_temperature(path: str, default: float = 1.0) -> float:
+    """Load a fitted temperature, falling back to ``default`` if none has been fitted"""
+    if not path or not os.path.exists(path):
+        return default
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            temperature = float(json.load(f)['temperature'])
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Could not read temperature from {path}: {e}")
+        return default
+    if not math.isfinite(temperature) or temperature <= 0:
+        logger.warning(f"Ignoring invalid temperature {temperature} in {path}")
+        return default
+    return temperature
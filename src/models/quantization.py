@@ -0,0 +1,145 @@
+"""
+Post-training static int8 quantization for CNN_NeuralNet
+"""
+import io
+import logging
+import torch
+from torch.ao import quantization as tq
+from torch.ao.nn.quantized import FloatFunctional
+
+from .resnet_model import CNN_NeuralNet
+
+logger = logging.getLogger(__name__)
+
+# Names of every ConvBlock (Conv2d -> BatchNorm2d -> ReLU) in CNN_NeuralNet
+CONV_BLOCKS = ['conv1', 'conv2', 'res1.0', 'res1.1', 'conv3', 'conv4', 'res2.0', 'res2.1']
+
+
+def get_quantized_engine():
+    """Pick the best quantized kernel backend available on this CPU"""
+    engines = torch.backends.quantized.supported_engines
+    for engine in ('x86', 'fbgemm', 'qnnpack'):
+        if engine in engines:
+            return engine
+    raise RuntimeError("No quantized engine is available in this PyTorch build")
+
+
+class QuantizableCNN_NeuralNet(CNN_NeuralNet):
+    """CNN_NeuralNet with quant/dequant stubs and quantization-aware residual adds"""
+
+    def __init__(self, in_channels, num_diseases):
+        super().__init__(in_channels, num_diseases)
+        self.quant = tq.QuantStub()
+        self.dequant = tq.DeQuantStub()
+        self.skip_add1 = FloatFunctional()
+        self.skip_add2 = FloatFunctional()
+
+    def forward(self, x):
+        out = self.quant(x)
+        out = self.conv1(out)
+        out = self.conv2(out)
+        out = self.skip_add1.add(self.res1(out), out)
+        out = self.conv3(out)
+        out = self.conv4(out)
+        out = self.skip_add2.add(self.res2(out), out)
+        out = self.classifier(out)
+        return self.dequant(out)
+
+    def fuse_model(self):
+        """Fuse every Conv-BN-ReLU ConvBlock into a single module (eval mode only)"""
+        self.eval()
+        tq.fuse_modules(self, [[f'{name}.0', f'{name}.1', f'{name}.2'] for name in CONV_BLOCKS], inplace=True)
+        return self
+
+
+def prepare_model(state_dict=None, engine=None, in_channels=3, num_diseases=9):
+    """Build a fused, observer-instrumented model ready for calibration"""
+    engine = engine or get_quantized_engine()
+    torch.backends.quantized.engine = engine
+    model = QuantizableCNN_NeuralNet(in_channels, num_diseases)
+    if state_dict is not None:
+        model.load_state_dict(state_dict)
+    model.fuse_model()
+    model.qconfig = tq.get_default_qconfig(engine)
+    return tq.prepare(model)
+
+
+def calibrate(model, batches):
+    """Run calibration batches through a prepared model so observers record activation ranges"""
+    model.eval()
+    with torch.no_grad():
+        for batch in batches:
+            if isinstance(batch, (list, tuple)):
+                batch = batch[0]
+            model(batch)
+    return model
+
+
+def quantize_static(state_dict, calibration_batches, engine=None):
+    """Quantize fp32 CNN_NeuralNet weights to int8 using the given calibration batches"""
+    model = prepare_model(state_dict, engine=engine)
+    calibrate(model, calibration_batches)
+    return tq.convert(model)
+
+
+def build_quantized_model(engine=None, in_channels=3, num_diseases=9):
+    """Build an empty int8 model with the right structure to load a quantized state dict into"""
+    model = prepare_model(engine=engine, in_channels=in_channels, num_diseases=num_diseases)
+    # Give the observers a value so convert() doesn't warn; the real qparams come from load_state_dict
+    calibrate(model, [torch.zeros(1, in_channels, 64, 64)])
+    return tq.convert(model)
+
+
+def load_quantized_model(path, engine=None):
+    """Load an int8 checkpoint written by ``save_quantized_model``"""
+    model = build_quantized_model(engine=engine)
+    model.load_state_dict(torch.load(path, weights_only=True, map_location='cpu'))
+    model.eval()
+    return model
+
+
+def save_quantized_model(model, path):
+    """Save an int8 model's state dict"""
+    torch.save(model.state_dict(), path)
+    logger.info(f"Quantized model saved to {path}")
+
+
+def compare_models(reference, candidate, batches):
+    """Compare two models on the same batches.
+
+    Returns top-1 agreement, the largest absolute logit difference and, when the
+    batches carry labels (anything >= 0), the accuracy of each model.
+    """
+    agree = total = correct_ref = correct_cand = labelled = 0
+    max_diff = 0.0
+    reference.eval()
+    candidate.eval()
+    with torch.no_grad():
+        for batch in batches:
+            images, labels = batch if isinstance(batch, (list, tuple)) else (batch, None)
+            ref_out = reference(images).float()
+            cand_out = candidate(images).float()
+            ref_pred = ref_out.argmax(dim=1)
+            cand_pred = cand_out.argmax(dim=1)
+            agree += (ref_pred == cand_pred).sum().item()
+            total += len(images)
+            max_diff = max(max_diff, (ref_out - cand_out).abs().max().item())
+            if labels is not None:
+                mask = labels >= 0
+                labelled += mask.sum().item()
+                correct_ref += (ref_pred[mask] == labels[mask]).sum().item()
+                correct_cand += (cand_pred[mask] == labels[mask]).sum().item()
+
+    report = {'samples': total, 'top1_agreement': agree / total if total else 0.0, 'max_logit_diff': max_diff}
+    if labelled:
+        report['reference_accuracy'] = correct_ref / labelled
+        report['candidate_accuracy'] = correct_cand / labelled
+        report['accuracy_delta'] = report['candidate_accuracy'] - report['reference_accuracy']
+    return report
+
+
+def model_size_bytes(model):
+    """Size of a model's serialized state dict in bytes"""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
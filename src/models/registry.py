@@ -0,0 +1,83 @@
+"""
+Process-wide registry of loaded predictors
+"""
+import os
+import threading
+import logging
+import torch
+
+from .resnet_model import RiceDiseasePredictor
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """Thread-safe cache that loads each checkpoint once per process.
+
+    Predictors are keyed by (model path, device, dtype) plus any extra predictor
+    options, so every caller asking for the same configuration shares the same
+    eval-mode module instead of deserializing the checkpoint again.
+    """
+
+    def __init__(self):
+        self._predictors = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._warmed = set()
+
+    @staticmethod
+    def _make_key(model_path, device, dtype, options):
+        device = torch.device(device) if device is not None else torch.device(
+            'cuda' if torch.cuda.is_available() else 'cpu')
+        options = tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in options.items()))
+        return (os.path.abspath(model_path), str(device), str(dtype), options)
+
+    def get_predictor(self, model_path, device=None, dtype=torch.float32, **options):
+        """Return the shared predictor for this configuration, loading it on first use"""
+        key = self._make_key(model_path, device, dtype, options)
+        predictor = self._predictors.get(key)
+        if predictor is not None:
+            return predictor
+
+        # One lock per key so loading one checkpoint doesn't block lookups of another
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            predictor = self._predictors.get(key)
+            if predictor is None:
+                logger.info(f"Loading predictor for {key[0]} on {key[1]} ({key[2]})")
+                predictor = RiceDiseasePredictor(model_path=model_path, device=device, dtype=dtype, **options)
+                self._predictors[key] = predictor
+        return predictor
+
+    def warm_up(self, model_path, device=None, dtype=torch.float32, **options):
+        """Load the predictor and run a dummy forward pass ahead of the first request.
+
+        Only the first call per configuration does the forward pass, so this is
+        cheap to call on every Streamlit rerun.
+        """
+        predictor = self.get_predictor(model_path, device=device, dtype=dtype, **options)
+        key = self._make_key(model_path, device, dtype, options)
+        if key not in self._warmed:
+            predictor.warm_up()
+            self._warmed.add(key)
+        return predictor
+
+    def clear(self):
+        """Drop every cached predictor"""
+        with self._lock:
+            self._predictors.clear()
+            self._key_locks.clear()
+            self._warmed.clear()
+
+    def __len__(self):
+        return len(self._predictors)
+
+
+_registry = ModelRegistry()
+
+
+def get_registry():
+    """Get the process-wide model registry"""
+    return _registry
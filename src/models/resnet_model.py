@@ -1,15 +1,49 @@
 """
 Custom ResNet model for rice disease prediction
 """
+import os
+import math
+import time
+import hashlib
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torchvision import transforms
 import logging
+from PIL import Image
+
+from .preprocessing import create_preprocessor
+from .optimization import (optimize_for_inference, folded_layout, is_folded, bf16_supported, top1_agreement,
+                           flush_denormal_in_thread)
+from .backends import create_backend
+from .postprocessing import postprocess
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Inference precisions selectable from config, mapped to the dtype RiceDiseasePredictor expects
+PRECISIONS = {
+    'fp32': torch.float32,
+    'bf16': torch.bfloat16,  # fp32 weights run under bf16 autocast, after a hardware and agreement check
+    'int8': torch.qint8
+}
+
+def load_state_dict(model_path, map_location='cpu', mmap=True):
+    """Load a checkpoint's state dict, memory-mapping it when the file format allows.
+
+    With ``mmap=True`` tensor data stays in the OS page cache and is paged in on
+    first use instead of being read and copied up front, and processes or
+    containers loading the same file share those pages. Legacy (non-zip)
+    checkpoints can't be memory-mapped; convert them with the
+    ``convert-checkpoint`` CLI command. Until then they are loaded normally.
+    """
+    if mmap:
+        try:
+            return torch.load(model_path, weights_only=True, map_location=map_location, mmap=True)
+        except RuntimeError as e:
+            logger.warning(f"Could not memory-map {model_path} ({e}); loading it fully")
+    return torch.load(model_path, weights_only=True, map_location=map_location)
+
+
 class ImageClassificationBase(nn.Module):
     """Base class for image classification models"""
     
@@ -19,6 +53,15 @@ class ImageClassificationBase(nn.Module):
         loss = F.cross_entropy(out, labels)
         return loss
 
+    def distillation_step(self, batch, teacher_logits, temperature=4.0, alpha=0.7):
+        """Blend the KL divergence to a teacher's softened outputs with the usual cross-entropy"""
+        images, labels = batch
+        out = self(images)
+        soft = F.kl_div(F.log_softmax(out / temperature, dim=1), F.log_softmax(teacher_logits / temperature, dim=1),
+                        reduction='batchmean', log_target=True) * temperature ** 2
+        loss = alpha * soft + (1 - alpha) * F.cross_entropy(out, labels)
+        return loss
+
     def validation_step(self, batch):
         images, labels = batch
         out = self(images)
@@ -84,48 +127,366 @@ class CNN_NeuralNet(ImageClassificationBase):
         return out
 
 
+class CNN_LiteNet(ImageClassificationBase):
+    """Slim student of CNN_NeuralNet for low-end CPUs.
+
+    Same block layout and names as the teacher with half the channels, and
+    the first 4x pooling moved from conv2 to conv1. Only conv1 (3 -> 32
+    channels) still runs at the full 224x224 input resolution; conv2 and
+    res1 run at 56x56, where the teacher's 64 -> 128 conv2 runs at 224x224.
+    That is about 0.6 GMACs per image against the teacher's 5.9. Train it
+    with the ``distill`` CLI command.
+    """
+    
+    def __init__(self, in_channels, num_diseases, width=32):
+        super().__init__()
+        
+        self.conv1 = ConvBlock(in_channels, width, pool=True)
+        self.conv2 = ConvBlock(width, width * 2)
+        self.res1 = nn.Sequential(ConvBlock(width * 2, width * 2), ConvBlock(width * 2, width * 2))
+        
+        self.conv3 = ConvBlock(width * 2, width * 4, pool=True)
+        self.conv4 = ConvBlock(width * 4, width * 8, pool=True)
+        
+        self.res2 = nn.Sequential(ConvBlock(width * 8, width * 8), ConvBlock(width * 8, width * 8))
+        
+        self.classifier = nn.Sequential(
+            nn.AdaptiveAvgPool2d((1, 1)),
+            nn.Flatten(),
+            nn.Linear(width * 8, num_diseases)
+        )
+
+    def forward(self, x):
+        out = self.conv1(x)
+        out = self.conv2(out)
+        out = self.res1(out) + out
+        out = self.conv3(out)
+        out = self.conv4(out)
+        out = self.res2(out) + out
+        out = self.classifier(out)
+        return out
+
+
+class CNN_GateNet(CNN_LiteNet):
+    """Tiny healthy-vs-diseased gate for cascaded inference.
+
+    Takes the same 224x224 batch as the classifier and average-pools it to
+    112x112 first; at width 16 that is about 0.04 GMACs, under 1% of
+    CNN_NeuralNet. Output 1 is 'Healthy Rice Leaf', output 0 anything else.
+    Train it with the ``train-gate`` CLI command.
+    """
+    
+    def __init__(self, in_channels=3, num_outputs=2, width=16):
+        super().__init__(in_channels, num_outputs, width)
+        self.downsample = nn.AvgPool2d(2)
+
+    def forward(self, x):
+        return super().forward(self.downsample(x))
+
+
+# Model architectures selectable from config; checkpoints are plain state dicts of these classes
+ARCHITECTURES = {
+    'resnet9': CNN_NeuralNet,
+    'lite': CNN_LiteNet
+}
+
+
+def create_model(architecture='resnet9', in_channels=3, num_diseases=9):
+    """Build an untrained model of a registered architecture"""
+    if architecture not in ARCHITECTURES:
+        raise ValueError(f"Unknown architecture '{architecture}'; expected one of {', '.join(ARCHITECTURES)}")
+    return ARCHITECTURES[architecture](in_channels, num_diseases)
+
+
 class RiceDiseasePredictor:
-    """Main class for rice disease prediction"""
+    """Main class for rice disease prediction.
+
+    ``dtype=torch.bfloat16`` keeps fp32 weights and runs forward passes under
+    bf16 autocast. It is only enabled when the device has native bf16 support
+    and the bf16 model picks the same top-1 class as fp32 on at least
+    ``min_agreement`` of the agreement inputs (``agreement_inputs``, a list of
+    preprocessed batches or a folder of sample images, else seeded random
+    batches, which are near ties and say little); otherwise the predictor
+    stays in fp32. ``self.precision`` reports the mode actually in use.
+
+    With ``gate_path`` set, every batch first goes through a CNN_GateNet;
+    images it calls healthy with probability >= ``gate_threshold`` return
+    straight away and only the rest are escalated to the full model. Gated
+    images get logits that reproduce the gate's healthy probability (the
+    remaining mass spread evenly over the other classes). ``on_gate``, if
+    given, is called with ``(batch_size, escalated)`` after each batch.
+
+    ``flush_denormal`` flushes denormal floats to zero on CPU in every
+    thread that runs a forward pass.
+    """
     
-    def __init__(self, model_path='model/resnet_Model.pth', device=None):
-        self.device = device or torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    def __init__(self, model_path='model/resnet_Model.pth', device=None, dtype=torch.float32, fold_bn=True,
+                 backend='eager', onnx_path=None, mmap=True, class_names=None, temperature=1.0,
+                 uncertainty_threshold=None, preprocessing='pil', channels_last=False, inference_mode=True,
+                 min_agreement=0.99, agreement_inputs=None, architecture='resnet9', gate_path=None,
+                 gate_threshold=0.95, healthy_index=3, on_gate=None, flush_denormal=False):
+        self.device = torch.device(device) if device is not None else torch.device(
+            'cuda' if torch.cuda.is_available() else 'cpu')
+        self.autocast_dtype = None
+        self.precision = {torch.qint8: 'int8', torch.bfloat16: 'bf16'}.get(dtype, 'fp32')
+        if dtype == torch.bfloat16:
+            dtype = torch.float32
+        self.dtype = dtype
+        # Quantized models take float input and quantize it themselves
+        self.input_dtype = torch.float32 if dtype == torch.qint8 else dtype
+        self.fold_bn = fold_bn
+        self.mmap = mmap
+        self.architecture = architecture
+        # NHWC activations suit oneDNN convolution kernels; quantized models keep their own layout
+        self.channels_last = channels_last and dtype != torch.qint8
+        self.memory_format = torch.channels_last if self.channels_last else torch.preserve_format
+        # inference_mode also skips view/version-counter tracking that no_grad still does
+        self.grad_mode = torch.inference_mode if inference_mode else torch.no_grad
+        # Applied per thread on the first forward pass, since the flag is thread-local
+        self.flush_denormal = flush_denormal and self.device.type == 'cpu'
+        self.class_names = tuple(class_names) if class_names is not None else None
+        self.temperature = temperature
+        self.uncertainty_threshold = uncertainty_threshold
+        self.preprocessing = preprocessing
+        self.transform = self._get_transform(preprocessing)
         self.model = self._load_model(model_path)
-        self.transform = self._get_transform()
+        # Runs a batch through the selected backend; falls back to the eager model if the backend is unusable
+        if dtype == torch.qint8:
+            self.runner, self.backend = self.model, 'eager'
+        else:
+            onnx_path = onnx_path or os.path.splitext(model_path)[0] + '.onnx'
+            self.runner, self.backend = create_backend(backend, self.model, onnx_path=onnx_path)
+            if self.backend == 'onnxruntime':
+                # onnxruntime takes plain NCHW arrays
+                self.memory_format = torch.preserve_format
+        if self.precision == 'bf16' and not self._enable_bf16(min_agreement, agreement_inputs):
+            self.precision = 'fp32'
+        self.checkpoint_digest = self._file_digest(model_path)
+        # Position of 'Healthy Rice Leaf' in the classifier's outputs
+        self.healthy_index = healthy_index
+        self.gate_threshold = gate_threshold
+        self.on_gate = on_gate
+        self.gate = None
+        if gate_path is not None:
+            self.gate = self._load_gate(gate_path)
+            # Gated results differ from the full model's, so cached results must not be shared
+            self.checkpoint_digest += f"+gate{gate_threshold:g}-{self._file_digest(gate_path)[:16]}"
         
     def _load_model(self, model_path):
         """Load the trained model"""
         try:
-            model = CNN_NeuralNet(3, 9)
-            model = model.to(self.device)
-            model.load_state_dict(torch.load(model_path, weights_only=True, map_location=self.device))
+            if self.dtype == torch.qint8:
+                return self._load_quantized_model(model_path)
+            state_dict = load_state_dict(model_path, map_location=self.device, mmap=self.mmap)
+            prefolded = is_folded(state_dict)
+            # Build on the meta device and adopt the loaded tensors, so (mmap-backed) weights aren't copied
+            with torch.device('meta'):
+                model = create_model(self.architecture)
+                if prefolded:
+                    # Already checked against the unfolded model when the checkpoint was converted
+                    folded_layout(model)
+            model.load_state_dict(state_dict, assign=True)
             model.eval()
+            if self.fold_bn and not prefolded:
+                model = optimize_for_inference(model)
+            model = model.to(self.dtype, memory_format=self.memory_format)
             logger.info(f"Model loaded successfully from {model_path}")
             return model
         except Exception as e:
             logger.error(f"Error loading model: {e}")
             raise
     
-    def _get_transform(self):
+    def _load_gate(self, gate_path):
+        """Load the fp32 CNN_GateNet checkpoint produced by the ``train-gate`` CLI command"""
+        gate = CNN_GateNet()
+        gate.load_state_dict(load_state_dict(gate_path, map_location=self.device, mmap=self.mmap))
+        gate.eval()
+        if self.fold_bn:
+            # The gate halves its input first, so check folding on an input that survives its three poolings
+            gate = optimize_for_inference(gate, input_shape=(1, 3, 128, 128))
+        memory_format = torch.channels_last if self.channels_last else torch.preserve_format
+        logger.info(f"Healthy-leaf gate loaded from {gate_path} (threshold {self.gate_threshold:g})")
+        return gate.to(self.device, memory_format=memory_format)
+    
+    def _load_quantized_model(self, model_path):
+        """Load an int8 checkpoint produced by the ``quantize`` CLI command"""
+        from .quantization import load_quantized_model
+        if self.device.type != 'cpu':
+            raise ValueError("Quantized int8 inference is only supported on CPU")
+        if self.architecture != 'resnet9':
+            raise ValueError("Quantized int8 inference is only supported for the resnet9 architecture")
+        model = load_quantized_model(model_path)
+        logger.info(f"Quantized model loaded successfully from {model_path}")
+        return model
+    
+    @staticmethod
+    def _file_digest(path):
+        """Hash the checkpoint so results can be tied to the exact weights that produced them"""
+        digest = hashlib.blake2b()
+        # Chunked rather than hashlib.file_digest, which needs Python 3.11 (the image runs 3.9)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()[:32]
+    
+    def _get_transform(self, preprocessing='pil'):
         """Get image transformation pipeline"""
-        return transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
-        ])
+        return create_preprocessor(preprocessing, size=(224, 224), mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
+    
+    def _enable_bf16(self, min_agreement, agreement_inputs=None):
+        """Switch forward passes to bf16 autocast if the hardware supports it and top-1 predictions agree"""
+        if self.backend not in ('eager', 'compile'):
+            logger.warning(f"bf16 autocast is not supported with the {self.backend} backend; using fp32")
+            return False
+        if not bf16_supported(self.device):
+            logger.warning(f"{self.device} has no native bf16 support; using fp32")
+            return False
+        if isinstance(agreement_inputs, str):
+            folder, agreement_inputs = agreement_inputs, self.sample_batches(agreement_inputs)
+            if agreement_inputs:
+                logger.info(f"Checking bf16 agreement on {sum(len(b) for b in agreement_inputs)} images from {folder}")
+        if not agreement_inputs:
+            logger.warning("No sample images for the bf16 agreement check; using random noise, whose near-tie "
+                           "predictions say little about real leaves (set RICE_BF16_AGREEMENT_DIR)")
+            generator = torch.Generator().manual_seed(0)
+            agreement_inputs = [torch.randn(8, 3, 224, 224, generator=generator) for _ in range(2)]
+        batches = [self._to_input(batch) for batch in agreement_inputs]
+        reference = [self._run(batch) for batch in batches]
+        self.autocast_dtype = torch.bfloat16
+        agreement = top1_agreement(reference, [self._run(batch) for batch in batches])
+        self.autocast_dtype = None
+        if agreement < min_agreement:
+            logger.warning(f"bf16 top-1 agreement with fp32 is {agreement:.1%} (< {min_agreement:.1%}); using fp32")
+            return False
+        self.autocast_dtype = torch.bfloat16
+        logger.info(f"Using bf16 autocast (top-1 agreement with fp32: {agreement:.1%})")
+        return True
+    
+    def sample_batches(self, directory, limit=32, batch_size=8):
+        """Preprocessed batches of up to ``limit`` images from a folder, or [] if it has none"""
+        from .data import find_images
+        paths = find_images(directory)[:limit] if os.path.isdir(directory) else []
+        batches = []
+        for i in range(0, len(paths), batch_size):
+            images = []
+            for path in paths[i:i + batch_size]:
+                with Image.open(path) as image:
+                    images.append(image.convert('RGB'))
+            # batch() reuses one buffer per thread, so keep a copy of each batch
+            batches.append(self.transform.batch(images).clone())
+        return batches
+    
+    def _to_input(self, batch):
+        """Move a preprocessed batch to the model's device, dtype and memory format"""
+        return batch.to(self.device, self.input_dtype, memory_format=self.memory_format)
+    
+    def _forward(self, batch):
+        """Get logits for a prepared batch, through the healthy-leaf gate if one is loaded"""
+        # Every prediction path (direct, micro-batched, gated) comes through here
+        if self.flush_denormal:
+            flush_denormal_in_thread()
+        if self.gate is None:
+            return self._run(batch)
+        with self.grad_mode():
+            healthy = F.softmax(self.gate(batch.float()).float(), dim=1)[:, 1]
+        escalate = healthy < self.gate_threshold
+        escalated = int(escalate.sum())
+        if self.on_gate is not None:
+            self.on_gate(len(batch), escalated)
+        if escalated == len(batch):
+            return self._run(batch)
+        logits = self._gate_logits(healthy)
+        if escalated:
+            logits[escalate] = self._run(batch[escalate]).float()
+        return logits
+    
+    def _gate_logits(self, healthy):
+        """Log-probabilities giving the healthy class the gate's probability and splitting the rest evenly"""
+        num_classes = len(self.class_names) if self.class_names is not None else 9
+        healthy = healthy.clamp(1e-6, 1 - 1e-6)
+        logits = (torch.log1p(-healthy) - math.log(num_classes - 1)).unsqueeze(1).repeat(1, num_classes)
+        logits[:, self.healthy_index] = healthy.log()
+        return logits
+    
+    def _run(self, batch):
+        """Run a prepared batch through the backend without autograd bookkeeping"""
+        with self.grad_mode():
+            if self.autocast_dtype is None:
+                return self.runner(batch)
+            with torch.autocast(self.device.type, dtype=self.autocast_dtype):
+                return self.runner(batch)
     
     def predict(self, image):
         """Predict disease from image"""
         try:
             # Transform image
-            image_tensor = self.transform(image)
-            image_tensor = image_tensor.unsqueeze(0).to(self.device)
+            image_tensor = self._to_input(self.transform.batch([image]))
             
             # Make prediction
-            with torch.no_grad():
-                output = self.model(image_tensor)
-                predicted = output.argmax(dim=1).item()
+            output = self._forward(image_tensor)
+            predicted = output.argmax(dim=1).item()
             
             return predicted
         except Exception as e:
             logger.error(f"Error during prediction: {e}")
             raise
+
+    def predict_logits(self, images, timings=None):
+        """Get raw logits of shape (N, num_classes) for a list of images in a single forward pass.
+
+        If a ``timings`` dict is given, the seconds spent in the preprocess,
+        transfer (to device) and forward stages are added to it.
+        """
+        if timings is None:
+            return self._forward(self._to_input(self.transform.batch(images))).float().cpu()
+
+        start = time.perf_counter()
+        batch = self.transform.batch(images)
+        preprocessed = time.perf_counter()
+        batch = self._to_input(batch)
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+        transferred = time.perf_counter()
+        output = self._forward(batch).float().cpu()
+        finished = time.perf_counter()
+        timings['preprocess'] = timings.get('preprocess', 0.0) + preprocessed - start
+        timings['transfer'] = timings.get('transfer', 0.0) + transferred - preprocessed
+        timings['forward'] = timings.get('forward', 0.0) + finished - transferred
+        return output
+
+    def predict_pixels(self, pixels):
+        """Get logits for a uint8 (N, 3, H, W) batch from ``ImagePreprocessor.batch(..., normalize=False)``"""
+        return self._forward(self._to_input(self.transform.normalize(pixels))).float().cpu()
+
+    def predict_results(self, images, top_k=3):
+        """Get a PredictionResult (class, probabilities, top-k, entropy, uncertainty) per image from one forward pass"""
+        if len(images) == 0:
+            return []
+        try:
+            return [
+                postprocess(row, self.class_names, temperature=self.temperature, top_k=top_k,
+                            uncertainty_threshold=self.uncertainty_threshold)
+                for row in self.predict_logits(images)
+            ]
+        except Exception as e:
+            logger.error(f"Error during prediction: {e}")
+            raise
+
+    def predict_batch(self, images):
+        """Predict diseases for a list of images in a single forward pass"""
+        if len(images) == 0:
+            return []
+        try:
+            return self.predict_logits(images).argmax(dim=1).tolist()
+        except Exception as e:
+            logger.error(f"Error during batch prediction: {e}")
+            raise
+
+    def warm_up(self):
+        """Run a dummy forward pass so the first real request doesn't pay for lazy initialisation"""
+        batch = self._to_input(torch.zeros(1, 3, 224, 224))
+        if self.gate is not None:
+            # Warm both stages directly, keeping the dummy batch out of the escalation counts
+            with self.grad_mode():
+                self.gate(batch.float())
+        self._run(batch)
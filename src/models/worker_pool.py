@@ -0,0 +1,246 @@
+"""
+Multi-process inference pool sharing one copy of the model weights
+"""
+import os
+import time
+import queue
+import itertools
+import threading
+import logging
+from concurrent.futures import Future
+
+import torch
+import torch.multiprocessing as mp
+from PIL import Image
+
+from .resnet_model import RiceDiseasePredictor
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_main(model, mean, std, num_threads, flush_denormal, channels_last, inference_mode, bf16,
+                 requests, results):
+    """Worker loop: normalize uint8 batches and run them through the shared model"""
+    torch.set_num_threads(num_threads)
+    grad_mode = torch.inference_mode if inference_mode else torch.no_grad
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
+    if flush_denormal:
+        # Thread-local flag; the worker runs every forward pass on this thread
+        torch.set_flush_denormal(True)
+    model.eval()
+    while True:
+        item = requests.get()
+        if item is None:
+            return
+        request_id, pixels = item
+        try:
+            with grad_mode(), torch.autocast('cpu', dtype=torch.bfloat16, enabled=bf16):
+                # Same arithmetic as ImagePreprocessor, applied on the worker side
+                batch = torch.from_numpy(pixels).float().div_(255).sub_(mean).div_(std)
+                logits = model(batch.contiguous(memory_format=memory_format)).float()
+            results.put((request_id, logits.numpy(), None))
+        except Exception as e:
+            results.put((request_id, None, f"{type(e).__name__}: {e}"))
+
+
+class InferenceWorkerPool:
+    """Pre-started pool of inference processes, each fed through its own queue.
+
+    The checkpoint is loaded once in the parent and its tensors are moved to
+    shared memory, so each worker maps the same pages instead of holding its
+    own copy of the weights. Images are preprocessed to uint8 in the caller,
+    which keeps queue traffic at ~150 KB per image, and normalized in the
+    worker. The pool exposes the same ``predict_logits``/``predict_batch``
+    interface as ``RiceDiseasePredictor``, so it can sit behind a
+    ``MicroBatcher`` or the prediction cache unchanged.
+
+    Each worker has its own request queue and every request goes to the
+    worker with the fewest in flight, so the pool knows which requests a
+    worker holds. When a worker dies, those requests fail and the worker is
+    restarted; the others carry on.
+
+    Workers run the shared eager model in fp32 or, when the predictor's
+    hardware and agreement checks pass, under bf16 autocast.
+    Configurations that need per-process state the workers don't have
+    (int8, TorchScript/ONNX backends, the healthy-leaf gate) raise
+    ``ValueError`` rather than being silently served in fp32.
+    """
+
+    # Seconds between checks that every worker is still alive
+    health_interval = 1.0
+
+    def __init__(self, model_path, num_workers=2, threads_per_worker=1, fold_bn=True, start_method=None,
+                 preprocessing='pil', architecture='resnet9', flush_denormal=False, dtype=torch.float32,
+                 backend='eager', gate_path=None, channels_last=False, inference_mode=True, min_agreement=0.99,
+                 agreement_inputs=None):
+        if dtype == torch.qint8:
+            raise ValueError("The worker pool can't serve int8 models; serve them in-process")
+        if backend != 'eager':
+            raise ValueError(f"The worker pool only runs the eager backend, not {backend}; serve it in-process")
+        if gate_path is not None:
+            raise ValueError("The worker pool can't run the healthy-leaf gate; serve it in-process")
+        predictor = RiceDiseasePredictor(model_path=model_path, device='cpu', fold_bn=fold_bn, dtype=dtype,
+                                         preprocessing=preprocessing, architecture=architecture,
+                                         channels_last=channels_last, min_agreement=min_agreement,
+                                         agreement_inputs=agreement_inputs)
+        self.checkpoint_digest = predictor.checkpoint_digest
+        # 'bf16' only if the predictor's hardware and agreement checks passed
+        self.precision = predictor.precision
+        self.backend = 'eager'
+        self.preprocessing = preprocessing
+        self.transform = predictor.transform
+        self.model = predictor.model.share_memory()
+        self.num_workers = num_workers
+
+        if start_method is None:
+            # forkserver children start from a clean interpreter, avoiding fork-after-OpenMP hangs
+            start_method = 'forkserver' if 'forkserver' in mp.get_all_start_methods() else 'spawn'
+        self._ctx = mp.get_context(start_method)
+        self._worker_args = (self.model, self.transform.mean, self.transform.std, threads_per_worker, flush_denormal,
+                             predictor.channels_last, inference_mode, self.precision == 'bf16')
+        self._results = self._ctx.Queue()
+        # request id -> (future, index of the worker handling it)
+        self._pending = {}
+        self._in_flight = [0] * num_workers
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._workers = [None] * num_workers
+        self._queues = [None] * num_workers
+        self.restarts = 0
+        for i in range(num_workers):
+            self._start_worker(i)
+        self._collector = threading.Thread(target=self._collect, name="inference-results", daemon=True)
+        self._collector.start()
+        logger.info(f"Started {num_workers} inference workers with {threads_per_worker} thread(s) each "
+                    f"(pid {os.getpid()}, {start_method})")
+
+    def _start_worker(self, index):
+        self._queues[index] = self._ctx.Queue()
+        self._workers[index] = self._ctx.Process(
+            target=_worker_main,
+            args=self._worker_args + (self._queues[index], self._results),
+            name=f"inference-worker-{index}",
+            daemon=True
+        )
+        self._workers[index].start()
+
+    def _check_workers(self):
+        """Fail the requests of any worker that died and start a replacement"""
+        failed = []
+        with self._lock:
+            if self._closed:
+                return
+            for index, worker in enumerate(self._workers):
+                if worker.is_alive():
+                    continue
+                lost = [request_id for request_id, (_, owner) in self._pending.items() if owner == index]
+                failed.extend(self._pending.pop(request_id)[0] for request_id in lost)
+                logger.error(f"Inference worker {index} exited with code {worker.exitcode}; "
+                             f"failing {len(lost)} request(s) and restarting it")
+                self._in_flight[index] = 0
+                # Nobody will read what is left in the dead worker's queue; don't wait on it at exit
+                self._queues[index].cancel_join_thread()
+                self._queues[index].close()
+                self._start_worker(index)
+                self.restarts += 1
+        for future in failed:
+            future.set_exception(RuntimeError("Inference worker exited while handling the request"))
+
+    def _collect(self):
+        """Resolve futures as workers return results, and replace workers that die"""
+        last_check = time.monotonic()
+        while True:
+            # Checked on a timer rather than only when idle, so a dead worker is noticed under load too
+            if time.monotonic() - last_check >= self.health_interval:
+                self._check_workers()
+                last_check = time.monotonic()
+            try:
+                item = self._results.get(timeout=self.health_interval)
+            except queue.Empty:
+                continue
+            if item is None:
+                return
+            request_id, logits, error = item
+            with self._lock:
+                future, index = self._pending.pop(request_id, (None, None))
+                if future is not None:
+                    self._in_flight[index] -= 1
+            if future is None:
+                continue
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(torch.from_numpy(logits))
+
+    def submit(self, images, timings=None):
+        """Queue a list of images and return a Future with their (N, num_classes) logits"""
+        start = time.perf_counter()
+        pixels = self.transform.batch(images, normalize=False).numpy().copy()
+        if timings is not None:
+            timings['preprocess'] = timings.get('preprocess', 0.0) + time.perf_counter() - start
+        future = Future()
+        request_id = next(self._ids)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Worker pool closed")
+            index = min(range(self.num_workers), key=self._in_flight.__getitem__)
+            self._pending[request_id] = (future, index)
+            self._in_flight[index] += 1
+            # Under the lock, so a restart can't swap the queue between picking the worker and queueing
+            self._queues[index].put((request_id, pixels))
+        return future
+
+    def predict_logits(self, images, timeout=None, timings=None):
+        """Get logits for a list of images, blocking until a worker has processed them.
+
+        If a ``timings`` dict is given, the seconds spent preprocessing and
+        waiting for a worker (queueing plus forward pass) are added to it.
+        """
+        if len(images) == 0:
+            return torch.empty(0, 0)
+        future = self.submit(images, timings=timings)
+        start = time.perf_counter()
+        logits = future.result(timeout=timeout)
+        if timings is not None:
+            timings['worker'] = timings.get('worker', 0.0) + time.perf_counter() - start
+        return logits
+
+    def predict_batch(self, images, timeout=None):
+        """Predict class indices for a list of images"""
+        if len(images) == 0:
+            return []
+        return self.predict_logits(images, timeout=timeout).argmax(dim=1).tolist()
+
+    def predict(self, image, timeout=None):
+        """Predict the class index of a single image"""
+        return self.predict_batch([image], timeout=timeout)[0]
+
+    def warm_up(self):
+        """Run one dummy request through every worker (each idle worker takes one)"""
+        dummy = [Image.new('RGB', (224, 224))]
+        futures = [self.submit(dummy) for _ in range(self.num_workers)]
+        for future in futures:
+            future.result()
+
+    def close(self):
+        """Stop the workers and the result collector"""
+        with self._lock:
+            self._closed = True
+        for requests in self._queues:
+            requests.put(None)
+        for worker, requests in zip(self._workers, self._queues):
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+                requests.cancel_join_thread()
+        self._results.put(None)
+        self._collector.join(timeout=10)
+        self._fail_pending(RuntimeError("Worker pool closed"))
+
+    def _fail_pending(self, error):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future, _ in pending.values():
+            future.set_exception(error)
+
@@ -0,0 +1,380 @@
+"""
+Standalone asyncio HTTP inference service
+
+Endpoints:
+    POST /predict        raw image bytes in the body
+    POST /predict/batch  JSON {"images": ["<base64>", ...]}
+    GET  /healthz        liveness/readiness
+    GET  /metrics        Prometheus text format
+
+Run with: python src/server.py
+"""
+import io
+import json
+import time
+import base64
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from models.registry import get_registry
+from models.batching import MicroBatcher
+from models.postprocessing import postprocess, load_temperature
+from models.worker_pool import InferenceWorkerPool
+from services.treatment_service import TreatmentService
+from services.prediction_cache import PredictionCache
+from services.upload_archive import UploadArchive
+from utils.device_utils import get_device, configure_runtime, autotune_threads
+from utils.image_utils import open_image, decode_image, validate_image, enhance_images
+from utils.metrics import MetricsRegistry, get_metrics, BATCH_SIZE_BUCKETS
+from config.settings import (
+    CLASS_NAMES,
+    RUNTIME_CONFIG,
+    BATCH_CONFIG,
+    CACHE_CONFIG,
+    ARCHIVE_CONFIG,
+    IMAGE_CONFIG,
+    SERVER_CONFIG,
+    WORKER_CONFIG,
+    PREDICTION_CONFIG,
+    TREATMENT_CONFIG,
+    LOGGING_CONFIG,
+    ensure_directories,
+    model_options,
+    worker_pool_options
+)
+
+logging.basicConfig(**LOGGING_CONFIG)
+logger = logging.getLogger(__name__)
+
+ROUTES = ('/predict', '/predict/batch', '/healthz', '/metrics')
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 422: 'Unprocessable Entity', 500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+    """Error returned to the client with a status code"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class InferenceService:
+    """Decode, predict and look up treatment for uploaded images"""
+
+    def __init__(self, predictor, treatment_service: TreatmentService, cache: PredictionCache = None,
+                 batcher: MicroBatcher = None, temperature: float = 1.0, enhance: bool = False,
+                 metrics: MetricsRegistry = None, archive: UploadArchive = None):
+        self.predictor = predictor
+        self.metrics = metrics or get_metrics()
+        self.temperature = temperature
+        self.enhance = enhance
+        # Enhanced and raw predictions of the same upload must not share cache entries
+        self.cache_digest = PredictionCache.fingerprint(predictor, decode_size=IMAGE_CONFIG['decode_size'],
+                                                        enhance=enhance)
+        self.treatment_service = treatment_service
+        self.cache = cache
+        self.batcher = batcher
+        self.archive = archive
+
+    def _decode(self, data: bytes):
+        if len(data) > IMAGE_CONFIG['max_file_size']:
+            raise HTTPError(413, f"Image larger than {IMAGE_CONFIG['max_file_size']} bytes")
+        with self.metrics.stage('validate'):
+            try:
+                image = open_image(io.BytesIO(data))
+            except Exception:
+                raise HTTPError(422, "Could not decode image")
+            if not validate_image(image):
+                raise HTTPError(422, "Image is too small or too large")
+        with self.metrics.stage('decode'):
+            return decode_image(image, IMAGE_CONFIG['decode_size'])
+
+    def _predict_logits(self, images):
+        """Run images through the predictor directly, recording its stage timings"""
+        timings = {}
+        with self.metrics.stage('inference'):
+            logits = self.predictor.predict_logits(images, timings=timings)
+        self.metrics.record_timings(timings)
+        self.metrics.observe('rice_batch_size', len(images), buckets=BATCH_SIZE_BUCKETS)
+        return logits
+
+    def _result(self, logits) -> Dict:
+        with self.metrics.stage('postprocess'):
+            result = postprocess(
+                logits,
+                CLASS_NAMES,
+                temperature=self.temperature,
+                top_k=PREDICTION_CONFIG['top_k'],
+                uncertainty_threshold=PREDICTION_CONFIG['uncertainty_threshold']
+            ).to_dict()
+        # No treatment for low-confidence images; clients should ask for a retake instead
+        with self.metrics.stage('treatment'):
+            result['treatment'] = (None if result['uncertain']
+                                   else self.treatment_service.get_treatment(result['class_name']))
+        return result
+
+    def _archive(self, data: bytes, result: Dict, seconds: float, **timings):
+        """Queue an upload and its prediction for the archive; never blocks the request"""
+        if self.archive is not None:
+            prediction = {k: v for k, v in result.items() if k != 'treatment'}
+            self.archive.submit(data, prediction, timings=dict(timings, total_ms=seconds * 1000), source='api',
+                                model=self.predictor.checkpoint_digest, enhance=self.enhance)
+
+    def _lookup(self, data: bytes):
+        """Cache key and cached logits (None on a miss) for an upload"""
+        if self.cache is None:
+            return None, None
+        key = self.cache.make_key(data, self.cache_digest)
+        cached = self.cache.get(key)
+        self.metrics.inc('rice_cache_requests_total', result='miss' if cached is None else 'hit')
+        return key, None if cached is None else cached.logits
+
+    def _begin(self, data: bytes):
+        """Look the upload up in the cache and decode it on a miss; returns (key, cached logits, image)"""
+        key, logits = self._lookup(data)
+        if logits is not None:
+            return key, logits, None
+        image = self._decode(data)
+        if self.enhance:
+            with self.metrics.stage('enhance'):
+                image = enhance_images([image], parallel=False)[0]
+        return key, None, image
+
+    def _finish(self, data: bytes, key, logits, start: float, store: bool = True) -> Dict:
+        if key is not None and store:
+            self.cache.put(key, int(logits.argmax()), logits.tolist())
+        result = self._result(logits)
+        self._archive(data, result, time.perf_counter() - start)
+        return result
+
+    def predict(self, data: bytes) -> Dict:
+        """Predict a single encoded image, through the cache and micro-batcher when configured"""
+        start = time.perf_counter()
+        key, logits, image = self._begin(data)
+        if logits is not None:
+            return self._finish(data, key, logits, start, store=False)
+        if self.batcher is not None:
+            # Queueing plus the shared forward pass; the batcher records batch sizes itself
+            with self.metrics.stage('inference'):
+                logits = self.batcher.predict(image)
+        else:
+            logits = self._predict_logits([image])[0]
+        return self._finish(data, key, logits, start)
+
+    async def predict_async(self, data: bytes, executor) -> Dict:
+        """Like ``predict``, but wait for the micro-batcher on the event loop rather than in an executor thread.
+
+        Decoding and postprocessing still run in ``executor``; only the wait
+        for the batched forward pass is freed from it, so the number of
+        requests a batch can merge is not capped by the executor's size.
+        """
+        loop = asyncio.get_running_loop()
+        if self.batcher is None:
+            return await loop.run_in_executor(executor, self.predict, data)
+        start = time.perf_counter()
+        key, logits, image = await loop.run_in_executor(executor, self._begin, data)
+        if logits is not None:
+            return await loop.run_in_executor(executor, self._finish, data, key, logits, start, False)
+        with self.metrics.stage('inference'):
+            logits = await asyncio.wrap_future(self.batcher.submit(image))
+        return await loop.run_in_executor(executor, self._finish, data, key, logits, start)
+
+    def predict_many(self, images: List[bytes]) -> List[Dict]:
+        """Predict several encoded images in one forward pass, skipping those already in the cache"""
+        start = time.perf_counter()
+        lookups = [self._lookup(data) for data in images]
+        misses = [i for i, (_, logits) in enumerate(lookups) if logits is None]
+        logits = {i: cached for i, (_, cached) in enumerate(lookups) if cached is not None}
+        if misses:
+            decoded = [self._decode(images[i]) for i in misses]
+            if self.enhance:
+                with self.metrics.stage('enhance'):
+                    decoded = enhance_images(decoded)
+            for i, row in zip(misses, self._predict_logits(decoded)):
+                key = lookups[i][0]
+                if key is not None:
+                    self.cache.put(key, int(row.argmax()), row.tolist())
+                logits[i] = row
+        results = [self._result(logits[i]) for i in range(len(images))]
+        elapsed = time.perf_counter() - start
+        for data, result in zip(images, results):
+            self._archive(data, result, elapsed, batch_size=len(images))
+        return results
+
+
+class InferenceServer:
+    """Small HTTP/1.1 server on asyncio streams; inference runs in a thread pool"""
+
+    def __init__(self, service: InferenceService, host='0.0.0.0', port=8000, max_body_size=10 * 1024 * 1024,
+                 max_batch_images=64, workers=4):
+        self.service = service
+        self.host = host
+        self.port = port
+        self.max_body_size = max_body_size
+        self.max_batch_images = max_batch_images
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='inference')
+        self.metrics = service.metrics
+        self._server = None
+
+    async def start(self):
+        """Start listening; returns once the socket is bound"""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Inference service listening on {self.host}:{self.port}")
+        return self
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self.executor.shutdown(wait=False)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                keep_alive = await self._handle_request(request_line, reader, writer)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, request_line, reader, writer):
+        start = time.perf_counter()
+        path = '-'
+        keep_alive = False
+        try:
+            try:
+                method, target, version = request_line.decode('latin-1').split()
+            except ValueError:
+                raise HTTPError(400, "Malformed request line")
+            path = target.split('?', 1)[0]
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+            length = headers.get('content-length') or '0'
+            if not length.isdecimal():
+                # Without a usable length the rest of the stream can't be framed
+                keep_alive = False
+                raise HTTPError(400, "Content-Length must be a non-negative integer")
+            length = int(length)
+            if length > self.max_body_size:
+                keep_alive = False
+                raise HTTPError(413, f"Body larger than {self.max_body_size} bytes")
+            with self.metrics.stage('read'):
+                body = await reader.readexactly(length) if length else b''
+
+            status, content_type, payload = await self._route(method, path, body)
+        except HTTPError as e:
+            status, content_type, payload = e.status, 'application/json', json.dumps({'error': str(e)}).encode()
+        except Exception as e:
+            logger.error(f"Error handling {path}: {e}")
+            status, content_type, payload = 500, 'application/json', json.dumps({'error': 'Internal error'}).encode()
+
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + payload)
+        await writer.drain()
+        # Unknown paths share one label so scanners can't blow up metric cardinality
+        route = path if path in ROUTES else 'other'
+        self.metrics.inc('rice_http_requests_total', path=route, status=status)
+        self.metrics.observe('rice_http_request_seconds', time.perf_counter() - start, path=route)
+        return keep_alive
+
+    async def _route(self, method, path, body):
+        loop = asyncio.get_running_loop()
+        if path == '/healthz':
+            return 200, 'application/json', b'{"status": "ok"}'
+        if path == '/metrics':
+            return 200, 'text/plain; version=0.0.4', self.metrics.render().encode()
+        if path == '/predict':
+            if method != 'POST':
+                raise HTTPError(405, "Use POST")
+            if not body:
+                raise HTTPError(400, "Empty body; send the image bytes")
+            result = await self.service.predict_async(body, self.executor)
+            return 200, 'application/json', json.dumps(result, ensure_ascii=False).encode()
+        if path == '/predict/batch':
+            if method != 'POST':
+                raise HTTPError(405, "Use POST")
+            try:
+                images = [base64.b64decode(item) for item in json.loads(body)['images']]
+            except (ValueError, KeyError, TypeError):
+                raise HTTPError(400, 'Expected JSON {"images": ["<base64>", ...]}')
+            if not images or len(images) > self.max_batch_images:
+                raise HTTPError(400, f"Send between 1 and {self.max_batch_images} images")
+            results = await loop.run_in_executor(self.executor, self.service.predict_many, images)
+            return 200, 'application/json', json.dumps({'predictions': results}, ensure_ascii=False).encode()
+        raise HTTPError(404, f"No route for {path}")
+
+
+def build_service() -> InferenceService:
+    """Wire the predictor, treatment service, cache and batcher from settings"""
+    configure_runtime(**RUNTIME_CONFIG)
+    if WORKER_CONFIG['num_workers'] > 0:
+        predictor = InferenceWorkerPool(**worker_pool_options())
+        predictor.warm_up()
+    else:
+        predictor = get_registry().warm_up(**model_options(get_device(), on_gate=get_metrics().record_gate))
+    if RUNTIME_CONFIG['num_threads'] == 'auto' and WORKER_CONFIG['num_workers'] == 0:
+        autotune_threads(predictor.warm_up)
+    batcher = None
+    if BATCH_CONFIG['enabled']:
+        batcher = MicroBatcher(predictor, max_batch_size=BATCH_CONFIG['max_batch_size'],
+                               max_wait_ms=BATCH_CONFIG['max_wait_ms'], method='predict_logits',
+                               on_batch=get_metrics().record_batch,
+                               on_timings=get_metrics().record_timings,
+                               max_in_flight=max(1, WORKER_CONFIG['num_workers'])).start()
+    archive = None
+    if ARCHIVE_CONFIG['enabled']:
+        archive = UploadArchive(ARCHIVE_CONFIG['root'], max_queue=ARCHIVE_CONFIG['max_queue'],
+                                roll_up_seconds=ARCHIVE_CONFIG['roll_up_seconds'],
+                                on_event=lambda result: get_metrics().inc('rice_archive_uploads_total',
+                                                                          result=result)).start()
+    return InferenceService(predictor, TreatmentService(**TREATMENT_CONFIG), cache=PredictionCache(**CACHE_CONFIG),
+                            batcher=batcher, temperature=load_temperature(PREDICTION_CONFIG['temperature_path']),
+                            enhance=IMAGE_CONFIG['enhance'], archive=archive)
+
+
+def main():
+    ensure_directories()
+    service = build_service()
+    server = InferenceServer(
+        service,
+        host=SERVER_CONFIG['host'],
+        port=SERVER_CONFIG['port'],
+        max_body_size=SERVER_CONFIG['max_body_size'],
+        max_batch_images=SERVER_CONFIG['max_batch_images'],
+        workers=SERVER_CONFIG['workers']
+    )
+    try:
+        asyncio.run(server.serve_forever())
+    finally:
+        if service.archive is not None:
+            service.archive.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Resumable bulk prediction over large image collections
+"""
+import os
+import csv
+import json
+import glob
+import hashlib
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+ROW_FIELDS = ['path', 'class_index', 'class_name', 'confidence', 'entropy', 'uncertain', 'top_k', 'error']
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+
+def read_manifest(path: str) -> List[str]:
+    """Read image paths from a manifest: one path per line, or a CSV with a ``path`` column.
+
+    Relative paths are resolved against the manifest's folder; blank lines and
+    lines starting with ``#`` are ignored.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.lower().endswith('.csv'):
+            entries = [row['path'] for row in csv.DictReader(f)]
+        else:
+            entries = [line.strip() for line in f]
+    entries = [entry for entry in entries if entry and not entry.startswith('#')]
+    return [entry if os.path.isabs(entry) else os.path.join(base, entry) for entry in entries]
+
+
+def inputs_digest(paths: Sequence[str]) -> str:
+    """Hash the ordered input list so a resumed run can check it is continuing the same job"""
+    h = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        h.update(path.encode('utf-8', 'surrogateescape'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class _TextResultWriter:
+    """Append-only text output whose durable position is its size in bytes"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def open(self, state: Optional[Dict] = None):
+        size = state['bytes'] if state else 0
+        self._file = open(self.path, 'a+', encoding='utf-8', newline='')
+        # Drop anything written after the last checkpoint so rows are never duplicated
+        self._file.truncate(size)
+        self._file.seek(size)
+        if size == 0:
+            self._write_header()
+
+    def _write_header(self):
+        pass
+
+    def commit(self) -> Dict:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return {'bytes': self._file.tell()}
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class CsvResultWriter(_TextResultWriter):
+    """Write one CSV row per image; ``top_k`` is a JSON-encoded list"""
+
+    def _write_header(self):
+        csv.writer(self._file).writerow(ROW_FIELDS)
+
+    def write(self, rows: List[Dict]):
+        writer = csv.writer(self._file)
+        for row in rows:
+            values = dict(row, top_k=json.dumps(row['top_k']) if row['top_k'] is not None else '')
+            writer.writerow(['' if values[name] is None else values[name] for name in ROW_FIELDS])
+
+
+class JsonlResultWriter(_TextResultWriter):
+    """Write one JSON object per line"""
+
+    def write(self, rows: List[Dict]):
+        for row in rows:
+            self._file.write(json.dumps({name: row[name] for name in ROW_FIELDS}) + '\n')
+
+
+class ParquetResultWriter:
+    """Write a folder of Parquet part files, one per checkpoint.
+
+    Parquet files cannot be appended to, so rows are buffered and each commit
+    writes a new ``part-NNNNN.parquet``. The folder reads back as one table
+    with ``pandas.read_parquet``.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.parts = 0
+        self._rows = []
+
+    def open(self, state: Optional[Dict] = None):
+        os.makedirs(self.path, exist_ok=True)
+        self.parts = state['parts'] if state else 0
+        # Remove parts written after the last checkpoint
+        for part in glob.glob(os.path.join(self.path, 'part-*.parquet')):
+            if int(os.path.basename(part)[5:10]) >= self.parts:
+                os.remove(part)
+
+    def write(self, rows: List[Dict]):
+        self._rows.extend(rows)
+
+    def commit(self) -> Dict:
+        if self._rows:
+            import pandas as pd
+            frame = pd.DataFrame(self._rows, columns=ROW_FIELDS)
+            frame['top_k'] = frame['top_k'].map(lambda value: json.dumps(value) if value is not None else None)
+            part = os.path.join(self.path, f"part-{self.parts:05d}.parquet")
+            frame.to_parquet(f"{part}.tmp", index=False)
+            os.replace(f"{part}.tmp", part)
+            self.parts += 1
+            self._rows = []
+        return {'parts': self.parts}
+
+    def close(self):
+        self._rows = []
+
+
+WRITERS = {'csv': CsvResultWriter, 'jsonl': JsonlResultWriter, 'parquet': ParquetResultWriter}
+
+
+def create_writer(path: str, fmt: Optional[str] = None):
+    """Create a result writer, inferring the format from the output extension if not given"""
+    if fmt is None:
+        extension = os.path.splitext(path.rstrip(os.sep))[1].lstrip('.').lower()
+        fmt = {'json': 'jsonl', 'ndjson': 'jsonl', 'pq': 'parquet'}.get(extension, extension)
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown output format '{fmt}'; expected one of {', '.join(FORMATS)}")
+    return WRITERS[fmt](path)
+
+
+class BulkPredictionJob:
+    """Stream predictions for an ordered list of images to disk, resuming after interruptions.
+
+    Progress is recorded in ``<output>.progress.json`` every
+    ``checkpoint_every`` images, after the writer has made its rows durable.
+    The checkpoint stores the next input offset, the writer's position and a
+    digest of the input list; on resume the writer is rewound to that
+    position, so every image appears exactly once in the output. The job is
+    model-agnostic: ``run`` takes batches of ``(pixels, indices, ok)`` and a
+    function turning one batch into result rows.
+    """
+
+    def __init__(self, paths: Sequence[str], output: str, fmt: Optional[str] = None,
+                 checkpoint_every: int = 1024, restart: bool = False):
+        self.paths = list(paths)
+        self.output = output
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_path = f"{output.rstrip(os.sep)}.progress.json"
+        self.digest = inputs_digest(self.paths)
+        self.writer = create_writer(output, fmt)
+
+        state = None if restart else self._load_checkpoint()
+        if state is not None and state['inputs_digest'] != self.digest:
+            raise ValueError(f"Inputs differ from the run recorded in {self.checkpoint_path}; "
+                             f"restart the job to overwrite {output}")
+        self.offset = state['offset'] if state else 0
+        self._writer_state = state['writer'] if state else None
+        if self.offset:
+            logger.info(f"Resuming bulk prediction at image {self.offset} of {len(self.paths)}")
+
+    def _load_checkpoint(self) -> Optional[Dict]:
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_checkpoint(self, writer_state: Dict):
+        state = {
+            'inputs_digest': self.digest,
+            'offset': self.offset,
+            'total': len(self.paths),
+            'writer': writer_state
+        }
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    @property
+    def done(self) -> bool:
+        return self.offset >= len(self.paths)
+
+    def run(self, batches: Iterable, predict_rows: Callable[..., List[Dict]],
+            progress: Optional[Callable[[int], None]] = None) -> int:
+        """Consume batches starting at ``self.offset`` and return the number of images processed"""
+        processed = 0
+        since_checkpoint = 0
+        self.writer.open(self._writer_state)
+        try:
+            for pixels, indices, ok in batches:
+                indices = [int(i) for i in indices]
+                if indices[0] != self.offset:
+                    raise RuntimeError(f"Expected batch at offset {self.offset}, got {indices[0]}")
+                rows = predict_rows(pixels, indices, ok)
+                self.writer.write(rows)
+                self.offset += len(indices)
+                processed += len(indices)
+                since_checkpoint += len(indices)
+                if since_checkpoint >= self.checkpoint_every:
+                    self._writer_state = self.writer.commit()
+                    self._save_checkpoint(self._writer_state)
+                    since_checkpoint = 0
+                if progress is not None:
+                    progress(len(indices))
+            self._writer_state = self.writer.commit()
+            self._save_checkpoint(self._writer_state)
+        finally:
+            self.writer.close()
+        return processed
+
+
+def result_row(path: str, result=None, error: Optional[str] = None) -> Dict:
+    """Flatten a PredictionResult (or a failure) into an output row"""
+    if result is None:
+        return {'path': path, 'class_index': None, 'class_name': None, 'confidence': None,
+                'entropy': None, 'uncertain': None, 'top_k': None, 'error': error or 'unreadable image'}
+    return {
+        'path': path,
+        'class_index': result.class_index,
+        'class_name': result.class_name,
+        'confidence': result.confidence,
+        'entropy': result.entropy,
+        'uncertain': result.uncertain,
+        'top_k': [list(item) for item in result.top_k],
+        'error': None
+    }
@@ -0,0 +1,46 @@
+"""
+HTTP client for the standalone inference service
+"""
+import json
+import base64
+import urllib.request
+import urllib.error
+from typing import Dict, List
+
+
+class InferenceClient:
+    """Client for the /predict endpoints of ``src/server.py``"""
+
+    def __init__(self, base_url: str, timeout: float = 30.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _post(self, path: str, data: bytes, content_type: str) -> Dict:
+        request = urllib.request.Request(
+            f"{self.base_url}{path}", data=data, method='POST', headers={'Content-Type': content_type})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get('error', e.reason)
+            except ValueError:
+                message = e.reason
+            raise RuntimeError(f"Inference service error {e.code}: {message}") from e
+
+    def predict(self, image_bytes: bytes) -> Dict:
+        """Predict one encoded image; returns class index, class name, probabilities and treatment"""
+        return self._post('/predict', image_bytes, 'application/octet-stream')
+
+    def predict_batch(self, images: List[bytes]) -> List[Dict]:
+        """Predict several encoded images in one request"""
+        body = json.dumps({'images': [base64.b64encode(data).decode('ascii') for data in images]}).encode()
+        return self._post('/predict/batch', body, 'application/json')['predictions']
+
+    def healthy(self) -> bool:
+        """Check whether the service answers its health check"""
+        try:
+            with urllib.request.urlopen(f"{self.base_url}/healthz", timeout=self.timeout) as response:
+                return response.status == 200
+        except (urllib.error.URLError, OSError):
+            return False
@@ -0,0 +1,197 @@
+"""
+Content-addressed cache of prediction results
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict, namedtuple
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+CachedPrediction = namedtuple('CachedPrediction', ['class_index', 'logits'])
+
+
+class PredictionCache:
+    """LRU + TTL cache of predictions keyed by image content and serving configuration.
+
+    Keys combine a hash of the uploaded bytes with a ``fingerprint`` of the
+    checkpoint and every setting that changes the logits, so a new model or
+    configuration never serves results computed by an old one. Entries live in an
+    in-memory LRU bounded by ``max_entries``; with ``disk_dir`` set they are
+    also written as small JSON files (sharded by key prefix) that survive
+    restarts. Both tiers honour ``ttl_seconds``; the disk tier is swept every
+    tenth of ``max_disk_entries`` writes, dropping expired files and then the
+    least recently used beyond ``max_disk_entries``.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[float] = 3600, disk_dir: Optional[str] = None,
+                 max_disk_entries: int = 10000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._disk_writes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def fingerprint(predictor, **settings) -> str:
+        """Digest of everything besides the upload that changes a predictor's logits, for ``make_key``.
+
+        Covers the checkpoint and gate (``checkpoint_digest``), the precision
+        and backend actually in use and the resize backend, plus the caller's
+        own ``settings``, e.g. decode size and CLAHE enhancement.
+        """
+        config = dict(settings, checkpoint=predictor.checkpoint_digest, precision=predictor.precision,
+                      backend=predictor.backend, preprocessing=predictor.preprocessing)
+        return hashlib.blake2b(json.dumps(config, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+    @staticmethod
+    def make_key(image_bytes: bytes, model_digest: str) -> str:
+        """Build a cache key from the raw upload bytes and the model ``fingerprint``"""
+        h = hashlib.blake2b(image_bytes, digest_size=16)
+        h.update(model_digest.encode())
+        return h.hexdigest()
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created > self.ttl_seconds
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[CachedPrediction]:
+        """Look up a prediction, returning None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, value = entry
+                if not self._expired(created):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, value, time.time())
+            return value
+
+    def put(self, key: str, class_index: int, logits: List[float]) -> CachedPrediction:
+        """Store a prediction in memory and, if enabled, on disk"""
+        value = CachedPrediction(int(class_index), [float(x) for x in logits])
+        created = time.time()
+        with self._lock:
+            self._store(key, value, created)
+        self._write_disk(key, value, created)
+        return value
+
+    def _store(self, key, value, created):
+        self._entries[key] = (created, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _read_disk(self, key: str) -> Optional[CachedPrediction]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(data['created']):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        try:
+            # The file's mtime is its last use, which the sweep evicts by
+            os.utime(path)
+        except OSError:
+            pass
+        return CachedPrediction(data['class_index'], data['logits'])
+
+    def _write_disk(self, key, value, created):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file and rename so readers never see a partial entry
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'class_index': value.class_index, 'logits': value.logits, 'created': created}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write prediction cache entry: {e}")
+            return
+        with self._lock:
+            self._disk_writes += 1
+            sweep = self._disk_writes % max(1, self.max_disk_entries // 10) == 0
+        if sweep:
+            self.sweep_disk()
+
+    def sweep_disk(self) -> int:
+        """Delete expired disk entries, then the least recently used beyond max_disk_entries; returns the count"""
+        if not self.disk_dir:
+            return 0
+        entries = []
+        for shard in os.scandir(self.disk_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.json'):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except OSError:
+                        pass
+        entries.sort()
+        # mtime is at least the creation time, so this never drops an entry that is still valid
+        expired = [p for mtime, p in entries if self._expired(mtime)]
+        live = [p for mtime, p in entries if not self._expired(mtime)]
+        doomed = expired + live[:max(0, len(live) - self.max_disk_entries)]
+        removed = 0
+        for path in doomed:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        if removed:
+            logger.info(f"Removed {removed} prediction cache file(s) from {self.disk_dir}")
+        return removed
+
+    def clear(self):
+        """Drop every in-memory entry and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """Get hit/miss counters and the current size"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._entries)
+            }
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,272 @@
+"""
+Content-addressed archive of uploaded images and their predictions, for retraining and audit
+"""
+import os
+import io
+import json
+import time
+import queue
+import tarfile
+import hashlib
+import logging
+import threading
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# File extension by leading bytes; anything else is stored as .bin
+SIGNATURES = ((b'\xff\xd8\xff', 'jpg'), (b'\x89PNG', 'png'), (b'BM', 'bmp'), (b'II*\x00', 'tiff'),
+              (b'MM\x00*', 'tiff'), (b'GIF8', 'gif'))
+
+# A roll-up lock older than this is assumed to belong to a crashed process
+STALE_LOCK_SECONDS = 3600
+
+
+def image_extension(data: bytes) -> str:
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return next((ext for magic, ext in SIGNATURES if data.startswith(magic)), 'bin')
+
+
+class UploadArchive:
+    """Keep every upload once, plus a record of each prediction made on it, without blocking requests.
+
+    ``submit`` only puts the upload on a bounded queue; when the queue is full
+    the upload is dropped (and counted) rather than slowing the caller down.
+    A background thread writes, under ``root``:
+
+    - ``objects/ab/cd/<digest>.<ext>``: each distinct image once, named by
+      the blake2b hash of its bytes, so repeated uploads cost nothing;
+    - ``records/<YYYYMMDDHH>-<pid>.jsonl``: one append-only line per
+      prediction with the digest, result, timings and caller metadata.
+
+    Every ``roll_up_seconds`` the journals of past hours and the loose
+    objects they reference are rolled into one uncompressed tar per roll-up
+    under ``batches/``, listed in ``batches/index.jsonl``, for cheap bulk
+    export. ``on_event``, if given, is called with 'written', 'duplicate',
+    'dropped' or 'error' for every upload, e.g. to record metrics.
+    """
+
+    def __init__(self, root: str, max_queue: int = 256, roll_up_seconds: Optional[float] = 3600, on_event=None):
+        self.root = root
+        self.roll_up_seconds = roll_up_seconds
+        self.on_event = on_event
+        self.counts = {'written': 0, 'duplicate': 0, 'dropped': 0, 'error': 0}
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._counts_lock = threading.Lock()
+        self._known = None
+        self._index_mtime = None
+        self._last_roll_up = time.time()
+
+    @property
+    def objects_dir(self) -> str:
+        return os.path.join(self.root, 'objects')
+
+    @property
+    def records_dir(self) -> str:
+        return os.path.join(self.root, 'records')
+
+    @property
+    def batches_dir(self) -> str:
+        return os.path.join(self.root, 'batches')
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    def object_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest[2:4], f"{digest}.{ext}")
+
+    def start(self):
+        """Start the background writer thread"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="upload-archive", daemon=True)
+                self._thread.start()
+        return self
+
+    def close(self):
+        """Stop the writer thread after writing everything already queued"""
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(_STOP)
+                self._thread.join()
+                self._thread = None
+
+    def submit(self, image_bytes: bytes, prediction: Dict, timings: Optional[Dict] = None, **metadata) -> bool:
+        """Queue an upload and its prediction for archiving; returns False if it was dropped"""
+        if self._thread is None:
+            self.start()
+        record = {'time': time.time(), 'prediction': prediction, 'timings': timings or {}, **metadata}
+        try:
+            self._queue.put_nowait((image_bytes, record))
+        except queue.Full:
+            self._event('dropped')
+            return False
+        return True
+
+    def _event(self, result: str):
+        with self._counts_lock:
+            self.counts[result] += 1
+        if self.on_event is not None:
+            self.on_event(result)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            try:
+                self._event('written' if self.write(*item) else 'duplicate')
+            except Exception as e:
+                logger.error(f"Could not archive upload: {e}")
+                self._event('error')
+            if self.roll_up_seconds is not None and time.time() - self._last_roll_up >= self.roll_up_seconds:
+                self._last_roll_up = time.time()
+                try:
+                    self.roll_up()
+                except Exception as e:
+                    logger.error(f"Could not roll up the upload archive: {e}")
+
+    def _is_known(self, digest: str) -> bool:
+        """Whether an object was already rolled into a batch, re-reading the index when another process grew it"""
+        path = os.path.join(self.batches_dir, 'index.jsonl')
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if self._known is None or mtime != self._index_mtime:
+            self._known = {entry['digest'] for entry in self._read_jsonl(path)}
+            self._index_mtime = mtime
+        return digest in self._known
+
+    def write(self, image_bytes: bytes, record: Dict) -> bool:
+        """Store an upload and append its record synchronously; returns False if the image was already stored"""
+        digest = self.digest(image_bytes)
+        ext = image_extension(image_bytes)
+        path = self.object_path(digest, ext)
+        new = not os.path.exists(path) and not self._is_known(digest)
+        if new:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file and rename so a roll-up never packs a partial image
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(image_bytes)
+            os.replace(tmp_path, path)
+
+        line = json.dumps(dict(record, digest=digest, ext=ext, bytes=len(image_bytes)), ensure_ascii=False)
+        os.makedirs(self.records_dir, exist_ok=True)
+        journal = os.path.join(self.records_dir, f"{time.strftime('%Y%m%d%H')}-{os.getpid()}.jsonl")
+        # Opened per record so no handle outlives the hour and roll-ups can take closed journals safely
+        with open(journal, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+        return new
+
+    @staticmethod
+    def _read_jsonl(path: str) -> Iterator[Dict]:
+        try:
+            with open(path, encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return iter(())
+        # A torn last line from a crash is skipped rather than failing the whole file
+        return (json.loads(line) for line in lines if line.endswith('\n'))
+
+    def _acquire_roll_up_lock(self) -> Optional[str]:
+        path = os.path.join(self.root, 'roll-up.lock')
+        try:
+            if time.time() - os.path.getmtime(path) > STALE_LOCK_SECONDS:
+                os.remove(path)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return None
+        return path
+
+    def roll_up(self, include_current: bool = False) -> Optional[str]:
+        """Move closed journals and the loose objects they reference into one tar batch.
+
+        Journals of the current hour are still being appended to and are left
+        alone unless ``include_current`` is set (only safe once every writer
+        has stopped). Returns the batch path, or None if there was nothing to
+        roll up or another process is rolling up.
+        """
+        current = time.strftime('%Y%m%d%H')
+        try:
+            names = sorted(os.listdir(self.records_dir))
+        except OSError:
+            return None
+        journals = [os.path.join(self.records_dir, name) for name in names
+                    if name.endswith('.jsonl') and (include_current or not name.startswith(current))]
+        if not journals:
+            return None
+        lock = self._acquire_roll_up_lock()
+        if lock is None:
+            return None
+        try:
+            records = [record for journal in journals for record in self._read_jsonl(journal)]
+            os.makedirs(self.batches_dir, exist_ok=True)
+            name = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}.tar"
+            tmp_path = os.path.join(self.batches_dir, name + '.tmp')
+            packed = {}
+            with tarfile.open(tmp_path, 'w') as tar:
+                for record in records:
+                    path = self.object_path(record['digest'], record['ext'])
+                    if record['digest'] in packed or not os.path.exists(path):
+                        continue
+                    tar.add(path, arcname=f"objects/{record['digest']}.{record['ext']}")
+                    packed[record['digest']] = path
+                data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode()
+                info = tarfile.TarInfo('records.jsonl')
+                info.size, info.mtime = len(data), time.time()
+                tar.addfile(info, io.BytesIO(data))
+            os.replace(tmp_path, os.path.join(self.batches_dir, name))
+            with open(os.path.join(self.batches_dir, 'index.jsonl'), 'a', encoding='utf-8') as f:
+                f.writelines(json.dumps({'digest': digest, 'batch': name}) + '\n' for digest in packed)
+            # Only delete once the batch and its index entries are in place
+            for path in list(packed.values()) + journals:
+                os.remove(path)
+            logger.info(f"Rolled {len(records)} record(s) and {len(packed)} image(s) into {name}")
+            return os.path.join(self.batches_dir, name)
+        finally:
+            os.remove(lock)
+
+    def iter_records(self) -> Iterator[Dict]:
+        """Every archived record, from rolled-up batches first, then from open journals"""
+        try:
+            batches = sorted(n for n in os.listdir(self.batches_dir) if n.endswith('.tar'))
+        except OSError:
+            batches = []
+        for name in batches:
+            with tarfile.open(os.path.join(self.batches_dir, name)) as tar:
+                for line in tar.extractfile('records.jsonl').read().decode('utf-8').splitlines():
+                    yield json.loads(line)
+        try:
+            journals = sorted(n for n in os.listdir(self.records_dir) if n.endswith('.jsonl'))
+        except OSError:
+            journals = []
+        for name in journals:
+            yield from self._read_jsonl(os.path.join(self.records_dir, name))
+
+    def read_image(self, digest: str, ext: str) -> bytes:
+        """The bytes of an archived image, loose or rolled up; raises FileNotFoundError if unknown"""
+        path = self.object_path(digest, ext)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return f.read()
+        for entry in self._read_jsonl(os.path.join(self.batches_dir, 'index.jsonl')):
+            if entry['digest'] == digest:
+                with tarfile.open(os.path.join(self.batches_dir, entry['batch'])) as tar:
+                    return tar.extractfile(f"objects/{digest}.{ext}").read()
+        raise FileNotFoundError(f"No archived image {digest}")
+
+    def stats(self) -> dict:
+        """Get the write counters and the current queue depth"""
+        with self._counts_lock:
+            return dict(self.counts, queued=self._queue.qsize())
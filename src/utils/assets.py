@@ -0,0 +1,177 @@
+"""
+Display-size variants of the static page images, built once and kept in memory
+
+``build_assets`` writes resized WebP and JPEG copies of static/images under
+content-hashed names, plus a manifest, when the image is built
+(python src/cli.py build-assets). ``AssetCache`` serves them to the app from
+memory; images that were not built are resized once per process instead.
+"""
+import os
+import io
+import html
+import json
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence
+from urllib.parse import quote
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Pillow format, mimetype, file extension and encoder options per variant format
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', 'webp', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True})
+}
+
+SOURCE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+MANIFEST = 'manifest.json'
+
+
+@dataclass(frozen=True)
+class Asset:
+    """Encoded image bytes; ``filename`` is set for variants built on disk"""
+    data: bytes
+    mimetype: str
+    width: int
+    filename: Optional[str] = None
+
+
+def content_etag(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def render_variant(image: Image.Image, width: int, fmt: str) -> bytes:
+    """Resize an image to ``width`` (never upscaling) and encode it; alpha is flattened onto white"""
+    pil_format, _, _, options = FORMATS[fmt]
+    if image.width > width:
+        image = image.resize((width, round(image.height * width / image.width)), Image.Resampling.LANCZOS)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        rgba = image.convert('RGBA')
+        image = Image.new('RGB', rgba.size, (255, 255, 255))
+        image.paste(rgba, mask=rgba.getchannel('A'))
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def variant_widths(source_width: int, widths: Sequence[int]):
+    return sorted({min(width, source_width) for width in widths})
+
+
+def pick_width(available: Sequence[int], width: int) -> int:
+    """The narrowest available width covering ``width``, else the widest available"""
+    covering = [w for w in available if w >= width]
+    return min(covering) if covering else max(available)
+
+
+def build_assets(src_dir: str, out_dir: str, widths: Sequence[int] = (800,),
+                 formats: Sequence[str] = ('webp', 'jpeg')) -> Dict:
+    """Write display-size variants of every image in ``src_dir`` to ``out_dir`` and return the manifest.
+
+    Each image gets one variant per format and width (capped at its own
+    width), named ``<stem>-<width>w.<etag>.<ext>`` so the files can be
+    cached forever. Files from earlier builds that are no longer in the
+    manifest are removed.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {}
+    for name in sorted(os.listdir(src_dir)):
+        if not name.lower().endswith(SOURCE_EXTENSIONS):
+            continue
+        path = os.path.join(src_dir, name)
+        with Image.open(path) as image:
+            image.load()
+            entry = {'width': image.width, 'height': image.height, 'bytes': os.path.getsize(path), 'variants': {}}
+            stem = os.path.splitext(name)[0].replace(' ', '-')
+            for width in variant_widths(image.width, widths):
+                for fmt in formats:
+                    data = render_variant(image, width, fmt)
+                    etag = content_etag(data)
+                    filename = f"{stem}-{width}w.{etag}.{FORMATS[fmt][2]}"
+                    with open(os.path.join(out_dir, filename), 'wb') as f:
+                        f.write(data)
+                    entry['variants'].setdefault(str(width), {})[fmt] = {
+                        'file': filename, 'etag': etag, 'bytes': len(data)
+                    }
+        manifest[name] = entry
+
+    built = {v['file'] for entry in manifest.values() for sizes in entry['variants'].values() for v in sizes.values()}
+    for stale in set(os.listdir(out_dir)) - built - {MANIFEST}:
+        os.remove(os.path.join(out_dir, stale))
+    tmp = os.path.join(out_dir, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST))
+    logger.info(f"Built {len(built)} asset variant(s) for {len(manifest)} image(s) in {out_dir}")
+    return manifest
+
+
+class AssetCache:
+    """In-process cache of display-size page images, keyed by source name, width and format.
+
+    Built variants are read from ``build_dir`` once; images missing from the
+    build are resized and encoded once from ``src_dir``. Either way, later
+    reruns and sessions get the same bytes without touching disk.
+    """
+
+    def __init__(self, src_dir: str, build_dir: Optional[str] = None):
+        self.src_dir = src_dir
+        self.build_dir = build_dir
+        self._manifest = None
+        self._assets: Dict[tuple, Asset] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def manifest(self) -> Dict:
+        if self._manifest is None:
+            path = os.path.join(self.build_dir, MANIFEST) if self.build_dir else None
+            if path and os.path.exists(path):
+                with open(path) as f:
+                    self._manifest = json.load(f)
+            else:
+                self._manifest = {}
+        return self._manifest
+
+    def _built(self, name: str, width: int, fmt: str) -> Optional[dict]:
+        entry = self.manifest.get(name)
+        if not entry:
+            return None
+        chosen = pick_width([int(w) for w in entry['variants']], width)
+        variant = entry['variants'][str(chosen)].get(fmt)
+        if variant is None or not os.path.exists(os.path.join(self.build_dir, variant['file'])):
+            return None
+        return dict(variant, width=chosen)
+
+    def get(self, name: str, width: int, fmt: str = 'jpeg') -> Asset:
+        """Bytes of ``name`` (a file in ``src_dir``) at display ``width``; raises FileNotFoundError if missing"""
+        key = (name, width, fmt)
+        with self._lock:
+            asset = self._assets.get(key)
+        if asset is not None:
+            return asset
+        mimetype = FORMATS[fmt][1]
+        variant = self._built(name, width, fmt)
+        if variant is not None:
+            with open(os.path.join(self.build_dir, variant['file']), 'rb') as f:
+                asset = Asset(f.read(), mimetype, variant['width'], variant['file'])
+        else:
+            with Image.open(os.path.join(self.src_dir, name)) as image:
+                asset = Asset(render_variant(image, width, fmt), mimetype, min(width, image.width))
+        with self._lock:
+            return self._assets.setdefault(key, asset)
+
+    def picture_html(self, name: str, width: int, base_url: str, alt: str = '') -> Optional[str]:
+        """A <picture> tag pointing at the built WebP/JPEG variants under ``base_url``, or None if not built"""
+        jpeg, webp = self._built(name, width, 'jpeg'), self._built(name, width, 'webp')
+        if jpeg is None:
+            return None
+        source = f'<source type="image/webp" srcset="{base_url}/{quote(webp["file"])}">' if webp else ''
+        return (f'<picture>{source}<img src="{base_url}/{quote(jpeg["file"])}" alt="{html.escape(alt)}" '
+                f'width="{width}" style="max-width:100%;height:auto"></picture>')
@@ -1,6 +1,10 @@
 """
 Device utilities for model operations
 """
+import os
+import math
+import time
+import threading
 import torch
 import logging
 
@@ -22,3 +26,92 @@ def to_device(data, device):
     if isinstance(data, (list, tuple)):
         return [to_device(x, device) for x in data]
     return data.to(device, non_blocking=True)
+
+def available_cpus():
+    """Number of CPUs this process may use, honouring affinity masks and cgroup (container) CPU quotas"""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            count = min(count, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return count
+
+def parse_cpu_list(spec):
+    """Parse a CPU list such as ``"0-3,8"`` into a set of CPU ids"""
+    cpus = set()
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        start, _, end = part.partition('-')
+        cpus.update(range(int(start), int(end or start) + 1))
+    return cpus
+
+def autotune_threads(workload, candidates=None, runs=3):
+    """Time ``workload`` at each candidate intra-op thread count and keep the fastest.
+
+    Candidates default to powers of two up to the available CPUs, plus that
+    count itself. Returns the chosen thread count, which is left set.
+    """
+    limit = available_cpus()
+    if candidates is None:
+        candidates = sorted({2 ** i for i in range(limit.bit_length()) if 2 ** i <= limit} | {limit})
+    timings = {}
+    for threads in candidates:
+        torch.set_num_threads(threads)
+        workload()
+        start = time.perf_counter()
+        for _ in range(runs):
+            workload()
+        timings[threads] = (time.perf_counter() - start) / runs
+    best = min(timings, key=timings.get)
+    torch.set_num_threads(best)
+    logger.info("Thread autotune: " + ", ".join(f"{t}={s * 1000:.1f}ms" for t, s in timings.items())
+                + f"; using {best}")
+    return best
+
+_runtime_lock = threading.Lock()
+_runtime_profile = None
+
+def configure_runtime(num_threads=0, interop_threads=0, cpu_affinity='', flush_denormal=True):
+    """Apply a CPU runtime profile to this process, once.
+
+    Pins the process to ``cpu_affinity`` (e.g. ``"0-3"``) where supported,
+    sets intra-op threads (``0`` means one per available CPU, which respects
+    the pinning and container quota rather than the host's core count) and
+    inter-op threads (``0`` keeps torch's default), exports matching
+    OMP/MKL thread counts for child processes, and enables flushing of
+    denormal floats, which otherwise hit slow microcode paths on x86. That
+    flag is per thread, so predictors built with ``flush_denormal=True``
+    also set it in the threads that run their forward passes.
+    Later calls return the profile applied by the first one, since
+    inter-op threads can't be changed after torch starts parallel work.
+    ``num_threads='auto'`` starts like ``0``; callers then run
+    ``autotune_threads`` once a model is loaded.
+    """
+    global _runtime_profile
+    with _runtime_lock:
+        if _runtime_profile is not None:
+            return _runtime_profile
+        profile = {}
+        if cpu_affinity and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, parse_cpu_list(cpu_affinity))
+            profile['cpu_affinity'] = sorted(os.sched_getaffinity(0))
+        num_threads = (0 if num_threads == 'auto' else int(num_threads)) or available_cpus()
+        torch.set_num_threads(num_threads)
+        os.environ.setdefault('OMP_NUM_THREADS', str(num_threads))
+        os.environ.setdefault('MKL_NUM_THREADS', str(num_threads))
+        profile['num_threads'] = torch.get_num_threads()
+        if interop_threads:
+            try:
+                torch.set_num_interop_threads(interop_threads)
+            except RuntimeError as e:
+                logger.warning(f"Could not set inter-op threads: {e}")
+        profile['interop_threads'] = torch.get_num_interop_threads()
+        profile['flush_denormal'] = bool(flush_denormal) and torch.set_flush_denormal(True)
+        logger.info(f"Runtime profile: {profile}")
+        _runtime_profile = profile
+        return profile
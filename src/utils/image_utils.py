@@ -1,11 +1,18 @@
 """
 Image processing utilities
+
+OpenCV and Streamlit are imported by the functions that need them, so the
+inference service and the app's first page don't pay for loading them.
 """
-import cv2
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from PIL import Image
-import streamlit as st
-from typing import Optional, Tuple
+from typing import List, Optional, Sequence, Tuple, Union
+
+_clahe_local = threading.local()
+_enhance_executor = None
+_enhance_executor_lock = threading.Lock()
 
 def preprocess_image(image: Image.Image, target_size: Tuple[int, int] = (224, 224)) -> Image.Image:
     """
@@ -27,6 +34,41 @@ def preprocess_image(image: Image.Image, target_size: Tuple[int, int] = (224, 22
     
     return image
 
+def open_image(source) -> Image.Image:
+    """
+    Open an image lazily, reading only the header
+    
+    The returned image knows its size, mode and format but its pixel data is
+    not decoded yet, so it can be validated cheaply before decoding.
+    
+    Args:
+        source: File path or file-like object (e.g. a Streamlit upload)
+    
+    Returns:
+        Lazily loaded PIL Image
+    """
+    return Image.open(source)
+
+def decode_image(image: Image.Image, target_size: Tuple[int, int] = (224, 224)) -> Image.Image:
+    """
+    Decode an opened image to RGB at reduced resolution where possible
+    
+    JPEGs are decoded with DCT scaling (``Image.draft``) to the smallest of
+    1/1, 1/2, 1/4 or 1/8 scale that is still at least ``target_size``, so a
+    large field photo is never fully decoded just to be shrunk afterwards.
+    Other formats are decoded at full resolution.
+    
+    Args:
+        image: PIL Image returned by ``open_image``
+        target_size: Minimum size (width, height) the decoded image must keep
+    
+    Returns:
+        Decoded RGB PIL Image
+    """
+    if image.format == 'JPEG':
+        image.draft('RGB', target_size)
+    return image.convert('RGB')
+
 def validate_image(image: Image.Image) -> bool:
     """
     Validate if image is suitable for processing
@@ -54,10 +96,80 @@ def display_image_info(image: Image.Image) -> None:
     Args:
         image: PIL Image object
     """
+    import streamlit as st
     st.write(f"**Image Size:** {image.size[0]} x {image.size[1]} pixels")
     st.write(f"**Image Mode:** {image.mode}")
     st.write(f"**Image Format:** {image.format if hasattr(image, 'format') else 'Unknown'}")
 
+def _get_clahe(clip_limit: float, tile_grid_size: Tuple[int, int]):
+    """Get this thread's CLAHE object for the given settings (CLAHE objects are not thread-safe)"""
+    cache = getattr(_clahe_local, 'clahe', None)
+    if cache is None:
+        cache = _clahe_local.clahe = {}
+    key = (clip_limit, tuple(tile_grid_size))
+    clahe = cache.get(key)
+    if clahe is None:
+        import cv2
+        clahe = cache[key] = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tuple(tile_grid_size))
+    return clahe
+
+def enhance_array(array: np.ndarray, clip_limit: float = 2.0,
+                  tile_grid_size: Tuple[int, int] = (8, 8)) -> np.ndarray:
+    """
+    Apply CLAHE to the lightness of an RGB uint8 array, in place
+    
+    Args:
+        array: Writable (H, W, 3) uint8 RGB array
+        clip_limit: CLAHE contrast limit
+        tile_grid_size: CLAHE tile grid (columns, rows)
+    
+    Returns:
+        The same array, enhanced
+    """
+    import cv2
+    cv2.cvtColor(array, cv2.COLOR_RGB2LAB, dst=array)
+    lightness = cv2.extractChannel(array, 0)
+    _get_clahe(clip_limit, tile_grid_size).apply(lightness, dst=lightness)
+    cv2.insertChannel(lightness, array, 0)
+    cv2.cvtColor(array, cv2.COLOR_LAB2RGB, dst=array)
+    return array
+
+def _get_enhance_executor() -> ThreadPoolExecutor:
+    """Thread pool shared by batch enhancement; OpenCV releases the GIL, so threads run in parallel"""
+    global _enhance_executor
+    with _enhance_executor_lock:
+        if _enhance_executor is None:
+            _enhance_executor = ThreadPoolExecutor(thread_name_prefix='enhance')
+        return _enhance_executor
+
+def enhance_images(images: Sequence[Union[Image.Image, np.ndarray]], clip_limit: float = 2.0,
+                   tile_grid_size: Tuple[int, int] = (8, 8), parallel: bool = True) -> List:
+    """
+    Apply CLAHE enhancement to a batch of images
+    
+    NumPy arrays are enhanced in place; PIL Images are copied into an array
+    once and returned as new PIL Images. With ``parallel`` the images are
+    spread over a shared thread pool.
+    
+    Args:
+        images: PIL Images or writable (H, W, 3) uint8 RGB arrays
+        clip_limit: CLAHE contrast limit
+        tile_grid_size: CLAHE tile grid (columns, rows)
+        parallel: Whether to use the thread pool for batches of more than one image
+    
+    Returns:
+        Enhanced images, of the same types as the inputs
+    """
+    def enhance(image):
+        if isinstance(image, np.ndarray):
+            return enhance_array(image, clip_limit, tile_grid_size)
+        array = np.array(image.convert('RGB') if image.mode != 'RGB' else image)
+        return Image.fromarray(enhance_array(array, clip_limit, tile_grid_size))
+    
+    if parallel and len(images) > 1:
+        return list(_get_enhance_executor().map(enhance, images))
+    return [enhance(image) for image in images]
+
 def enhance_image(image: Image.Image) -> Image.Image:
     """
     Apply basic image enhancement
@@ -68,13 +180,4 @@ def enhance_image(image: Image.Image) -> Image.Image:
     Returns:
         Enhanced PIL Image
     """
-    # Convert to numpy array for OpenCV processing
-    img_array = np.array(image)
-    
-    # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization)
-    lab = cv2.cvtColor(img_array, cv2.COLOR_RGB2LAB)
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    lab[:, :, 0] = clahe.apply(lab[:, :, 0])
-    enhanced = cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)
-    
-    return Image.fromarray(enhanced)
+    return enhance_images([image], parallel=False)[0]
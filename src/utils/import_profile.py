@@ -0,0 +1,69 @@
+"""
+Cold-start import profiling for the entry points
+"""
+import os
+import sys
+import json
+import subprocess
+from typing import Dict, List, Optional
+
+# Modules that cost hundreds of milliseconds or more to import and should only load when needed
+HEAVY_MODULES = ('torch', 'torchvision', 'cv2', 'pandas')
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_TIMED_IMPORT = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+print(json.dumps({{'seconds': time.perf_counter() - start, 'modules': sorted(sys.modules)}}))
+"""
+
+
+def _run(args: List[str], cwd: Optional[str]) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], cwd=cwd or SRC_DIR, capture_output=True, text=True, check=True)
+
+
+def cold_import(module: str, cwd: Optional[str] = None) -> Dict:
+    """Import a module in a fresh interpreter; return the wall time and which heavy modules it loaded"""
+    result = _run(['-c', _TIMED_IMPORT.format(module=module)], cwd)
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    loaded = set(data['modules'])
+    return {'seconds': data['seconds'], 'heavy_modules': [name for name in HEAVY_MODULES if name in loaded]}
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """Parse ``python -X importtime`` output into entries with self and cumulative microseconds"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        entries.append({'module': name.strip(), 'self_us': int(self_us), 'cumulative_us': int(cumulative_us),
+                        'depth': (len(name) - len(name.lstrip())) // 2})
+    return entries
+
+
+def profile_imports(module: str, top: int = 15, cwd: Optional[str] = None) -> Dict:
+    """Report where the cold import time of a module goes.
+
+    ``packages`` sums self time per top-level package, which is usually the
+    actionable view (e.g. all of torch); ``modules`` lists the single
+    modules with the most cumulative time.
+    """
+    entries = parse_importtime(_run(['-X', 'importtime', '-c', f'import {module}'], cwd).stderr)
+    packages = {}
+    for entry in entries:
+        package = entry['module'].split('.')[0]
+        packages[package] = packages.get(package, 0) + entry['self_us']
+    total = next((e['cumulative_us'] for e in entries if e['module'] == module), sum(packages.values()))
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    slowest = sorted(entries, key=lambda e: e['cumulative_us'], reverse=True)[:top]
+    return {
+        'module': module,
+        'total_ms': total / 1000,
+        'packages': {name: us / 1000 for name, us in ranked},
+        'modules': [{'module': e['module'], 'cumulative_ms': e['cumulative_us'] / 1000} for e in slowest],
+        'heavy_modules': [name for name in HEAVY_MODULES if name in packages]
+    }
+
@@ -0,0 +1,201 @@
+"""
+In-process latency histograms and counters with Prometheus text export
+"""
+import math
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence
+
+# Seconds; spans sub-millisecond preprocessing up to multi-second cold starts
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _label_key(labels: Dict[str, str]):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in items) + '}'
+
+
+class Histogram:
+    """Cumulative bucket counts plus a sliding window of recent samples for percentiles"""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS, window: int = 2048):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Nearest-rank percentile of the recent window, or None before the first sample"""
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms, keyed by metric name and labels.
+
+    Histograms export Prometheus buckets, ``_sum`` and ``_count``, plus a
+    ``<name>_quantile`` gauge with p50/p95/p99 over the most recent samples,
+    so a dashboard-less deployment can still read percentiles off /metrics.
+    """
+
+    def __init__(self, window: int = 2048):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name: str, help_text: str):
+        """Set the HELP text exported for a metric"""
+        self._help[name] = help_text
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """Increment a counter"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS, **labels):
+        """Record a value in a histogram"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets, self.window)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Time a block in seconds into a histogram; the block's exceptions propagate unchanged"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time one stage of a prediction, counting an error for the stage if the block raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc('rice_errors_total', stage=name)
+            raise
+        finally:
+            self.observe('rice_stage_seconds', time.perf_counter() - start, stage=name)
+
+    def record_timings(self, timings: Dict[str, float]):
+        """Record stage durations collected by e.g. ``RiceDiseasePredictor.predict_logits(timings=...)``"""
+        for name, seconds in timings.items():
+            self.observe('rice_stage_seconds', seconds, stage=name)
+
+    def record_batch(self, size: int, seconds: float):
+        """Record one forward pass; usable as ``MicroBatcher(on_batch=...)``"""
+        self.observe('rice_batch_size', size, buckets=BATCH_SIZE_BUCKETS)
+        self.observe('rice_stage_seconds', seconds, stage='batch_forward')
+
+    def record_gate(self, size: int, escalated: int):
+        """Count images seen by the healthy-leaf gate and those escalated; usable as ``on_gate=...``"""
+        self.inc('rice_gate_images_total', size)
+        self.inc('rice_gate_escalations_total', escalated)
+
+    def escalation_rate(self) -> Optional[float]:
+        """Share of gated images escalated to the full model so far, or None before the first"""
+        total = self.counter_value('rice_gate_images_total')
+        return self.counter_value('rice_gate_escalations_total') / total if total else None
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def percentiles(self, name: str, **labels) -> Dict[str, Optional[float]]:
+        """Get count, p50, p95 and p99 of a histogram"""
+        with self._lock:
+            histogram = self._histograms.get((name, _label_key(labels)))
+            if histogram is None:
+                return {'count': 0, **{f"p{int(q * 100)}": None for q in QUANTILES}}
+            return {'count': histogram.count, **{f"p{int(q * 100)}": histogram.percentile(q) for q in QUANTILES}}
+
+    def summary(self, name: str, label: str) -> Dict[str, Dict[str, Optional[float]]]:
+        """Percentiles of every series of a histogram, keyed by the value of one label"""
+        with self._lock:
+            keys = [key for metric, key in self._histograms if metric == name]
+        return {dict(key).get(label, ''): self.percentiles(name, **dict(key)) for key in sorted(keys)}
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            seen = set()
+            for (name, key), value in counters:
+                if name not in seen:
+                    seen.add(name)
+                    if name in self._help:
+                        lines.append(f'# HELP {name} {self._help[name]}')
+                    lines.append(f'# TYPE {name} counter')
+                lines.append(f'{name}{_format_labels(key)} {value:g}')
+
+            for name in sorted({name for name, _ in self._histograms}):
+                series = [(key, h) for (metric, key), h in histograms if metric == name]
+                if name in self._help:
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} histogram')
+                for key, histogram in series:
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_format_labels(key, [("le", f"{bound:g}")])} {cumulative}')
+                    lines.append(f'{name}_bucket{_format_labels(key, [("le", "+Inf")])} {histogram.count}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{_format_labels(key)} {histogram.count}')
+                lines.append(f'# TYPE {name}_quantile gauge')
+                for key, histogram in series:
+                    for q in QUANTILES:
+                        value = histogram.percentile(q)
+                        if value is not None:
+                            lines.append(f'{name}_quantile{_format_labels(key, [("quantile", f"{q:g}")])} {value:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+_metrics = MetricsRegistry()
+_metrics.describe('rice_stage_seconds', 'Time spent in each stage of a prediction')
+_metrics.describe('rice_batch_size', 'Images per forward pass')
+_metrics.describe('rice_cache_requests_total', 'Prediction cache lookups by result')
+_metrics.describe('rice_errors_total', 'Failed predictions by stage')
+_metrics.describe('rice_gate_images_total', 'Images checked by the healthy-leaf gate')
+_metrics.describe('rice_gate_escalations_total', 'Gated images escalated to the full classifier')
+
+
+def get_metrics() -> MetricsRegistry:
+    """Get the process-wide metrics registry"""
+    return _metrics
@@ -0,0 +1,20 @@
+"""
+Shared test fixtures
+"""
+import os
+import sys
+import pytest
+import torch
+
+# Entry points (app.py, server.py, cli.py) import packages relative to src/, as when run from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from src.models.resnet_model import CNN_NeuralNet
+
+@pytest.fixture
+def model_path(tmp_path):
+    """Save randomly initialised weights as a stand-in checkpoint"""
+    torch.manual_seed(0)
+    path = tmp_path / 'resnet_Model.pth'
+    torch.save(CNN_NeuralNet(3, 9).state_dict(), path)
+    return str(path)
@@ -0,0 +1,75 @@
+"""
+Smoke tests for the benchmark harness
+"""
+import json
+import pytest
+
+from src.benchmark import run_benchmarks, synthetic_images, compare, flatten
+
+class TestBenchmark:
+    """Test cases for the benchmark report and baseline comparison"""
+    
+    @pytest.fixture(scope='class')
+    def report(self, tmp_path_factory):
+        import torch
+        from src.models.resnet_model import CNN_NeuralNet
+        model_path = tmp_path_factory.mktemp('model') / 'model.pth'
+        torch.save(CNN_NeuralNet(3, 9).state_dict(), model_path)
+        images = synthetic_images(2, size=(256, 192))
+        return run_benchmarks(str(model_path), images, batch_sizes=(1, 2), thread_counts=(1,), runs=2, warmup=0)
+    
+    def test_report_contents(self, report):
+        """Test that the report is JSON-serializable and covers every configuration"""
+        json.dumps(report)
+        assert report['load_ms'] > 0
+        assert set(report['batch']) == {'eager/threads=1/batch=1', 'eager/threads=1/batch=2'}
+        stats = report['batch']['eager/threads=1/batch=2']
+        assert stats['p50_ms'] <= stats['p99_ms']
+        assert stats['images_per_second'] > 0
+    
+    def test_no_regression_against_itself(self, report):
+        """Test that a run compared against itself passes"""
+        assert compare(report, report) == []
+    
+    def test_detects_regressions(self, report):
+        """Test that slower latency and lower throughput are both flagged"""
+        slower = json.loads(json.dumps(report))
+        slower['predict']['p50_ms'] *= 2
+        slower['batch']['eager/threads=1/batch=1']['images_per_second'] /= 2
+        regressed = {item['metric'] for item in compare(slower, report, threshold=0.1)}
+        assert regressed == {'predict/p50_ms', 'batch/eager/threads=1/batch=1/images_per_second'}
+        assert 'predict/p50_ms' in flatten(report)
+
+class TestStartup:
+    """Test cases for the cold-start import budget of the entry points"""
+    
+    def test_app_cold_import_budget(self):
+        """Test that importing the Streamlit app is fast and leaves torch and OpenCV unloaded"""
+        from src.config.settings import BENCHMARK_CONFIG
+        from src.utils.import_profile import cold_import
+        result = cold_import('app')
+        assert not {'torch', 'cv2'} & set(result['heavy_modules'])
+        assert result['seconds'] < BENCHMARK_CONFIG['import_budget_seconds']
+    
+    def test_settings_import_creates_no_directories(self):
+        """Test that directories are only created by ensure_directories, not on import"""
+        import subprocess
+        import sys
+        from src.utils.import_profile import SRC_DIR
+        script = ("import os\n"
+                  "def fail(*args, **kwargs): raise AssertionError('makedirs called on import')\n"
+                  "os.makedirs = fail\n"
+                  "import config.settings\n")
+        subprocess.run([sys.executable, '-c', script], cwd=SRC_DIR, check=True)
+    
+    def test_parse_importtime(self):
+        """Test parsing of python -X importtime output"""
+        from src.utils.import_profile import parse_importtime
+        stderr = ("import time: self [us] | cumulative | imported package\n"
+                  "import time:       120 |        120 |   json.decoder\n"
+                  "import time:       300 |        420 | json\n")
+        entries = parse_importtime(stderr)
+        assert entries == [
+            {'module': 'json.decoder', 'self_us': 120, 'cumulative_us': 120, 'depth': 1},
+            {'module': 'json', 'self_us': 300, 'cumulative_us': 420, 'depth': 0}
+        ]
@@ -1,9 +1,15 @@
 """
 Tests for model components
 """
+import os
+import time
+import threading
 import pytest  # pyright: ignore[reportMissingImports]
 import torch
 from src.models.resnet_model import CNN_NeuralNet, RiceDiseasePredictor
+from src.models.registry import ModelRegistry
+from src.models.batching import MicroBatcher
+from src.models.preprocessing import ImagePreprocessor
 from src.config.settings import CLASS_NAMES
 
 class TestCNN_NeuralNet:
@@ -48,9 +54,718 @@ class TestRiceDiseasePredictor:
         with pytest.raises(Exception):
             predictor = RiceDiseasePredictor(model_path='nonexistent_model.pth')
     
+    def test_predict_batch_matches_predict(self, model_path):
+        """Test that batched prediction agrees with per-image prediction"""
+        from PIL import Image
+        import numpy as np
+        predictor = RiceDiseasePredictor(model_path=model_path, device='cpu')
+        rng = np.random.default_rng(0)
+        images = [Image.fromarray(rng.integers(0, 255, (224, 224, 3), dtype=np.uint8)) for _ in range(4)]
+        assert predictor.predict_batch(images) == [predictor.predict(image) for image in images]
+        assert predictor.predict_batch([]) == []
+    
+    def test_predict_logits(self, model_path):
+        """Test raw logits and the checkpoint digest"""
+        from PIL import Image
+        predictor = RiceDiseasePredictor(model_path=model_path, device='cpu')
+        image = Image.new('RGB', (300, 300), (0, 128, 0))
+        logits = predictor.predict_logits([image, image])
+        assert logits.shape == (2, 9)
+        assert int(logits[0].argmax()) == predictor.predict(image)
+        assert len(predictor.checkpoint_digest) == 32
+    
+    def test_channels_last_and_grad_modes(self, model_path):
+        """Test that the channels_last layout and no_grad mode give the default predictor's logits"""
+        from PIL import Image
+        images = [Image.new('RGB', (300, 300), (0, 128, 0)), Image.new('RGB', (200, 260), (90, 60, 30))]
+        expected = RiceDiseasePredictor(model_path=model_path, device='cpu').predict_logits(images)
+        nhwc = RiceDiseasePredictor(model_path=model_path, device='cpu', channels_last=True)
+        assert nhwc.model.conv1[0].weight.is_contiguous(memory_format=torch.channels_last)
+        assert torch.allclose(nhwc.predict_logits(images), expected, atol=1e-4, rtol=1e-4)
+        no_grad = RiceDiseasePredictor(model_path=model_path, device='cpu', inference_mode=False)
+        assert torch.allclose(no_grad.predict_logits(images), expected)
+    
     def test_class_names(self):
         """Test that class names are properly defined"""
         assert len(CLASS_NAMES) == 9
         assert 'Healthy Rice Leaf' in CLASS_NAMES
         assert 'Neck_Blast' in CLASS_NAMES
         assert 'Leaf Blast' in CLASS_NAMES
+
+class TestModelRegistry:
+    """Test cases for ModelRegistry"""
+    
+    def test_same_key_returns_same_predictor(self, model_path):
+        """Test that a checkpoint is only loaded once per configuration"""
+        registry = ModelRegistry()
+        first = registry.get_predictor(model_path, device='cpu')
+        second = registry.get_predictor(model_path, device=torch.device('cpu'))
+        assert first is second
+        assert first.model is second.model
+        assert len(registry) == 1
+    
+    def test_different_dtype_is_separate_entry(self, model_path):
+        """Test that dtype is part of the registry key"""
+        registry = ModelRegistry()
+        fp32 = registry.get_predictor(model_path, device='cpu')
+        fp64 = registry.get_predictor(model_path, device='cpu', dtype=torch.float64)
+        assert fp32 is not fp64
+        assert next(fp64.model.parameters()).dtype == torch.float64
+    
+    def test_concurrent_get_loads_once(self, model_path):
+        """Test that concurrent callers share one load"""
+        from concurrent.futures import ThreadPoolExecutor
+        registry = ModelRegistry()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            predictors = list(pool.map(lambda _: registry.get_predictor(model_path, device='cpu'), range(16)))
+        assert all(p is predictors[0] for p in predictors)
+    
+    def test_warm_up(self, model_path):
+        """Test warming up a predictor"""
+        registry = ModelRegistry()
+        predictor = registry.warm_up(model_path, device='cpu')
+        assert not predictor.model.training
+        assert registry.warm_up(model_path, device='cpu') is predictor
+
+class TestMicroBatcher:
+    """Test cases for MicroBatcher"""
+    
+    class _RecordingPredictor:
+        def __init__(self):
+            self.batch_sizes = []
+        
+        def predict_batch(self, images):
+            self.batch_sizes.append(len(images))
+            return [image * 2 for image in images]
+    
+    def test_results_routed_to_callers(self):
+        """Test that each caller gets its own result"""
+        predictor = self._RecordingPredictor()
+        batcher = MicroBatcher(predictor, max_batch_size=4, max_wait_ms=50).start()
+        try:
+            futures = [batcher.submit(i) for i in range(10)]
+            assert [f.result(timeout=5) for f in futures] == [i * 2 for i in range(10)]
+        finally:
+            batcher.close()
+        assert max(predictor.batch_sizes) <= 4
+        assert sum(predictor.batch_sizes) == 10
+        assert len(predictor.batch_sizes) < 10
+    
+    def test_errors_propagate(self):
+        """Test that a failing batch fails every future in it"""
+        class FailingPredictor:
+            def predict_batch(self, images):
+                raise RuntimeError("boom")
+        
+        batcher = MicroBatcher(FailingPredictor(), max_wait_ms=1).start()
+        try:
+            with pytest.raises(RuntimeError):
+                batcher.predict(object(), timeout=5)
+        finally:
+            batcher.close()
+    
+    def test_stage_timings_reported(self, model_path):
+        """Test that batched predictions still report preprocess, transfer and forward timings"""
+        from PIL import Image
+        predictor = RiceDiseasePredictor(model_path=model_path, device='cpu')
+        reported = []
+        batcher = MicroBatcher(predictor, max_batch_size=4, max_wait_ms=20, method='predict_logits',
+                               on_timings=reported.append).start()
+        try:
+            futures = [batcher.submit(Image.new('RGB', (256, 256))) for _ in range(3)]
+            assert all(f.result(timeout=30).shape == (9,) for f in futures)
+        finally:
+            batcher.close()
+        assert reported and all({'preprocess', 'transfer', 'forward'} <= set(t) for t in reported)
+    
+    def test_invalid_batch_size(self):
+        """Test that batch size must be positive"""
+        with pytest.raises(ValueError):
+            MicroBatcher(self._RecordingPredictor(), max_batch_size=0)
+    
+    def test_batches_dispatched_concurrently(self):
+        """Test that with max_in_flight the next batch is dispatched before the first one finishes"""
+        from concurrent.futures import Future
+        
+        class AsyncPredictor:
+            def __init__(self):
+                self.pending = []
+            
+            def submit(self, images):
+                future = Future()
+                self.pending.append((images, future))
+                return future
+        
+        predictor = AsyncPredictor()
+        batcher = MicroBatcher(predictor, max_batch_size=2, max_wait_ms=1, method='predict_logits',
+                               max_in_flight=2).start()
+        try:
+            futures = [batcher.submit(i) for i in range(6)]
+            deadline = time.monotonic() + 5
+            while len(predictor.pending) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            time.sleep(0.05)
+            # Two batches are out at once and the third waits for a free slot
+            assert len(predictor.pending) == 2
+            for images, future in list(predictor.pending):
+                future.set_result([image * 2 for image in images])
+            while len(predictor.pending) < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            images, future = predictor.pending[2]
+            future.set_result([image * 2 for image in images])
+            assert [f.result(timeout=5) for f in futures] == [i * 2 for i in range(6)]
+        finally:
+            batcher.close()
+    
+    def test_in_flight_needs_submit(self):
+        """Test that concurrent dispatch is only allowed for predictors returning futures"""
+        with pytest.raises(ValueError):
+            MicroBatcher(self._RecordingPredictor(), method='predict_logits', max_in_flight=2)
+
+class TestImagePreprocessor:
+    """Test cases for the fused ImagePreprocessor"""
+    
+    @pytest.mark.parametrize("size,mode", [((224, 224), 'RGB'), ((640, 480), 'RGB'), ((300, 500), 'RGBA'), ((100, 90), 'L')])
+    def test_matches_training_transform(self, size, mode):
+        """Test bit-identical output to the notebook's Resize/ToTensor/Normalize pipeline"""
+        from PIL import Image
+        import numpy as np
+        from torchvision import transforms
+        reference = transforms.Compose([
+            transforms.Resize((224, 224)),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
+        ])
+        rng = np.random.default_rng(1)
+        image = Image.fromarray(rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)).convert(mode)
+        expected = reference(image.convert('RGB'))
+        assert torch.equal(ImagePreprocessor()(image), expected)
+    
+    def test_batch_shape_and_uint8(self):
+        """Test batched output shapes and the unnormalized uint8 path"""
+        from PIL import Image
+        preprocessor = ImagePreprocessor()
+        images = [Image.new('RGB', (300, 200), (255, 0, 128))] * 3
+        batch = preprocessor.batch(images)
+        assert batch.shape == (3, 3, 224, 224)
+        assert batch.dtype == torch.float32
+        raw = preprocessor.batch(images, normalize=False)
+        assert raw.dtype == torch.uint8
+        assert raw[0, :, 0, 0].tolist() == [255, 0, 128]
+    
+    @staticmethod
+    def field_photo(size, seed=0):
+        """Smooth synthetic photo; pure noise has no meaningful resampled value"""
+        from PIL import Image, ImageFilter
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        noise = Image.fromarray(rng.integers(0, 255, (size[1] // 16, size[0] // 16, 3), dtype=np.uint8))
+        return noise.resize(size, Image.Resampling.BICUBIC).filter(ImageFilter.GaussianBlur(2))
+    
+    @pytest.mark.parametrize("size", [(1600, 1200), (640, 480), (160, 120)])
+    def test_opencv_backend_parity(self, size):
+        """Test that the OpenCV backend stays close to the PIL backend the model was trained with"""
+        from src.models.preprocessing import create_preprocessor
+        image = self.field_photo(size)
+        pil = create_preprocessor('pil').batch([image]).clone()
+        opencv = create_preprocessor('opencv').batch([image])
+        assert opencv.shape == pil.shape == (1, 3, 224, 224)
+        assert opencv.dtype == torch.float32
+        assert (opencv - pil).abs().mean() < 0.02
+        assert (opencv - pil).abs().max() < 0.15
+    
+    def test_opencv_backend_prediction_parity(self, model_path):
+        """Test that both backends yield nearly the same logits"""
+        pil = RiceDiseasePredictor(model_path=model_path, device='cpu', preprocessing='pil')
+        opencv = RiceDiseasePredictor(model_path=model_path, device='cpu', preprocessing='opencv')
+        images = [self.field_photo((1024, 768), seed) for seed in range(4)]
+        expected = pil.predict_logits(images)
+        actual = opencv.predict_logits(images)
+        scale = expected.abs().max()
+        assert (actual - expected).abs().max() < 0.05 * scale
+    
+    def test_unknown_backend(self):
+        """Test that an unknown preprocessing backend is rejected"""
+        from src.models.preprocessing import create_preprocessor
+        with pytest.raises(ValueError):
+            create_preprocessor('simd')
+
+class TestQuantization:
+    """Test cases for static int8 quantization"""
+    
+    def test_quantize_save_and_load(self, model_path, tmp_path):
+        """Test that a quantized checkpoint round-trips and tracks the fp32 model"""
+        from src.models.quantization import quantize_static, save_quantized_model, compare_models
+        fp32 = RiceDiseasePredictor(model_path=model_path, device='cpu', fold_bn=False).model
+        torch.manual_seed(0)
+        calibration = [torch.randn(4, 3, 224, 224) for _ in range(2)]
+        int8 = quantize_static(fp32.state_dict(), calibration)
+        int8_path = str(tmp_path / 'resnet_Model_int8.pth')
+        save_quantized_model(int8, int8_path)
+        
+        predictor = RiceDiseasePredictor(model_path=int8_path, device='cpu', dtype=torch.qint8)
+        report = compare_models(fp32, predictor.model, calibration)
+        assert report['samples'] == 8
+        assert report['top1_agreement'] >= 0.75
+        from PIL import Image
+        assert 0 <= predictor.predict(Image.new('RGB', (256, 256))) < 9
+    
+    def test_quantized_requires_cpu(self, model_path):
+        """Test that int8 inference refuses non-CPU devices"""
+        with pytest.raises(Exception):
+            RiceDiseasePredictor(model_path=model_path, device='meta', dtype=torch.qint8)
+
+class TestOptimization:
+    """Test cases for inference graph optimizations"""
+    
+    def test_fold_batchnorm_matches_unfused(self):
+        """Test that folding BatchNorm keeps outputs within tolerance"""
+        import copy
+        from src.models.optimization import fold_batchnorm, outputs_match
+        torch.manual_seed(0)
+        model = CNN_NeuralNet(3, 9)
+        # Give BatchNorm non-trivial running statistics
+        model.train()
+        with torch.no_grad():
+            model(torch.randn(4, 3, 224, 224))
+        model.eval()
+        folded = fold_batchnorm(copy.deepcopy(model))
+        assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in folded.modules())
+        assert outputs_match(model, folded)
+    
+    def test_predictor_folds_by_default(self, model_path):
+        """Test that the predictor loads a folded graph unless disabled"""
+        folded = RiceDiseasePredictor(model_path=model_path, device='cpu')
+        unfused = RiceDiseasePredictor(model_path=model_path, device='cpu', fold_bn=False)
+        assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in folded.model.modules())
+        assert any(isinstance(m, torch.nn.BatchNorm2d) for m in unfused.model.modules())
+        dummy = torch.randn(1, 3, 224, 224)
+        with torch.no_grad():
+            assert torch.allclose(folded.model(dummy), unfused.model(dummy), atol=1e-3, rtol=1e-3)
+
+    def test_top1_agreement(self):
+        """Test that agreement counts matching argmax classes across batches"""
+        from src.models.optimization import top1_agreement
+        reference = [torch.tensor([[1.0, 0.0], [0.0, 1.0]]), torch.tensor([[2.0, 1.0]])]
+        candidate = [torch.tensor([[0.9, 0.1], [1.0, 0.0]]), torch.tensor([[3.0, 0.0]])]
+        assert top1_agreement(reference, candidate) == pytest.approx(2 / 3)
+        assert top1_agreement([], []) == 1.0
+
+    def test_bf16_autocast_or_fallback(self, model_path):
+        """Test that bf16 runs under autocast where supported and otherwise falls back to fp32"""
+        from src.models.optimization import bf16_supported
+        images = [torch.zeros(3, 224, 224, dtype=torch.uint8)]
+        predictor = RiceDiseasePredictor(model_path=model_path, device='cpu', dtype=torch.bfloat16,
+                                         channels_last=True, min_agreement=0.0)
+        assert predictor.dtype == torch.float32
+        if bf16_supported('cpu'):
+            assert predictor.precision == 'bf16'
+            assert predictor.autocast_dtype == torch.bfloat16
+        else:
+            assert predictor.precision == 'fp32'
+            assert predictor.autocast_dtype is None
+        logits = predictor.predict_pixels(torch.stack(images))
+        assert logits.dtype == torch.float32 and logits.shape == (1, 9)
+
+    def test_bf16_disagreement_falls_back(self, model_path):
+        """Test that bf16 is not enabled when its predictions must agree more than fully with fp32"""
+        predictor = RiceDiseasePredictor(model_path=model_path, device='cpu', dtype=torch.bfloat16,
+                                         min_agreement=1.01)
+        assert predictor.precision == 'fp32'
+        assert predictor.autocast_dtype is None
+
+    def test_agreement_sample_batches(self, model_path, tmp_path):
+        """Test that the bf16 agreement check can load its inputs from a folder of images"""
+        from PIL import Image
+        for i in range(6):
+            Image.new('RGB', (300, 200), (i * 40, 120, 60)).save(tmp_path / f"leaf{i}.jpg")
+        predictor = RiceDiseasePredictor(model_path=model_path, device='cpu')
+        batches = predictor.sample_batches(str(tmp_path), limit=4, batch_size=3)
+        assert [tuple(b.shape) for b in batches] == [(3, 3, 224, 224), (1, 3, 224, 224)]
+        first, second = predictor.sample_batches(str(tmp_path), limit=6, batch_size=3)
+        assert not torch.equal(first, second)
+        assert predictor.sample_batches(str(tmp_path / 'missing')) == []
+        bf16 = RiceDiseasePredictor(model_path=model_path, device='cpu', dtype=torch.bfloat16,
+                                    min_agreement=0.0, agreement_inputs=str(tmp_path))
+        assert bf16.precision in ('bf16', 'fp32')
+
+class TestDistillation:
+    """Test cases for the lightweight student and its distillation workflow"""
+
+    def test_student_is_much_cheaper(self):
+        """Test that the student keeps the output shape at a fraction of the teacher's compute"""
+        from src.models.resnet_model import create_model
+        from src.models.distillation import count_macs
+        teacher, student = create_model('resnet9'), create_model('lite')
+        assert student.eval()(torch.randn(2, 3, 224, 224)).shape == (2, 9)
+        assert count_macs(teacher) / count_macs(student) > 5
+        with pytest.raises(ValueError):
+            create_model('vgg')
+
+    def test_prune_into_copies_strongest_filters(self):
+        """Test that pruning keeps the highest-norm filters and residual channels line up"""
+        from src.models.resnet_model import CNN_LiteNet
+        from src.models.distillation import prune_into
+        torch.manual_seed(0)
+        teacher = CNN_NeuralNet(3, 9).eval()
+        student = prune_into(teacher, CNN_LiteNet(3, 9))
+        scores = teacher.conv1[0].weight.abs().sum(dim=(1, 2, 3))
+        kept = scores.topk(32).indices.sort().values
+        assert torch.equal(student.conv1[0].weight, teacher.conv1[0].weight[kept])
+        assert torch.equal(student.conv1[1].running_var, teacher.conv1[1].running_var[kept])
+        assert student.eval()(torch.randn(1, 3, 224, 224)).shape == (1, 9)
+
+    def test_distill_runs_on_image_classification_base(self):
+        """Test that a distillation epoch trains the student and reports validation metrics"""
+        from src.models.resnet_model import CNN_LiteNet
+        from src.models.distillation import distill
+        torch.manual_seed(0)
+        teacher = CNN_NeuralNet(3, 9).eval()
+        student = CNN_LiteNet(3, 9, width=8)
+        batches = [(torch.randn(4, 3, 64, 64), torch.randint(0, 9, (4,))) for _ in range(2)]
+        before = student.conv2[0].weight.clone()
+        history = distill(student, teacher, batches, batches, epochs=1)
+        assert len(history) == 1
+        assert {'train_loss', 'val_loss', 'val_acc'} <= history[0].keys()
+        assert not torch.equal(before, student.conv2[0].weight)
+
+    def test_predictor_loads_student(self, tmp_path):
+        """Test that the predictor serves a student checkpoint selected by architecture"""
+        from PIL import Image
+        from src.models.resnet_model import CNN_LiteNet
+        path = tmp_path / 'lite_Model.pth'
+        torch.save(CNN_LiteNet(3, 9).state_dict(), path)
+        predictor = RiceDiseasePredictor(model_path=str(path), device='cpu', architecture='lite')
+        assert predictor.predict_logits([Image.new('RGB', (300, 200), (0, 128, 0))]).shape == (1, 9)
+
+class TestCascade:
+    """Test cases for the healthy-leaf gate in front of the full model"""
+
+    @staticmethod
+    def save_gate(path, healthy_bias):
+        """Save a gate whose classifier bias makes every image look healthy (> 0) or diseased (< 0)"""
+        from src.models.resnet_model import CNN_GateNet
+        gate = CNN_GateNet()
+        with torch.no_grad():
+            gate.classifier[-1].weight.zero_()
+            gate.classifier[-1].bias.copy_(torch.tensor([-healthy_bias, healthy_bias]))
+        torch.save(gate.state_dict(), path)
+        return str(path)
+
+    def test_confident_healthy_exits_early(self, model_path, tmp_path):
+        """Test that confidently healthy images skip the full model and are reported as healthy"""
+        calls = []
+        gate_path = self.save_gate(tmp_path / 'gate.pth', 10.0)
+        predictor = RiceDiseasePredictor(model_path=model_path, device='cpu', gate_path=gate_path,
+                                         on_gate=lambda size, escalated: calls.append((size, escalated)))
+        predictor.runner = None  # the full model must not run
+        logits = predictor.predict_pixels(torch.zeros(2, 3, 224, 224, dtype=torch.uint8))
+        probabilities = torch.softmax(logits, dim=1)
+        assert (logits.argmax(dim=1) == 3).all()
+        assert probabilities[:, 3].min() > 0.99
+        assert probabilities.sum(dim=1).allclose(torch.ones(2))
+        assert calls == [(2, 0)]
+        assert '+gate' in predictor.checkpoint_digest
+
+    def test_unsure_images_escalate(self, model_path, tmp_path):
+        """Test that images below the threshold get the full model's logits"""
+        calls = []
+        gate_path = self.save_gate(tmp_path / 'gate.pth', -10.0)
+        pixels = torch.randint(0, 255, (3, 3, 224, 224), dtype=torch.uint8)
+        expected = RiceDiseasePredictor(model_path=model_path, device='cpu').predict_pixels(pixels)
+        predictor = RiceDiseasePredictor(model_path=model_path, device='cpu', gate_path=gate_path,
+                                         on_gate=lambda size, escalated: calls.append((size, escalated)))
+        assert torch.allclose(predictor.predict_pixels(pixels), expected)
+        assert calls == [(3, 3)]
+
+    def test_healthy_vs_rest_keeps_probabilities(self):
+        """Test that collapsed teacher logits give the healthy class its original probability"""
+        from src.models.distillation import HealthyVsRest
+        torch.manual_seed(0)
+        logits = torch.randn(4, 9)
+        collapsed = HealthyVsRest(lambda x: x, healthy_index=3)(logits)
+        assert torch.allclose(torch.softmax(collapsed, dim=1)[:, 1], torch.softmax(logits, dim=1)[:, 3])
+
+class TestBackends:
+    """Test cases for selectable inference backends"""
+    
+    def _predictions_match(self, a, b):
+        from PIL import Image
+        import numpy as np
+        rng = np.random.default_rng(2)
+        images = [Image.fromarray(rng.integers(0, 255, (224, 224, 3), dtype=np.uint8)) for _ in range(3)]
+        return torch.allclose(a.predict_logits(images), b.predict_logits(images), atol=1e-3, rtol=1e-3)
+    
+    def test_torchscript_parity(self, model_path):
+        """Test that the TorchScript backend matches eager outputs"""
+        eager = RiceDiseasePredictor(model_path=model_path, device='cpu')
+        scripted = RiceDiseasePredictor(model_path=model_path, device='cpu', backend='torchscript')
+        assert scripted.backend == 'torchscript'
+        assert self._predictions_match(eager, scripted)
+    
+    def test_onnxruntime_parity(self, model_path, tmp_path):
+        """Test that an exported ONNX model served by onnxruntime matches eager outputs"""
+        pytest.importorskip('onnxruntime')
+        from src.models.backends import export_onnx
+        eager = RiceDiseasePredictor(model_path=model_path, device='cpu')
+        onnx_path = str(tmp_path / 'model.onnx')
+        export_onnx(eager.model, onnx_path)
+        onnx = RiceDiseasePredictor(model_path=model_path, device='cpu', backend='onnxruntime', onnx_path=onnx_path)
+        assert onnx.backend == 'onnxruntime'
+        assert self._predictions_match(eager, onnx)
+    
+    def test_missing_artifact_falls_back_to_eager(self, model_path, tmp_path):
+        """Test automatic fallback when a backend can't be used"""
+        predictor = RiceDiseasePredictor(model_path=model_path, device='cpu', backend='onnxruntime',
+                                         onnx_path=str(tmp_path / 'missing.onnx'))
+        assert predictor.backend == 'eager'
+        assert predictor.runner is predictor.model
+    
+    def test_export_torchscript(self, model_path, tmp_path):
+        """Test that an exported TorchScript artifact loads without the model class"""
+        from src.models.backends import export_torchscript
+        eager = RiceDiseasePredictor(model_path=model_path, device='cpu')
+        path = str(tmp_path / 'model.ts')
+        export_torchscript(eager.model, path)
+        loaded = torch.jit.load(path)
+        dummy = torch.randn(1, 3, 224, 224)
+        with torch.no_grad():
+            assert torch.allclose(loaded(dummy), eager.model(dummy), atol=1e-3, rtol=1e-3)
+
+class TestFlushDenormal:
+    """Test cases for per-thread denormal flushing"""
+    
+    @staticmethod
+    def in_thread(fn):
+        result = []
+        thread = threading.Thread(target=lambda: result.append(fn()))
+        thread.start()
+        thread.join()
+        return result[0]
+    
+    def test_applied_in_inference_thread(self, model_path):
+        """Test that the thread running forward passes flushes denormals, not only the one configuring it"""
+        from PIL import Image
+        if not torch.set_flush_denormal(False):
+            pytest.skip("CPU does not support flushing denormals")
+        predictor = RiceDiseasePredictor(model_path=model_path, device='cpu', flush_denormal=True)
+        denormal = torch.tensor([1e-39])
+        
+        def predict_then_check():
+            predictor.predict_logits([Image.new('RGB', (224, 224))])
+            return (denormal * 1.0).item()
+        
+        assert self.in_thread(lambda: (denormal * 1.0).item()) != 0.0
+        assert self.in_thread(predict_then_check) == 0.0
+
+class TestInferenceWorkerPool:
+    """Test cases for the multi-process inference pool"""
+    
+    def test_pool_matches_in_process_predictor(self, model_path):
+        """Test that workers using shared weights agree with in-process inference"""
+        from PIL import Image
+        import numpy as np
+        from src.models.worker_pool import InferenceWorkerPool
+        predictor = RiceDiseasePredictor(model_path=model_path, device='cpu')
+        pool = InferenceWorkerPool(model_path, num_workers=2, threads_per_worker=1)
+        try:
+            assert all(p.is_shared() for p in pool.model.parameters())
+            rng = np.random.default_rng(3)
+            images = [Image.fromarray(rng.integers(0, 255, (256, 256, 3), dtype=np.uint8)) for _ in range(3)]
+            futures = [pool.submit([image]) for image in images]
+            pooled = torch.cat([f.result(timeout=60) for f in futures])
+            assert torch.allclose(pooled, predictor.predict_logits(images), atol=1e-4)
+            assert pool.predict_batch(images, timeout=60) == predictor.predict_batch(images)
+            assert pool.checkpoint_digest == predictor.checkpoint_digest
+        finally:
+            pool.close()
+    
+    def test_batcher_keeps_workers_busy(self, model_path):
+        """Test that a micro-batcher in front of the pool runs batches on several workers at once"""
+        from PIL import Image
+        from src.models.worker_pool import InferenceWorkerPool
+        pool = InferenceWorkerPool(model_path, num_workers=2, threads_per_worker=1)
+        pool.warm_up()
+        outstanding, peak = [0], [0]
+        lock = threading.Lock()
+        submit = pool.submit
+        
+        def counting_submit(images, timings=None):
+            with lock:
+                outstanding[0] += 1
+                peak[0] = max(peak[0], outstanding[0])
+            future = submit(images, timings=timings)
+            
+            def finished(_):
+                with lock:
+                    outstanding[0] -= 1
+            future.add_done_callback(finished)
+            return future
+        
+        pool.submit = counting_submit
+        batcher = MicroBatcher(pool, max_batch_size=1, max_wait_ms=1, method='predict_logits',
+                               max_in_flight=2).start()
+        try:
+            futures = [batcher.submit(Image.new('RGB', (224, 224), (i, 100, 50))) for i in range(8)]
+            assert all(f.result(timeout=60).shape == (9,) for f in futures)
+        finally:
+            batcher.close()
+            pool.close()
+        assert peak[0] == 2
+    
+    def test_pool_rejects_unsupported_settings(self, model_path):
+        """Test that settings the workers can't honour fail loudly instead of running in fp32 eager"""
+        from src.models.worker_pool import InferenceWorkerPool
+        for options in ({'dtype': torch.qint8}, {'backend': 'torchscript'}, {'gate_path': model_path}):
+            with pytest.raises(ValueError):
+                InferenceWorkerPool(model_path, num_workers=1, **options)
+    
+    def test_pool_channels_last_bf16(self, model_path):
+        """Test that workers honour channels_last and, where supported, bf16 autocast"""
+        from PIL import Image
+        from src.models.worker_pool import InferenceWorkerPool
+        images = [Image.new('RGB', (224, 224), (i * 60, 120, 40)) for i in range(3)]
+        predictor = RiceDiseasePredictor(model_path=model_path, device='cpu', dtype=torch.bfloat16,
+                                         channels_last=True, min_agreement=0.0)
+        pool = InferenceWorkerPool(model_path, num_workers=1, dtype=torch.bfloat16, channels_last=True,
+                                   min_agreement=0.0)
+        try:
+            assert pool.model.conv1[0].weight.is_contiguous(memory_format=torch.channels_last)
+            assert pool.precision == predictor.precision
+            assert torch.allclose(pool.predict_logits(images, timeout=60), predictor.predict_logits(images),
+                                  atol=1e-2)
+        finally:
+            pool.close()
+    
+    def test_dead_worker_fails_its_requests_and_restarts(self, model_path):
+        """Test that requests held by a killed worker fail instead of hanging, and the worker comes back"""
+        import signal
+        from PIL import Image
+        from src.models.worker_pool import InferenceWorkerPool
+        pool = InferenceWorkerPool(model_path, num_workers=1, threads_per_worker=1)
+        try:
+            pool.warm_up()
+            worker = pool._workers[0]
+            os.kill(worker.pid, signal.SIGKILL)
+            worker.join(timeout=10)
+            future = pool.submit([Image.new('RGB', (224, 224))])
+            with pytest.raises(RuntimeError, match='exited'):
+                future.result(timeout=30)
+            assert pool.restarts == 1
+            assert pool.predict_batch([Image.new('RGB', (224, 224))], timeout=60)[0] in range(9)
+        finally:
+            pool.close()
+
+class TestCheckpointLoading:
+    """Test cases for memory-mapped checkpoint loading and conversion"""
+    
+    def test_mmap_and_eager_load_agree(self, model_path):
+        """Test that mmap loading yields the same weights"""
+        from src.models.resnet_model import load_state_dict
+        mapped = load_state_dict(model_path, mmap=True)
+        loaded = load_state_dict(model_path, mmap=False)
+        assert mapped.keys() == loaded.keys()
+        assert all(torch.equal(mapped[k], loaded[k]) for k in loaded)
+    
+    def test_legacy_checkpoint_falls_back(self, tmp_path):
+        """Test that legacy checkpoints still load when mmap is requested"""
+        from src.models.resnet_model import load_state_dict
+        path = str(tmp_path / 'legacy.pth')
+        torch.save(CNN_NeuralNet(3, 9).state_dict(), path, _use_new_zipfile_serialization=False)
+        predictor = RiceDiseasePredictor(model_path=path, device='cpu', mmap=True)
+        assert len(load_state_dict(path)) > 0
+        assert predictor.model is not None
+    
+    def test_convert_checkpoint(self, tmp_path):
+        """Test converting a legacy whole-model checkpoint to an mmap-able state dict"""
+        from click.testing import CliRunner
+        from src.cli import cli
+        legacy = str(tmp_path / 'legacy.pth')
+        output = str(tmp_path / 'converted.pth')
+        model = CNN_NeuralNet(3, 9)
+        torch.save(model, legacy, _use_new_zipfile_serialization=False)
+        result = CliRunner().invoke(cli, ['convert-checkpoint', '--model-path', legacy, '--output', output])
+        assert result.exit_code == 0, result.output
+        converted = torch.load(output, weights_only=True, mmap=True)
+        assert torch.equal(converted['classifier.2.weight'], model.state_dict()['classifier.2.weight'])
+
+    def test_prefolded_checkpoint_stays_mapped(self, model_path, tmp_path):
+        """Test that a --fold-bn checkpoint loads without folding at start-up and keeps its weights mapped"""
+        from click.testing import CliRunner
+        from src.cli import cli
+        output = str(tmp_path / 'folded.pth')
+        result = CliRunner().invoke(cli, ['convert-checkpoint', '--model-path', model_path, '--output', output,
+                                          '--fold-bn'])
+        assert result.exit_code == 0, result.output
+        prefolded = RiceDiseasePredictor(model_path=output, device='cpu')
+        reference = RiceDiseasePredictor(model_path=model_path, device='cpu', fold_bn=False)
+        assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in prefolded.model.modules())
+        if os.path.exists('/proc/self/maps'):
+            regions = []
+            with open('/proc/self/maps') as f:
+                for line in f:
+                    if line.rstrip().endswith(os.path.realpath(output)):
+                        start, end = (int(address, 16) for address in line.split()[0].split('-'))
+                        regions.append((start, end))
+            tensors = list(prefolded.model.state_dict().values())
+            assert all(any(start <= t.data_ptr() < end for start, end in regions) for t in tensors)
+        dummy = torch.randn(1, 3, 224, 224)
+        with torch.no_grad():
+            assert torch.allclose(prefolded.model(dummy), reference.model(dummy), atol=1e-3, rtol=1e-3)
+
+class TestPostprocessing:
+    """Test cases for structured prediction results"""
+    
+    def test_postprocess_fields(self):
+        """Test probabilities, top-k, entropy and the uncertainty flag"""
+        from src.models.postprocessing import postprocess
+        logits = torch.tensor([0.5, 5.0, 1.0] + [0.0] * 6)
+        result = postprocess(logits, CLASS_NAMES, top_k=3, uncertainty_threshold=0.5)
+        assert result.class_index == 1
+        assert result.class_name == CLASS_NAMES[1]
+        assert sum(result.probabilities) == pytest.approx(1.0)
+        assert [name for name, _ in result.top_k] == [CLASS_NAMES[1], CLASS_NAMES[2], CLASS_NAMES[0]]
+        assert result.confidence == pytest.approx(result.top_k[0][1])
+        assert 0 < result.entropy < torch.log(torch.tensor(9.0)).item()
+        assert not result.uncertain
+    
+    def test_uniform_logits_are_uncertain(self):
+        """Test that a flat distribution is flagged as uncertain"""
+        from src.models.postprocessing import postprocess
+        result = postprocess(torch.zeros(9), CLASS_NAMES, uncertainty_threshold=0.5)
+        assert result.uncertain
+        assert result.entropy == pytest.approx(torch.log(torch.tensor(9.0)).item(), rel=1e-4)
+    
+    def test_temperature_softens(self):
+        """Test that a higher temperature lowers confidence without changing the class"""
+        from src.models.postprocessing import postprocess
+        logits = torch.tensor([3.0, 1.0, 0.0])
+        sharp = postprocess(logits, temperature=1.0)
+        soft = postprocess(logits, temperature=3.0)
+        assert soft.class_index == sharp.class_index
+        assert soft.confidence < sharp.confidence
+    
+    def test_fit_temperature_recovers_scale(self, tmp_path):
+        """Test that fitting recovers the temperature of over-confident logits"""
+        from src.models.postprocessing import fit_temperature, save_temperature, load_temperature
+        torch.manual_seed(0)
+        labels = torch.randint(0, 9, (2000,))
+        calibrated = torch.randn(2000, 9)
+        calibrated[torch.arange(2000), labels] += 2.0
+        # Sample labels from the calibrated distribution, then make logits 3x over-confident
+        sampled = torch.distributions.Categorical(logits=calibrated).sample()
+        temperature = fit_temperature(calibrated * 3, sampled)
+        assert temperature == pytest.approx(3.0, rel=0.15)
+        path = str(tmp_path / 'temperature.json')
+        save_temperature(temperature, path)
+        assert load_temperature(path) == pytest.approx(temperature)
+        assert load_temperature(str(tmp_path / 'missing.json')) == 1.0
+    
+    def test_predictor_results_single_pass(self, model_path):
+        """Test that predict_results agrees with predict"""
+        from PIL import Image
+        predictor = RiceDiseasePredictor(model_path=model_path, device='cpu', class_names=CLASS_NAMES)
+        image = Image.new('RGB', (256, 256), (30, 90, 30))
+        result = predictor.predict_results([image])[0]
+        assert result.class_index == predictor.predict(image)
+        assert result.class_name == CLASS_NAMES[result.class_index]
@@ -0,0 +1,172 @@
+"""
+Tests for the HTTP inference service
+"""
+import io
+import asyncio
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from PIL import Image
+
+from src.server import InferenceServer, InferenceService
+from src.services.inference_client import InferenceClient
+from src.services.treatment_service import TreatmentService
+from src.services.prediction_cache import PredictionCache
+from src.services.upload_archive import UploadArchive
+from src.models.resnet_model import RiceDiseasePredictor
+from src.models.batching import MicroBatcher
+from src.utils.metrics import MetricsRegistry
+
+def encode_image(size=(320, 240), fmt='JPEG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (40, 160, 60)).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+def run_with_server(service, check):
+    """Start a server on a free port, run the blocking check against it, then shut down"""
+    async def scenario():
+        server = await InferenceServer(service, host='127.0.0.1', port=0).start()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, check, f"http://127.0.0.1:{server.port}")
+        finally:
+            await server.close()
+    return asyncio.run(scenario())
+
+class TestInferenceServer:
+    """Test cases for the HTTP endpoints"""
+    
+    @pytest.fixture
+    def service(self, model_path):
+        predictor = RiceDiseasePredictor(model_path=model_path, device='cpu')
+        return InferenceService(predictor, TreatmentService(), cache=PredictionCache(), metrics=MetricsRegistry())
+    
+    def test_predict(self, service):
+        """Test single-image prediction returns class, probabilities and treatment"""
+        result = run_with_server(service, lambda url: InferenceClient(url).predict(encode_image()))
+        assert 0 <= result['class_index'] < 9
+        assert result['class_name'] == result['top_k'][0][0]
+        assert sum(result['probabilities']) == pytest.approx(1.0, abs=1e-4)
+        if result['uncertain']:
+            assert result['treatment'] is None
+        else:
+            assert len(result['treatment']) > 0
+    
+    def test_predict_batch(self, service):
+        """Test batch prediction returns one result per image"""
+        images = [encode_image(), encode_image((500, 400), 'PNG')]
+        results = run_with_server(service, lambda url: InferenceClient(url).predict_batch(images))
+        assert len(results) == 2
+        single = service.predict(images[0])
+        assert results[0]['class_index'] == single['class_index']
+    
+    def test_uploads_archived(self, model_path, tmp_path):
+        """Test that predictions are archived with their upload, without the treatment text"""
+        predictor = RiceDiseasePredictor(model_path=model_path, device='cpu')
+        archive = UploadArchive(str(tmp_path), roll_up_seconds=None)
+        service = InferenceService(predictor, TreatmentService(), cache=PredictionCache(), metrics=MetricsRegistry(),
+                                   archive=archive)
+        image = encode_image()
+        service.predict(image)
+        service.predict_many([image, encode_image((500, 400), 'PNG')])
+        archive.close()
+        records = list(archive.iter_records())
+        assert len(records) == 3
+        assert archive.stats()['written'] == 2
+        assert records[0]['source'] == 'api' and 'treatment' not in records[0]['prediction']
+        assert records[2]['timings']['batch_size'] == 2
+        assert archive.read_image(records[0]['digest'], records[0]['ext']) == image
+    
+    def test_invalid_image(self, service):
+        """Test that undecodable uploads are rejected with a client error"""
+        with pytest.raises(RuntimeError, match="422"):
+            run_with_server(service, lambda url: InferenceClient(url).predict(b'not an image'))
+    
+    def test_health_and_metrics(self, service):
+        """Test health check and Prometheus metrics"""
+        def check(url):
+            client = InferenceClient(url)
+            healthy = client.healthy()
+            client.predict(encode_image())
+            with urllib.request.urlopen(f"{url}/metrics") as response:
+                return healthy, response.read().decode()
+        healthy, metrics = run_with_server(service, check)
+        assert healthy
+        assert 'rice_http_requests_total{path="/predict",status="200"} 1' in metrics
+        assert 'rice_cache_requests_total{result="miss"} 1' in metrics
+        for stage in ('decode', 'preprocess', 'forward', 'postprocess'):
+            assert f'rice_stage_seconds_quantile{{stage="{stage}",quantile="0.99"}}' in metrics
+    
+    def test_unknown_route(self, service):
+        """Test that unknown paths return 404"""
+        def check(url):
+            try:
+                urllib.request.urlopen(f"{url}/nope")
+            except urllib.error.HTTPError as e:
+                return e.code
+        assert run_with_server(service, check) == 404
+    
+    def test_bad_content_length(self, service):
+        """Test that a non-numeric or negative Content-Length is a client error, not a 500"""
+        import http.client
+        from urllib.parse import urlparse
+        
+        def check(url):
+            statuses = []
+            for value in ('abc', '-5', ''):
+                connection = http.client.HTTPConnection(urlparse(url).netloc, timeout=10)
+                connection.putrequest('POST', '/predict')
+                connection.putheader('Content-Length', value)
+                connection.endheaders()
+                statuses.append(connection.getresponse().status)
+                connection.close()
+            return statuses
+        # An empty header counts as no body, which /predict rejects as well
+        assert run_with_server(service, check) == [400, 400, 400]
+    
+    def test_batch_uses_cache(self, service):
+        """Test that batch requests reuse and fill the prediction cache"""
+        image = encode_image()
+        single = service.predict(image)
+        results = service.predict_many([image, encode_image((500, 400), 'PNG')])
+        assert results[0]['probabilities'] == pytest.approx(single['probabilities'])
+        assert service.cache.stats() == {'hits': 1, 'misses': 2, 'hit_rate': pytest.approx(1 / 3), 'size': 2}
+    
+    def test_batches_not_capped_by_executor(self, model_path):
+        """Test that concurrent requests share a batch even with a single executor thread"""
+        predictor = RiceDiseasePredictor(model_path=model_path, device='cpu')
+        sizes = []
+        batcher = MicroBatcher(predictor, max_batch_size=16, max_wait_ms=200, method='predict_logits',
+                               on_batch=lambda size, seconds: sizes.append(size)).start()
+        service = InferenceService(predictor, TreatmentService(), batcher=batcher, metrics=MetricsRegistry())
+        images = [encode_image((320 + i, 240)) for i in range(6)]
+        
+        async def scenario():
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                return await asyncio.gather(*(service.predict_async(image, executor) for image in images))
+        
+        try:
+            results = asyncio.run(scenario())
+        finally:
+            batcher.close()
+        assert len(results) == 6
+        assert max(sizes) > 1
+
+class TestModelOptions:
+    """Test cases for the predictor settings shared by the app and the inference service"""
+    
+    def test_options_fit_predictor_and_pool(self, monkeypatch):
+        """Test that the shared options bind to the predictor and the worker pool, gate included"""
+        import inspect
+        import torch
+        from src.config import settings
+        from src.models.worker_pool import InferenceWorkerPool
+        monkeypatch.setitem(settings.MODEL_CONFIG, 'gate_enabled', True)
+        options = settings.model_options('cpu', on_gate=print)
+        assert options['on_gate'] is print and options['healthy_index'] == 3
+        inspect.signature(RiceDiseasePredictor).bind(**options)
+        inspect.signature(InferenceWorkerPool).bind(**settings.worker_pool_options())
+        monkeypatch.setitem(settings.MODEL_CONFIG, 'precision', 'int8')
+        options = settings.model_options('cuda')
+        assert options['device'] == 'cpu' and options['dtype'] == torch.qint8
+        assert options['model_path'] == settings.MODEL_CONFIG['quantized_model_path']
@@ -3,6 +3,9 @@ Tests for service components
 """
 import pytest
 from src.services.treatment_service import TreatmentService
+from src.services.prediction_cache import PredictionCache
+from src.services.bulk_prediction import BulkPredictionJob, read_manifest
+from src.services.upload_archive import UploadArchive, image_extension
 
 class TestTreatmentService:
     """Test cases for TreatmentService"""
@@ -49,3 +52,241 @@ class TestTreatmentService:
             treatment = self.service.get_treatment(disease_name)
             assert treatment is not None
             assert len(treatment) > 0
+    
+    def test_structured_lookup(self):
+        """Test the structured treatment lookup"""
+        info = self.service.get_treatment_info('Neck_Blast')
+        assert info['title'] == self.service.treatments['Neck_Blast']['title']
+        assert self.service.get_treatment_info('Invalid Disease') is None
+    
+    def test_rendered_once_per_process(self):
+        """Test that new services share the already rendered catalogue"""
+        other = TreatmentService()
+        assert other.catalogue is self.service.catalogue
+        assert other.get_treatment('Leaf Blast') is self.service.get_treatment('Leaf Blast')
+    
+    def test_hot_reload(self, tmp_path):
+        """Test that edits to the data file are picked up without a restart"""
+        import json
+        import os
+        with open(self.service.data_path, encoding='utf-8') as f:
+            data = json.load(f)
+        path = tmp_path / "treatments.json"
+        path.write_text(json.dumps(data), encoding='utf-8')
+        service = TreatmentService(data_path=str(path), reload_interval=0)
+        assert 'Edited title' not in service.get_treatment('Neck_Blast')
+        
+        data['languages']['bn']['diseases']['Neck_Blast']['title'] = 'Edited title'
+        path.write_text(json.dumps(data), encoding='utf-8')
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        assert 'Edited title' in service.get_treatment('Neck_Blast')
+
+class TestPredictionCache:
+    """Test cases for PredictionCache"""
+    
+    def test_key_depends_on_bytes_and_model(self):
+        """Test that keys change with either the image or the checkpoint"""
+        key = PredictionCache.make_key(b'image', 'model-a')
+        assert key == PredictionCache.make_key(b'image', 'model-a')
+        assert key != PredictionCache.make_key(b'other', 'model-a')
+        assert key != PredictionCache.make_key(b'image', 'model-b')
+    
+    def test_fingerprint_covers_serving_config(self):
+        """Test that precision, backend, preprocessing and caller settings all change the fingerprint"""
+        from types import SimpleNamespace
+        predictor = SimpleNamespace(checkpoint_digest='abc', precision='fp32', backend='eager', preprocessing='pil')
+        base = PredictionCache.fingerprint(predictor, decode_size=(448, 448), enhance=False)
+        assert base == PredictionCache.fingerprint(predictor, enhance=False, decode_size=(448, 448))
+        assert base != PredictionCache.fingerprint(predictor, decode_size=(448, 448), enhance=True)
+        assert base != PredictionCache.fingerprint(predictor, decode_size=(896, 896), enhance=False)
+        for name, value in (('precision', 'bf16'), ('backend', 'onnxruntime'), ('preprocessing', 'opencv'),
+                            ('checkpoint_digest', 'abc+gate0.95-def')):
+            changed = SimpleNamespace(**dict(vars(predictor), **{name: value}))
+            assert base != PredictionCache.fingerprint(changed, decode_size=(448, 448), enhance=False)
+    
+    def test_hit_and_miss_counters(self):
+        """Test hit/miss accounting"""
+        cache = PredictionCache()
+        assert cache.get('k') is None
+        cache.put('k', 3, [0.1, 0.2, 0.7])
+        cached = cache.get('k')
+        assert cached.class_index == 3
+        assert cached.logits == pytest.approx([0.1, 0.2, 0.7])
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+    
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted"""
+        cache = PredictionCache(max_entries=2)
+        cache.put('a', 0, [])
+        cache.put('b', 1, [])
+        cache.get('a')
+        cache.put('c', 2, [])
+        assert cache.get('b') is None
+        assert cache.get('a') is not None
+        assert len(cache) == 2
+    
+    def test_ttl_expiry(self, monkeypatch):
+        """Test that entries expire after the TTL"""
+        import time
+        now = [1000.0]
+        monkeypatch.setattr(time, 'time', lambda: now[0])
+        cache = PredictionCache(ttl_seconds=10)
+        cache.put('k', 1, [])
+        now[0] += 11
+        assert cache.get('k') is None
+    
+    def test_disk_tier_survives_restart(self, tmp_path):
+        """Test that the on-disk tier is read by a fresh cache"""
+        PredictionCache(disk_dir=str(tmp_path)).put('abcd', 5, [1.0, 2.0])
+        fresh = PredictionCache(disk_dir=str(tmp_path))
+        cached = fresh.get('abcd')
+        assert cached is not None
+        assert cached.class_index == 5
+        assert len(fresh) == 1
+
+    def test_disk_tier_is_bounded(self, tmp_path):
+        """Test that writes sweep the disk tier down to its least recently used entries"""
+        import os
+        import time
+        cache = PredictionCache(disk_dir=str(tmp_path), max_disk_entries=10)
+        for i in range(10):
+            cache.put(f"{i:04x}", i, [])
+            past = time.time() - 100 + i
+            os.utime(cache._disk_path(f"{i:04x}"), (past, past))
+        cache.clear()
+        assert cache.get('0000') is not None  # Reading marks it recently used
+        cache.put('00aa', 10, [])
+        assert len(list(tmp_path.rglob('*.json'))) == 10
+        assert not os.path.exists(cache._disk_path('0001'))
+        assert os.path.exists(cache._disk_path('0000'))
+
+    def test_disk_sweep_drops_expired(self, tmp_path):
+        """Test that expired disk entries are removed without being read again"""
+        import os
+        cache = PredictionCache(ttl_seconds=60, disk_dir=str(tmp_path))
+        cache.put('abcd', 1, [])
+        cache.put('ef01', 2, [])
+        os.utime(cache._disk_path('abcd'), (0, 0))
+        assert cache.sweep_disk() == 1
+        assert not os.path.exists(cache._disk_path('abcd'))
+        assert os.path.exists(cache._disk_path('ef01'))
+
+
+class TestBulkPredictionJob:
+    """Test cases for resumable bulk prediction"""
+
+    @staticmethod
+    def batches(paths, start, batch_size=2):
+        for i in range(start, len(paths), batch_size):
+            indices = list(range(i, min(i + batch_size, len(paths))))
+            yield None, indices, [True] * len(indices)
+
+    @staticmethod
+    def predict_rows(paths):
+        def rows(pixels, indices, ok):
+            return [{'path': paths[i], 'class_index': i, 'class_name': None, 'confidence': 1.0,
+                     'entropy': 0.0, 'uncertain': False, 'top_k': [], 'error': None} for i in indices]
+        return rows
+
+    @pytest.mark.parametrize('extension', ['csv', 'jsonl'])
+    def test_resume_writes_each_image_once(self, tmp_path, extension):
+        """Test that an interrupted run resumes after its last checkpoint without duplicates"""
+        paths = [f"img{i}.jpg" for i in range(7)]
+        output = str(tmp_path / f"out.{extension}")
+
+        job = BulkPredictionJob(paths, output, checkpoint_every=2)
+        seen = []
+
+        def interrupted(pixels, indices, ok):
+            if indices[0] >= 4:
+                raise KeyboardInterrupt
+            seen.extend(indices)
+            return self.predict_rows(paths)(pixels, indices, ok)
+
+        with pytest.raises(KeyboardInterrupt):
+            job.run(self.batches(paths, job.offset), interrupted)
+
+        resumed = BulkPredictionJob(paths, output, checkpoint_every=2)
+        assert resumed.offset == 4
+        assert resumed.run(self.batches(paths, resumed.offset), self.predict_rows(paths)) == 3
+        assert resumed.done
+
+        with open(output, encoding='utf-8') as f:
+            lines = [line for line in f.read().splitlines() if line]
+        header = 1 if extension == 'csv' else 0
+        assert len(lines) == len(paths) + header
+
+    def test_changed_inputs_are_rejected(self, tmp_path):
+        """Test that a checkpoint is not applied to a different input list"""
+        output = str(tmp_path / "out.jsonl")
+        job = BulkPredictionJob(['a.jpg'], output)
+        job.run(self.batches(['a.jpg'], 0), self.predict_rows(['a.jpg']))
+        with pytest.raises(ValueError):
+            BulkPredictionJob(['b.jpg'], output)
+        assert BulkPredictionJob(['b.jpg'], output, restart=True).offset == 0
+
+    def test_read_manifest(self, tmp_path):
+        """Test that manifest paths are resolved relative to the manifest"""
+        manifest = tmp_path / "images.txt"
+        manifest.write_text("# field survey\nleaf1.jpg\n\n/data/leaf2.jpg\n")
+        assert read_manifest(str(manifest)) == [str(tmp_path / "leaf1.jpg"), "/data/leaf2.jpg"]
+
+
+class TestUploadArchive:
+    """Test cases for the background upload archive"""
+
+    JPEG = b'\xff\xd8\xff\xe0' + b'leaf' * 16
+    PNG = b'\x89PNG\r\n\x1a\n' + b'leaf' * 16
+
+    def test_image_extension(self):
+        """Test that the stored extension follows the image signature"""
+        assert image_extension(self.JPEG) == 'jpg'
+        assert image_extension(self.PNG) == 'png'
+        assert image_extension(b'RIFF\x00\x00\x00\x00WEBPVP8 ') == 'webp'
+        assert image_extension(b'not an image') == 'bin'
+
+    def test_duplicates_stored_once(self, tmp_path):
+        """Test that repeated uploads share one sharded object but each gets a record"""
+        archive = UploadArchive(str(tmp_path), roll_up_seconds=None)
+        for _ in range(3):
+            assert archive.submit(self.JPEG, {'class_index': 1}, timings={'total_ms': 5.0}, source='test')
+        archive.submit(self.PNG, {'class_index': 2})
+        archive.close()
+
+        assert archive.stats() == {'written': 2, 'duplicate': 2, 'dropped': 0, 'error': 0, 'queued': 0}
+        digest = archive.digest(self.JPEG)
+        path = tmp_path / 'objects' / digest[:2] / digest[2:4] / f"{digest}.jpg"
+        assert path.read_bytes() == self.JPEG
+        records = list(archive.iter_records())
+        assert len(records) == 4
+        assert records[0]['digest'] == digest and records[0]['source'] == 'test'
+        assert records[0]['timings'] == {'total_ms': 5.0}
+
+    def test_full_queue_drops_instead_of_blocking(self, tmp_path):
+        """Test that submit never waits for the writer"""
+        events = []
+        archive = UploadArchive(str(tmp_path), max_queue=1, on_event=events.append)
+        archive._thread = object()  # Pretend the writer is running but stalled
+        assert archive.submit(self.JPEG, {})
+        assert not archive.submit(self.PNG, {})
+        assert events == ['dropped']
+
+    def test_roll_up_into_batch(self, tmp_path):
+        """Test that journals and loose objects roll into a tar batch and stay readable and deduplicated"""
+        archive = UploadArchive(str(tmp_path), roll_up_seconds=None)
+        archive.write(self.JPEG, {'prediction': {'class_index': 1}})
+        archive.write(self.PNG, {'prediction': {'class_index': 2}})
+        assert archive.roll_up() is None  # The current hour is still open
+
+        batch = archive.roll_up(include_current=True)
+        assert batch is not None and batch.endswith('.tar')
+        assert not list((tmp_path / 'objects').rglob('*.jpg'))
+        assert not list((tmp_path / 'records').iterdir())
+        assert [r['prediction']['class_index'] for r in archive.iter_records()] == [1, 2]
+        assert archive.read_image(archive.digest(self.PNG), 'png') == self.PNG
+
+        # A rolled-up image is not stored again, even by a new process
+        assert not UploadArchive(str(tmp_path)).write(self.JPEG, {'prediction': {'class_index': 1}})
+        assert len(list(archive.iter_records())) == 3
@@ -1,12 +1,16 @@
 """
 Tests for utility functions
 """
+import io
 import pytest
 import torch
 from PIL import Image
 import numpy as np
-from src.utils.device_utils import get_device, to_device
-from src.utils.image_utils import preprocess_image, validate_image
+from src.utils.device_utils import get_device, to_device, available_cpus, parse_cpu_list, autotune_threads
+from src.utils.image_utils import preprocess_image, validate_image, open_image, decode_image
+from src.utils.image_utils import enhance_image, enhance_images
+from src.utils.metrics import MetricsRegistry
+from src.utils.assets import AssetCache, build_assets, pick_width
 
 class TestDeviceUtils:
     """Test cases for device utilities"""
@@ -32,6 +36,24 @@ class TestDeviceUtils:
         assert isinstance(moved_tensors, list)
         for tensor in moved_tensors:
             assert tensor.device == device
+    
+    def test_parse_cpu_list(self):
+        """Test CPU list parsing for affinity pinning"""
+        assert parse_cpu_list("0-3,8") == {0, 1, 2, 3, 8}
+        assert parse_cpu_list("") == set()
+    
+    def test_autotune_threads(self):
+        """Test that autotuning keeps the fastest candidate set"""
+        previous = torch.get_num_threads()
+        try:
+            calls = []
+            best = autotune_threads(lambda: calls.append(torch.get_num_threads()), candidates=[1], runs=2)
+            assert best == 1
+            assert torch.get_num_threads() == 1
+            assert calls == [1, 1, 1]
+        finally:
+            torch.set_num_threads(previous)
+        assert available_cpus() >= 1
 
 class TestImageUtils:
     """Test cases for image utilities"""
@@ -68,3 +90,186 @@ class TestImageUtils:
         for size in target_sizes:
             processed = preprocess_image(self.test_image, target_size=size)
             assert processed.size == size
+
+class TestImageDecoding:
+    """Test cases for header-only opening and reduced-resolution decoding"""
+    
+    def _encode(self, size, fmt):
+        import io
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (10, 200, 30)).save(buffer, format=fmt)
+        buffer.seek(0)
+        return buffer
+    
+    def test_open_image_reads_header_only(self):
+        """Test that size is available before pixel data is decoded"""
+        image = open_image(self._encode((4000, 3000), 'JPEG'))
+        assert image.size == (4000, 3000)
+        assert image.im is None
+    
+    def test_validate_before_decode(self):
+        """Test that oversized images are rejected from the header alone"""
+        image = open_image(self._encode((6000, 100), 'JPEG'))
+        assert validate_image(image) == False
+        assert image.im is None
+    
+    def test_decode_jpeg_uses_draft(self):
+        """Test that large JPEGs are decoded at a reduced scale no smaller than the target"""
+        image = decode_image(open_image(self._encode((4000, 3000), 'JPEG')), (448, 448))
+        assert image.mode == 'RGB'
+        assert image.size == (1000, 750)
+    
+    def test_decode_small_jpeg_keeps_size(self):
+        """Test that images already near the target are decoded at full size"""
+        image = decode_image(open_image(self._encode((300, 300), 'JPEG')), (224, 224))
+        assert image.size == (300, 300)
+    
+    def test_decode_png_full_resolution(self):
+        """Test that non-JPEG formats are decoded normally"""
+        image = decode_image(open_image(self._encode((800, 600), 'PNG')), (224, 224))
+        assert image.size == (800, 600)
+        assert image.mode == 'RGB'
+
+
+class TestImageEnhancement:
+    """Test cases for CLAHE enhancement"""
+    
+    def setup_method(self):
+        """Set up low-contrast test images"""
+        rng = np.random.default_rng(0)
+        self.arrays = [rng.integers(90, 140, (120, 160, 3), dtype=np.uint8) for _ in range(4)]
+    
+    def test_enhance_image_increases_contrast(self):
+        """Test that a low-contrast image gains contrast"""
+        enhanced = enhance_image(Image.fromarray(self.arrays[0]))
+        assert isinstance(enhanced, Image.Image)
+        assert np.array(enhanced).std() > self.arrays[0].std()
+    
+    def test_arrays_enhanced_in_place(self):
+        """Test that arrays are modified in place and match the single-image path"""
+        expected = [np.array(enhance_image(Image.fromarray(a))) for a in self.arrays]
+        arrays = [a.copy() for a in self.arrays]
+        result = enhance_images(arrays)
+        for array, enhanced, reference in zip(arrays, result, expected):
+            assert enhanced is array
+            assert np.array_equal(enhanced, reference)
+    
+    def test_parallel_matches_sequential(self):
+        """Test that the thread pool gives the same results as sequential processing"""
+        images = [Image.fromarray(a) for a in self.arrays]
+        parallel = enhance_images(images)
+        sequential = enhance_images(images, parallel=False)
+        assert all(np.array_equal(np.array(p), np.array(s)) for p, s in zip(parallel, sequential))
+
+
+class TestMetricsRegistry:
+    """Test cases for latency histograms and counters"""
+    
+    def test_percentiles(self):
+        """Test nearest-rank percentiles over recorded samples"""
+        metrics = MetricsRegistry()
+        for ms in range(1, 101):
+            metrics.observe('rice_stage_seconds', ms / 1000, stage='forward')
+        stats = metrics.percentiles('rice_stage_seconds', stage='forward')
+        assert stats['count'] == 100
+        assert stats['p50'] == pytest.approx(0.050)
+        assert stats['p95'] == pytest.approx(0.095)
+        assert stats['p99'] == pytest.approx(0.099)
+    
+    def test_stage_counts_errors(self):
+        """Test that a failing stage is timed and counted as an error"""
+        metrics = MetricsRegistry()
+        with pytest.raises(ValueError):
+            with metrics.stage('decode'):
+                raise ValueError("corrupt")
+        assert metrics.counter_value('rice_errors_total', stage='decode') == 1
+        assert metrics.percentiles('rice_stage_seconds', stage='decode')['count'] == 1
+    
+    def test_gate_escalation_rate(self):
+        """Test that the escalation rate is escalated images over gated images"""
+        metrics = MetricsRegistry()
+        assert metrics.escalation_rate() is None
+        metrics.record_gate(8, 2)
+        metrics.record_gate(2, 0)
+        assert metrics.escalation_rate() == pytest.approx(0.2)
+        assert 'rice_gate_escalations_total 2' in metrics.render()
+    
+    def test_prometheus_render(self):
+        """Test the Prometheus text format of counters and histograms"""
+        metrics = MetricsRegistry()
+        metrics.inc('rice_cache_requests_total', result='hit')
+        metrics.record_batch(3, 0.02)
+        text = metrics.render()
+        assert 'rice_cache_requests_total{result="hit"} 1' in text
+        assert '# TYPE rice_batch_size histogram' in text
+        assert 'rice_batch_size_bucket{le="2"} 0' in text
+        assert 'rice_batch_size_bucket{le="4"} 1' in text
+        assert 'rice_batch_size_bucket{le="+Inf"} 1' in text
+        assert 'rice_stage_seconds_quantile{stage="batch_forward",quantile="0.5"} 0.020000' in text
+
+
+class TestAssets:
+    """Test cases for the pre-built page image variants"""
+    
+    @pytest.fixture
+    def source_dir(self, tmp_path):
+        source = tmp_path / 'images'
+        source.mkdir()
+        rng = np.random.default_rng(0)
+        pixels = rng.integers(0, 255, (30, 40, 4), dtype=np.uint8)
+        Image.fromarray(pixels).resize((1200, 900)).save(source / 'wide banner.png')
+        Image.new('RGB', (500, 300), 'green').save(source / 'small.jpg')
+        return source
+    
+    def test_pick_width(self):
+        """Test that the narrowest variant covering the display width is chosen"""
+        assert pick_width([500, 800, 850], 800) == 800
+        assert pick_width([500, 800, 850], 820) == 850
+        assert pick_width([500], 800) == 500
+    
+    def test_build_assets(self, source_dir, tmp_path):
+        """Test that variants are resized, fingerprinted and listed in the manifest"""
+        out = tmp_path / 'build'
+        out.mkdir()
+        (out / 'stale.jpg').write_bytes(b'old')
+        manifest = build_assets(str(source_dir), str(out), widths=(800, 850))
+        assert set(manifest['wide banner.png']['variants']) == {'800', '850'}
+        assert set(manifest['small.jpg']['variants']) == {'500'}
+        variant = manifest['wide banner.png']['variants']['800']['webp']
+        assert variant['file'].startswith('wide-banner-800w.') and variant['file'].endswith('.webp')
+        with Image.open(out / variant['file']) as image:
+            assert image.size == (800, 600)
+        assert variant['bytes'] < manifest['wide banner.png']['bytes']
+        assert not (out / 'stale.jpg').exists()
+        assert (out / 'manifest.json').exists()
+    
+    def test_cache_serves_built_variant_from_memory(self, source_dir, tmp_path):
+        """Test that a built variant is read once, from the file the manifest names"""
+        manifest = build_assets(str(source_dir), str(tmp_path / 'build'), widths=(800,))
+        cache = AssetCache(str(source_dir), str(tmp_path / 'build'))
+        asset = cache.get('wide banner.png', 800)
+        assert asset.filename == manifest['wide banner.png']['variants']['800']['jpeg']['file']
+        assert asset.mimetype == 'image/jpeg'
+        (tmp_path / 'build' / asset.filename).unlink()
+        assert cache.get('wide banner.png', 800) is asset
+    
+    def test_cache_without_build_resizes_once(self, source_dir, tmp_path):
+        """Test that images missing from the build are resized in memory and reused"""
+        cache = AssetCache(str(source_dir), str(tmp_path / 'missing'))
+        asset = cache.get('wide banner.png', 850)
+        assert asset.filename is None and asset.width == 850
+        with Image.open(io.BytesIO(asset.data)) as image:
+            assert image.format == 'JPEG' and image.width == 850
+        assert cache.get('wide banner.png', 850) is asset
+        with pytest.raises(FileNotFoundError):
+            cache.get('absent.png', 800)
+    
+    def test_picture_html(self, source_dir, tmp_path):
+        """Test the <picture> tag for web-server-hosted variants"""
+        cache = AssetCache(str(source_dir), str(tmp_path / 'build'))
+        assert cache.picture_html('wide banner.png', 800, '/static/build') is None
+        build_assets(str(source_dir), str(tmp_path / 'build'), widths=(800,))
+        html = AssetCache(str(source_dir), str(tmp_path / 'build')).picture_html(
+            'wide banner.png', 800, '/static/build', alt='A "banner"')
+        assert '<source type="image/webp" srcset="/static/build/wide-banner-800w.' in html
+        assert 'alt="A &quot;banner&quot;"' in html